@@ -1,21 +1,26 @@
 """The Husqvarna Automower integration."""
 import logging
 import os
+import time
 from asyncio.exceptions import TimeoutError as AsyncioTimeoutError
+from collections.abc import Iterable
+from typing import Any, Optional
 
 import aioautomower
 from homeassistant.components.application_credentials import DATA_STORAGE
 from homeassistant.config_entries import ConfigEntry
 from homeassistant.const import CONF_TOKEN, Platform
-from homeassistant.core import HomeAssistant
+from homeassistant.core import CALLBACK_TYPE, HomeAssistant, callback
 from homeassistant.exceptions import ConfigEntryAuthFailed, ConfigEntryNotReady
 from homeassistant.helpers.config_entry_oauth2_flow import (
     async_get_config_entry_implementation,
 )
 from homeassistant.helpers.issue_registry import IssueSeverity, async_create_issue
+from homeassistant.helpers.storage import STORAGE_DIR
 from homeassistant.helpers.update_coordinator import DataUpdateCoordinator, UpdateFailed
 
 from .const import (
+    DEFAULT_POSITION_RETENTION,
     DOMAIN,
     PLATFORMS,
     STARTUP_MESSAGE,
@@ -26,10 +31,31 @@ from .const import (
     MAP_IMG_ROTATION,
     MAP_PATH_COLOR,
     HOME_LOCATION,
+    POSITION_RETENTION,
+    POSITIONS,
 )
+from .position_store import PositionStore
+from .zones import ZoneRegistry
 
 _LOGGER = logging.getLogger(__name__)
 
+_MISSING = object()
+
+
+def _attribute_value(attributes: dict, path: tuple[str, ...]) -> Any:
+    """Return the value at path of the mower attributes."""
+    value = attributes
+    for key in path:
+        if not isinstance(value, dict):
+            return _MISSING
+        value = value.get(key, _MISSING)
+    return value
+
+
+def _attribute_unchanged(value: Any, previous: Any) -> bool:
+    """Return True if an attribute is the same object or an equal one."""
+    return value is previous or value == previous
+
 
 class AutomowerDataUpdateCoordinator(DataUpdateCoordinator):
     """Class to manage fetching Husqvarna data."""
@@ -58,6 +84,28 @@ class AutomowerDataUpdateCoordinator(DataUpdateCoordinator):
             )
         low_energy = False
         self.session = aioautomower.AutomowerSession(api_key, access_token, low_energy)
+        # Timings and render counters of the image platform, in diagnostics
+        self.image_platform_stats = {
+            "setup_time": None,
+            "load_times": {},
+            "render_stats": {},
+        }
+        # Zone lookup counters of the sensor platform, in diagnostics
+        self.sensor_platform_stats = {"zone_stats": {}}
+        # Position history of every mower, kept on disk
+        self.position_stores: dict[str, PositionStore] = {}
+        self._opening_stores: set[str] = set()
+        # Appends run in the executor, one per store, keeping the latest waiting
+        self._appending_stores: set[PositionStore] = set()
+        self._pending_positions: dict[PositionStore, tuple[list, float]] = {}
+        self._entry = entry
+        # Zones parsed and compiled once, shared by all platforms
+        self.zone_registry = ZoneRegistry(entry)
+        # Entities listen to their own mower, with the attributes last notified
+        self._mower_listeners: dict[
+            str, list[tuple[CALLBACK_TYPE, Optional[tuple[tuple[str, ...], ...]]]]
+        ] = {}
+        self._mower_attributes: dict[str, dict] = {}
         self.session.register_token_callback(
             lambda token: hass.config_entries.async_update_entry(
                 entry,
@@ -78,6 +126,168 @@ class AutomowerDataUpdateCoordinator(DataUpdateCoordinator):
             # we need to login using username and password in the config flow again.
             raise ConfigEntryAuthFailed from Exception
 
+    @callback
+    def async_add_mower_listener(
+        self,
+        mower_id: str,
+        update_callback: CALLBACK_TYPE,
+        dependencies: Optional[Iterable[str]] = None,
+    ) -> CALLBACK_TYPE:
+        """Call update_callback when the data of a mower changed.
+
+        dependencies are the attribute paths the listener reads, like
+        "battery.batteryPercent". The listener is only called when one of
+        them changed, or on any change without dependencies.
+
+        Return a function removing the listener.
+        """
+        paths = None
+        if dependencies is not None:
+            paths = tuple(tuple(path.split(".")) for path in dependencies)
+        listener = (update_callback, paths)
+        listeners = self._mower_listeners.setdefault(mower_id, [])
+        listeners.append(listener)
+
+        @callback
+        def remove_listener() -> None:
+            listeners.remove(listener)
+
+        return remove_listener
+
+    @callback
+    def async_dispatch_mower_data(self, data: dict) -> None:
+        """Notify the listeners of the mower attributes that changed.
+
+        Every message comes with the data of all mowers. The API replaces
+        the attributes a message carries, so attributes still being the
+        same objects, or equal ones after a poll, are unchanged.
+        """
+        for mower in data["data"]:
+            mower_id = mower["id"]
+            attributes = mower["attributes"]
+            previous = self._mower_attributes.get(mower_id)
+            changed = None
+            if previous is not None:
+                changed = {
+                    key
+                    for key in attributes.keys() | previous.keys()
+                    if not _attribute_unchanged(
+                        attributes.get(key, _MISSING), previous.get(key, _MISSING)
+                    )
+                }
+                if not changed:
+                    continue
+            self._mower_attributes[mower_id] = dict(attributes)
+            for update_callback, paths in list(self._mower_listeners.get(mower_id, [])):
+                if (
+                    changed is None
+                    or paths is None
+                    or any(
+                        path[0] in changed
+                        and not _attribute_unchanged(
+                            _attribute_value(attributes, path),
+                            _attribute_value(previous, path),
+                        )
+                        for path in paths
+                    )
+                ):
+                    # A failing entity doesn't hold back the others
+                    try:
+                        update_callback()
+                    except Exception:  # pylint: disable=broad-except
+                        _LOGGER.exception(
+                            "Error updating a listener of mower %s", mower_id
+                        )
+
+    @callback
+    def async_store_positions(self, data: dict) -> None:
+        """Append the positions of every mower to its position store."""
+        for mower in data["data"]:
+            mower_id = mower["id"]
+            store = self.position_stores.get(mower_id)
+            if store is not None:
+                self._async_append_positions(
+                    mower_id, store, mower["attributes"][POSITIONS]
+                )
+            elif mower_id not in self._opening_stores:
+                self._opening_stores.add(mower_id)
+                self.hass.async_create_background_task(
+                    self._async_open_position_store(mower_id),
+                    f"{DOMAIN} open position store of {mower_id}",
+                )
+
+    async def _async_open_position_store(self, mower_id: str) -> None:
+        """Open the position store of a mower in the executor."""
+        retention = self._entry.options.get(mower_id, {}).get(
+            POSITION_RETENTION, DEFAULT_POSITION_RETENTION
+        )
+        path = self.hass.config.path(
+            STORAGE_DIR, f"{DOMAIN}_positions", f"{mower_id}.bin"
+        )
+        try:
+            store = await self.hass.async_add_executor_job(
+                PositionStore, path, retention
+            )
+        except OSError as error:
+            _LOGGER.error("Unable to open the position store %s: %s", path, error)
+            return
+        if mower_id not in self._opening_stores:
+            # The stores were closed meanwhile
+            await self.hass.async_add_executor_job(store.close)
+            return
+        self._opening_stores.discard(mower_id)
+        self.position_stores[mower_id] = store
+        # Positions are repeated by every message, the latest data has all of
+        # those received while the store was opening
+        for mower in self.session.data["data"]:
+            if mower["id"] == mower_id:
+                self._async_append_positions(
+                    mower_id, store, mower["attributes"][POSITIONS]
+                )
+
+    @callback
+    def _async_append_positions(
+        self, mower_id: str, store: PositionStore, positions: list
+    ) -> None:
+        """Append positions in the executor, keeping only the latest waiting.
+
+        Readers of the store hold its lock in the executor, appending there
+        keeps the event loop from waiting on them. Every message repeats the
+        positions sent before, so a newer one replaces a waiting one.
+        """
+        pending = (list(positions), time.time())
+        if store in self._appending_stores:
+            self._pending_positions[store] = pending
+            return
+        self._appending_stores.add(store)
+        self.hass.async_create_background_task(
+            self._async_append(store, pending),
+            f"{DOMAIN} store positions of {mower_id}",
+        )
+
+    async def _async_append(
+        self, store: PositionStore, pending: tuple[list, float]
+    ) -> None:
+        """Append positions to a store until none are waiting."""
+        try:
+            while pending is not None:
+                await self.hass.async_add_executor_job(store.append, *pending)
+                pending = self._pending_positions.pop(store, None)
+        finally:
+            self._appending_stores.discard(store)
+
+    async def async_close_position_stores(self) -> None:
+        """Write the position stores to disk and close them.
+
+        They are opened again, with the current retention, on the next update.
+        """
+        stores = list(self.position_stores.values())
+        self.position_stores.clear()
+        self._opening_stores.clear()
+        self._pending_positions.clear()
+        for store in stores:
+            await self.hass.async_add_executor_job(store.close)
+
 
 async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     """Set up this integration using UI."""
@@ -89,6 +299,12 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
         entry=entry,
     )
     await coordinator.async_config_entry_first_refresh()
+    coordinator.session.register_data_callback(
+        coordinator.async_store_positions, schedule_immediately=True
+    )
+    coordinator.session.register_data_callback(
+        coordinator.async_dispatch_mower_data, schedule_immediately=True
+    )
 
     hass.data.setdefault(DOMAIN, {})
     hass.data[DOMAIN][entry.entry_id] = coordinator
@@ -105,6 +321,9 @@ async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
         await coordinator.session.close()
     except Exception:
         pass
+    coordinator.session.unregister_data_callback(coordinator.async_store_positions)
+    coordinator.session.unregister_data_callback(coordinator.async_dispatch_mower_data)
+    await coordinator.async_close_position_stores()
     unload_ok = await hass.config_entries.async_unload_platforms(entry, PLATFORMS)
     if unload_ok:
         hass.data[DOMAIN].pop(entry.entry_id)
@@ -120,6 +339,11 @@ async def update_listener(
     hass: HomeAssistant, entry: ConfigEntry
 ) -> None:  # Todo: Add test
     """Handle options update."""
+    coordinator = hass.data[DOMAIN][entry.entry_id]
+    # Zone consumers are notified, only when the zones changed
+    coordinator.zone_registry.refresh()
+    # Reopen the position stores with the new retention
+    await coordinator.async_close_position_stores()
     unload_ok = await hass.config_entries.async_unload_platforms(
         entry, [Platform.IMAGE]
     )
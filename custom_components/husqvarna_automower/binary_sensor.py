@@ -40,6 +40,7 @@ class AutomowerBatteryChargingBinarySensor(BinarySensorEntity, AutomowerEntity):
     _attr_entity_registry_enabled_default = False
     _attr_device_class = BinarySensorDeviceClass.BATTERY_CHARGING
     _attr_translation_key = "battery_charging"
+    dependencies = ("mower.activity",)
 
     def __init__(self, session, idx):
         """Initialize AutomowerBatteryChargingBinarySensor."""
@@ -60,6 +61,7 @@ class AutomowerLeavingDockBinarySensor(BinarySensorEntity, AutomowerEntity):
 
     _attr_entity_registry_enabled_default = False
     _attr_translation_key = "leaving_dock"
+    dependencies = ("mower.activity",)
 
     def __init__(self, session, idx) -> None:
         """Initialize AutomowerLeavingDockBinarySensor."""
@@ -81,6 +83,7 @@ class AutomowerErrorBinarySensor(BinarySensorEntity, AutomowerEntity):
     _attr_entity_registry_enabled_default: bool = True
     _attr_device_class: BinarySensorDeviceClass = BinarySensorDeviceClass.PROBLEM
     _attr_translation_key = "error"
+    dependencies = ("mower.state", "mower.errorCode")
 
     def __init__(self, session, idx):
         """Initialize AutomowerErrorBinarySensor."""
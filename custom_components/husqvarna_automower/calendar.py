@@ -44,6 +44,7 @@ class AutomowerCalendar(CalendarEntity, AutomowerEntity):
         | CalendarEntityFeature.DELETE_EVENT
         | CalendarEntityFeature.UPDATE_EVENT
     )
+    dependencies = ("calendar", "metadata.connected")
 
     def __init__(self, session, idx) -> None:
         """Initialize AutomowerCalendar."""
@@ -15,30 +15,51 @@ import homeassistant.helpers.config_validation as cv
 from .const import (
     ADD_IMAGES,
     CONF_ZONES,
+    CURRENT_CONFIG_VER,
+    DEFAULT_MAP_BACKEND,
+    DEFAULT_MAP_FRAME_RATE,
+    DEFAULT_MAP_IMG_COMPRESSION,
+    DEFAULT_MAP_IMG_FORMAT,
+    DEFAULT_MAP_IMG_QUALITY,
+    DEFAULT_POSITION_RETENTION,
+    DEFAULT_ZONE_HYSTERESIS,
+    DEFAULT_ZONE_LOOKUP,
     DOMAIN,
     ENABLE_IMAGE,
     GPS_BOTTOM_RIGHT,
     GPS_TOP_LEFT,
     HOME_LOCATION,
+    MAP_BACKEND,
+    MAP_BACKENDS,
+    MAP_COVERAGE,
+    MAP_FRAME_RATE,
+    MAP_IMG_COMPRESSION,
+    MAP_IMG_FORMAT,
+    MAP_IMG_FORMATS,
     MAP_IMG_PATH,
+    MAP_IMG_QUALITY,
     MAP_IMG_ROTATION,
     MAP_PATH_COLOR,
     MOWER_IMG_PATH,
+    POSITION_RETENTION,
     SEL_IMAGE,
     ZONE_COLOR,
     ZONE_COORD,
     ZONE_DEL,
     ZONE_DISPLAY,
     ZONE_FINISH,
+    ZONE_HYSTERESIS,
+    ZONE_LOOKUP,
+    ZONE_LOOKUPS,
     ZONE_MOWERS,
     ZONE_NAME,
     ZONE_NEW,
     ZONE_SEL,
-    CURRENT_CONFIG_VER,
 )
 from .map_utils import (
     ValidatePointString,
     ValidateRGB,
+    validate_frame_rate,
     validate_image,
     validate_rotation,
 )
@@ -135,6 +156,7 @@ class OptionsFlowHandler(config_entries.OptionsFlow):
                 )
         self.options = self.config_entry.options.copy()
 
+        # Zones are edited as configured, invalid ones are kept until deleted
         self.configured_zones = json.loads(self.options.get(CONF_ZONES, "{}"))
         if not isinstance(self.configured_zones, dict):
             self.configured_zones = {}
@@ -169,6 +191,33 @@ class OptionsFlowHandler(config_entries.OptionsFlow):
             mower_configurations[mwr_id][HOME_LOCATION] = cfg_options.get(
                 HOME_LOCATION, ""
             )
+            mower_configurations[mwr_id][MAP_FRAME_RATE] = cfg_options.get(
+                MAP_FRAME_RATE, DEFAULT_MAP_FRAME_RATE
+            )
+            mower_configurations[mwr_id][MAP_BACKEND] = cfg_options.get(
+                MAP_BACKEND, DEFAULT_MAP_BACKEND
+            )
+            mower_configurations[mwr_id][MAP_IMG_FORMAT] = cfg_options.get(
+                MAP_IMG_FORMAT, DEFAULT_MAP_IMG_FORMAT
+            )
+            mower_configurations[mwr_id][MAP_IMG_QUALITY] = cfg_options.get(
+                MAP_IMG_QUALITY, DEFAULT_MAP_IMG_QUALITY
+            )
+            mower_configurations[mwr_id][MAP_IMG_COMPRESSION] = cfg_options.get(
+                MAP_IMG_COMPRESSION, DEFAULT_MAP_IMG_COMPRESSION
+            )
+            mower_configurations[mwr_id][MAP_COVERAGE] = cfg_options.get(
+                MAP_COVERAGE, False
+            )
+            mower_configurations[mwr_id][POSITION_RETENTION] = cfg_options.get(
+                POSITION_RETENTION, DEFAULT_POSITION_RETENTION
+            )
+            mower_configurations[mwr_id][ZONE_LOOKUP] = cfg_options.get(
+                ZONE_LOOKUP, DEFAULT_ZONE_LOOKUP
+            )
+            mower_configurations[mwr_id][ZONE_HYSTERESIS] = cfg_options.get(
+                ZONE_HYSTERESIS, DEFAULT_ZONE_HYSTERESIS
+            )
             mower_configurations[mwr_id][ADD_IMAGES] = cfg_options.get(ADD_IMAGES, [])
 
             self.options.update(mower_configurations)
@@ -429,6 +478,37 @@ class OptionsFlowHandler(config_entries.OptionsFlow):
             else:
                 errors[MAP_IMG_ROTATION] = "rotation_error"
 
+            frame_rate = user_input.get(MAP_FRAME_RATE, DEFAULT_MAP_FRAME_RATE)
+            if validate_frame_rate(frame_rate):
+                self.options[self.sel_mower_id][MAP_FRAME_RATE] = float(frame_rate)
+            else:
+                errors[MAP_FRAME_RATE] = "frame_rate_error"
+
+            self.options[self.sel_mower_id][MAP_BACKEND] = user_input.get(
+                MAP_BACKEND, DEFAULT_MAP_BACKEND
+            )
+            self.options[self.sel_mower_id][MAP_IMG_FORMAT] = user_input.get(
+                MAP_IMG_FORMAT, DEFAULT_MAP_IMG_FORMAT
+            )
+            self.options[self.sel_mower_id][MAP_IMG_QUALITY] = user_input.get(
+                MAP_IMG_QUALITY, DEFAULT_MAP_IMG_QUALITY
+            )
+            self.options[self.sel_mower_id][MAP_IMG_COMPRESSION] = user_input.get(
+                MAP_IMG_COMPRESSION, DEFAULT_MAP_IMG_COMPRESSION
+            )
+            self.options[self.sel_mower_id][MAP_COVERAGE] = user_input.get(
+                MAP_COVERAGE, False
+            )
+            self.options[self.sel_mower_id][POSITION_RETENTION] = user_input.get(
+                POSITION_RETENTION, DEFAULT_POSITION_RETENTION
+            )
+            self.options[self.sel_mower_id][ZONE_LOOKUP] = user_input.get(
+                ZONE_LOOKUP, DEFAULT_ZONE_LOOKUP
+            )
+            self.options[self.sel_mower_id][ZONE_HYSTERESIS] = user_input.get(
+                ZONE_HYSTERESIS, DEFAULT_ZONE_HYSTERESIS
+            )
+
             if user_input.get(HOME_LOCATION):
                 pnt_validator = ValidatePointString(user_input.get(HOME_LOCATION))
                 pnt_valid, pnt_error = pnt_validator.is_valid()
@@ -493,6 +573,56 @@ class OptionsFlowHandler(config_entries.OptionsFlow):
                 default=self.options[self.sel_mower_id].get(MAP_IMG_PATH),
             ): str,
             vol.Required(MAP_PATH_COLOR, default=path_color_str): str,
+            vol.Required(
+                MAP_FRAME_RATE,
+                default=self.options[self.sel_mower_id].get(MAP_FRAME_RATE),
+            ): vol.Coerce(float),
+            vol.Required(
+                MAP_BACKEND,
+                default=self.options[self.sel_mower_id].get(
+                    MAP_BACKEND, DEFAULT_MAP_BACKEND
+                ),
+            ): vol.In(MAP_BACKENDS),
+            vol.Required(
+                MAP_IMG_FORMAT,
+                default=self.options[self.sel_mower_id].get(
+                    MAP_IMG_FORMAT, DEFAULT_MAP_IMG_FORMAT
+                ),
+            ): vol.In(MAP_IMG_FORMATS),
+            vol.Required(
+                MAP_IMG_QUALITY,
+                default=self.options[self.sel_mower_id].get(
+                    MAP_IMG_QUALITY, DEFAULT_MAP_IMG_QUALITY
+                ),
+            ): vol.All(vol.Coerce(int), vol.Range(min=1, max=100)),
+            vol.Required(
+                MAP_IMG_COMPRESSION,
+                default=self.options[self.sel_mower_id].get(
+                    MAP_IMG_COMPRESSION, DEFAULT_MAP_IMG_COMPRESSION
+                ),
+            ): vol.All(vol.Coerce(int), vol.Range(min=0, max=9)),
+            vol.Required(
+                MAP_COVERAGE,
+                default=self.options[self.sel_mower_id].get(MAP_COVERAGE, False),
+            ): bool,
+            vol.Required(
+                POSITION_RETENTION,
+                default=self.options[self.sel_mower_id].get(
+                    POSITION_RETENTION, DEFAULT_POSITION_RETENTION
+                ),
+            ): vol.All(vol.Coerce(int), vol.Range(min=1000)),
+            vol.Required(
+                ZONE_LOOKUP,
+                default=self.options[self.sel_mower_id].get(
+                    ZONE_LOOKUP, DEFAULT_ZONE_LOOKUP
+                ),
+            ): vol.In(ZONE_LOOKUPS),
+            vol.Required(
+                ZONE_HYSTERESIS,
+                default=self.options[self.sel_mower_id].get(
+                    ZONE_HYSTERESIS, DEFAULT_ZONE_HYSTERESIS
+                ),
+            ): vol.All(vol.Coerce(int), vol.Range(min=1, max=100)),
             vol.Optional(HOME_LOCATION, default=home_location): str,
             vol.Optional(
                 ADD_IMAGES,
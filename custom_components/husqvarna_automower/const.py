@@ -42,6 +42,22 @@ MOWER_IMG_PATH = "mower_img_path"
 MAP_IMG_PATH = "map_img_path"
 MAP_IMG_ROTATION = "map_img_rotation"
 MAP_PATH_COLOR = "map_path_color"
+MAP_FRAME_RATE = "map_max_frame_rate"
+MAP_BACKEND = "map_backend"
+MAP_BACKEND_FULL = "full"
+MAP_BACKEND_TILED = "tiled"
+MAP_BACKENDS = [MAP_BACKEND_FULL, MAP_BACKEND_TILED]
+MAP_IMG_FORMAT = "map_image_format"
+MAP_IMG_FORMATS = ["png", "jpeg", "webp"]
+MAP_IMG_QUALITY = "map_image_quality"
+MAP_IMG_COMPRESSION = "map_image_compression"
+POSITION_RETENTION = "position_retention"
+MAP_COVERAGE = "map_coverage"
+ZONE_LOOKUP = "zone_lookup"
+ZONE_LOOKUP_POLYGON = "polygon"
+ZONE_LOOKUP_RASTER = "raster"
+ZONE_LOOKUPS = [ZONE_LOOKUP_POLYGON, ZONE_LOOKUP_RASTER]
+ZONE_HYSTERESIS = "zone_hysteresis"
 ADD_IMAGES = "additional_mowers"
 
 
@@ -58,9 +74,21 @@ ZONE_ID = "zone_id"
 ZONE_FINISH = "save"
 ZONE_MOWERS = "sel_mowers"
 
+# Events
+EVENT_ZONE_ENTERED = f"{DOMAIN}_zone_entered"
+EVENT_ZONE_LEFT = f"{DOMAIN}_zone_left"
+
 
 # Defaults
 DEFAULT_NAME = DOMAIN
+DEFAULT_MAP_FRAME_RATE = 1.0  # Frames per second
+DEFAULT_MAP_BACKEND = MAP_BACKEND_FULL
+DEFAULT_MAP_IMG_FORMAT = "png"
+DEFAULT_MAP_IMG_QUALITY = 80
+DEFAULT_MAP_IMG_COMPRESSION = 6
+DEFAULT_POSITION_RETENTION = 100000  # Positions, 24 bytes each on disk
+DEFAULT_ZONE_LOOKUP = ZONE_LOOKUP_POLYGON
+DEFAULT_ZONE_HYSTERESIS = 2  # Consecutive positions
 
 
 STARTUP_MESSAGE = f"""
@@ -38,6 +38,7 @@ class AutomowerTracker(TrackerEntity, AutomowerEntity):
     """Defining the Device Tracker Entity."""
 
     _attr_name: str | None = None
+    dependencies = ("positions",)
 
     def __init__(self, session, idx):
         """Initialize AutomowerDeviceTracker."""
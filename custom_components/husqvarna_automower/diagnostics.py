@@ -1,6 +1,7 @@
 """Diagnostics support for Husqvarna Automower."""
 from __future__ import annotations
 
+import numpy as np
 from homeassistant.components.diagnostics import async_redact_data
 from homeassistant.config_entries import ConfigEntry
 from homeassistant.const import CONF_ACCESS_TOKEN
@@ -15,6 +16,7 @@ from .const import (
     HOME_LOCATION,
     POSITIONS,
 )
+from .zones import ZoneIndex, zone_statistics
 
 TO_REDACT = {
     CONF_ACCESS_TOKEN,
@@ -37,6 +39,28 @@ async def async_get_config_entry_diagnostics(
         "data_of_all_mowers": async_redact_data(
             coordinator.session.data["data"], TO_REDACT
         ),
+        "image_platform": coordinator.image_platform_stats,
+        "sensor_platform": coordinator.sensor_platform_stats,
+        "zone_statistics": {},
     }
 
+    for mower_id, store in list(coordinator.position_stores.items()):
+        history = await hass.async_add_executor_job(store.to_array)
+        diag_data["zone_statistics"][mower_id] = await hass.async_add_executor_job(
+            _history_zone_statistics,
+            coordinator.zone_registry.index_for(mower_id),
+            history,
+        )
+
     return diag_data
+
+
+def _history_zone_statistics(zone_index: ZoneIndex, history: np.ndarray) -> dict:
+    """Return the statistics per zone of a stored position history."""
+    lat_lon = np.column_stack((history["latitude"], history["longitude"]))
+    return zone_statistics(
+        zone_index.zone_ids,
+        zone_index.find_many(lat_lon),
+        lat_lon,
+        history["recorded"],
+    )
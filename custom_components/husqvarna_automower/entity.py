@@ -2,7 +2,9 @@
 
 import logging
 from datetime import datetime
+from typing import Optional
 
+from homeassistant.core import callback
 from homeassistant.helpers.entity import DeviceInfo
 from homeassistant.helpers.update_coordinator import CoordinatorEntity
 from homeassistant.util import dt as dt_util
@@ -17,6 +19,9 @@ class AutomowerEntity(CoordinatorEntity[AutomowerDataUpdateCoordinator]):
     """Defining the Automower Basic Entity."""
 
     _attr_has_entity_name = True
+    # Mower attribute paths the state is made of, like "battery.batteryPercent".
+    # The state is written when one of them changed, on any change if None.
+    dependencies: Optional[tuple[str, ...]] = None
 
     def __init__(self, coordinator, idx) -> None:
         """Initialize AutomowerEntity."""
@@ -46,16 +51,17 @@ class AutomowerEntity(CoordinatorEntity[AutomowerDataUpdateCoordinator]):
     async def async_added_to_hass(self) -> None:
         """Call when entity about to be added to Home Assistant."""
         await super().async_added_to_hass()
-        self.coordinator.session.register_data_callback(
-            lambda _: self.async_write_ha_state(), schedule_immediately=True
+        # Only messages changing this mower write the state
+        self.async_on_remove(
+            self.coordinator.async_add_mower_listener(
+                self.mower_id, self._handle_mower_update, self.dependencies
+            )
         )
 
-    async def async_will_remove_from_hass(self) -> None:
-        """Call when entity is being removed from Home Assistant."""
-        await super().async_will_remove_from_hass()
-        self.coordinator.session.unregister_data_callback(
-            lambda _: self.async_write_ha_state()
-        )
+    @callback
+    def _handle_mower_update(self) -> None:
+        """Handle changed data of the mower."""
+        self.async_write_ha_state()
 
     @property
     def device_info(self) -> DeviceInfo:
@@ -1,39 +1,64 @@
 """Platform for Husqvarna Automower map image integration."""
 
-import io
+import hashlib
 import json
 import logging
 import math
+import os
+import time
 from datetime import datetime
 from typing import Optional
 
 import numpy as np
-from geopy.distance import distance, geodesic
+import voluptuous as vol
 from homeassistant.components.image import ImageEntity
 from homeassistant.config_entries import ConfigEntry
-from homeassistant.core import HomeAssistant
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.exceptions import HomeAssistantError
+from homeassistant.helpers import config_validation as cv
+from homeassistant.helpers import entity_platform
 from homeassistant.helpers.entity import EntityCategory
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
+from homeassistant.helpers.event import async_call_later
+from homeassistant.helpers.storage import STORAGE_DIR
+from homeassistant.util import dt as dt_util
 from PIL import Image, ImageDraw
 
 from .const import (
     ADD_IMAGES,
-    CONF_ZONES,
+    DEFAULT_MAP_BACKEND,
+    DEFAULT_MAP_FRAME_RATE,
+    DEFAULT_MAP_IMG_COMPRESSION,
+    DEFAULT_MAP_IMG_FORMAT,
+    DEFAULT_MAP_IMG_QUALITY,
     DOMAIN,
     ENABLE_IMAGE,
     GPS_BOTTOM_RIGHT,
     GPS_TOP_LEFT,
     HOME_LOCATION,
+    MAP_BACKEND,
+    MAP_BACKEND_TILED,
+    MAP_COVERAGE,
+    MAP_FRAME_RATE,
+    MAP_IMG_COMPRESSION,
+    MAP_IMG_FORMAT,
     MAP_IMG_PATH,
+    MAP_IMG_QUALITY,
     MAP_IMG_ROTATION,
     MAP_PATH_COLOR,
     MOWER_IMG_PATH,
     ZONE_COLOR,
     ZONE_COORD,
     ZONE_DISPLAY,
-    ZONE_MOWERS,
 )
 from .entity import AutomowerEntity
+from .map_coverage import CoverageLayer
+from .map_encoders import MapEncoder, get_encoder
+from .map_layers import BASE_LAYER_CACHE, DirtyRectCompositor, PathLayer
+from .map_tiles import build_tile_pyramid
+from .map_timelapse import TIMELAPSE_FORMATS, TIMELAPSE_WRITERS, TimelapseRenderer
+from .map_utils import MapProjection
+from .zones import ZoneMask
 
 GpsPoint = tuple[float, float]
 ImgPoint = tuple[int, int]
@@ -46,13 +71,68 @@ async def async_setup_entry(
     hass: HomeAssistant, entry: ConfigEntry, async_add_entities: AddEntitiesCallback
 ) -> None:
     """Set up select platform."""
+    start = time.perf_counter()
     coordinator = hass.data[DOMAIN][entry.entry_id]
     entity_list = []
+    shared_maps = {}
     for idx, ent in enumerate(coordinator.session.data["data"]):
-        if entry.options.get(ent["id"], {}).get(ENABLE_IMAGE):
-            entity_list.append(AutomowerImage(coordinator, idx, entry, hass))
+        options = entry.options.get(ent["id"], {})
+        if options.get(ENABLE_IMAGE):
+            map_key = json.dumps(
+                [
+                    options.get(MAP_IMG_PATH),
+                    options.get(GPS_TOP_LEFT),
+                    options.get(GPS_BOTTOM_RIGHT),
+                    options.get(MAP_IMG_ROTATION, 0),
+                ]
+            )
+            shared_maps.setdefault(map_key, []).append(idx)
+
+    for fleet_idx in shared_maps.values():
+        # Mowers sharing a map are drawn together by the fleet image only,
+        # their own images draw just the mower itself
+        fleet = len(fleet_idx) > 1
+        for idx in fleet_idx:
+            entity_list.append(
+                AutomowerImage(
+                    coordinator, idx, entry, hass, draw_additional_mowers=not fleet
+                )
+            )
+        if fleet:
+            entity_list.append(
+                AutomowerFleetImage(coordinator, fleet_idx[0], entry, hass, fleet_idx)
+            )
 
     async_add_entities(entity_list)
+    coordinator.image_platform_stats["setup_time"] = time.perf_counter() - start
+
+    platform = entity_platform.current_platform.get()
+
+    platform.async_register_entity_service(
+        "export_timelapse",
+        {
+            vol.Required("filename"): cv.string,
+            vol.Optional("image_format", default="gif"): vol.In(TIMELAPSE_FORMATS),
+            vol.Optional("positions_per_frame", default=1): vol.All(
+                vol.Coerce(int), vol.Range(min=1)
+            ),
+            vol.Optional("frame_duration", default=100): vol.All(
+                vol.Coerce(int), vol.Range(min=10, max=65535)
+            ),
+            vol.Optional("start"): cv.datetime,
+            vol.Optional("end"): cv.datetime,
+        },
+        "async_export_timelapse",
+    )
+
+
+def _timestamp(value: Optional[datetime]) -> Optional[float]:
+    """Return the Unix time of a service datetime, naive ones are local."""
+    if value is None:
+        return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=dt_util.DEFAULT_TIME_ZONE)
+    return value.timestamp()
 
 
 class AutomowerImage(ImageEntity, AutomowerEntity):
@@ -60,10 +140,26 @@ class AutomowerImage(ImageEntity, AutomowerEntity):
 
     _attr_entity_category = EntityCategory.DIAGNOSTIC
     _attr_translation_key = "mower_img"
+    # The coverage of a mower is counted by its own map only
+    _draw_coverage = True
+    # The state is written once a new frame is rendered
+    dependencies = ()
+
+    def __init__(
+        self,
+        coordinator,
+        idx,
+        entry,
+        hass: HomeAssistant,
+        draw_additional_mowers: bool = True,
+    ) -> None:
+        """Initialize AutomowerImage.
 
-    def __init__(self, coordinator, idx, entry, hass: HomeAssistant) -> None:
-        """Initialize AutomowerImage."""
+        Without draw_additional_mowers the additional mowers of the options
+        aren't drawn, they are on a fleet image already.
+        """
         ImageEntity.__init__(self, hass)
+        self.hass = hass
         AutomowerEntity.__init__(self, coordinator, idx)
 
         self.entry = entry
@@ -74,33 +170,57 @@ class AutomowerImage(ImageEntity, AutomowerEntity):
         self.home_location = self.options.get(HOME_LOCATION, None)
         self._image = Image.new(mode="RGB", size=(200, 200))
         self._map_image = None
+        self._tile_pyramid = None
         self._overlay_image = None
         self._path_color = self.options.get(MAP_PATH_COLOR, [255, 0, 0])
         self._px_meter = 1
         self._c_img_wgs84 = (0, 0)
         self._c_img_px = (0, 0)
+        self._projection = None
+        self._path_layers = {}
+        self._compositor = None
+        self._coverage_layer = None
+        self._frame_version = 0
+        self._image_bytes = None
+        self._image_bytes_version = None
+        self._load_task = None
+        self._render_task = None
+        self._render_pending = False
+        self._render_unsub = None
+        self._last_render = None
+        self._render_interval = 1 / self.options.get(
+            MAP_FRAME_RATE, DEFAULT_MAP_FRAME_RATE
+        )
+        self._encoder = get_encoder(
+            self.options.get(MAP_IMG_FORMAT, DEFAULT_MAP_IMG_FORMAT),
+            self.options.get(MAP_IMG_QUALITY, DEFAULT_MAP_IMG_QUALITY),
+            self.options.get(MAP_IMG_COMPRESSION, DEFAULT_MAP_IMG_COMPRESSION),
+        )
+        self._attr_content_type = self._encoder.content_type
+        self.render_stats = {
+            "encode_cache_hits": 0,
+            "encode_cache_misses": 0,
+            "encode_time": 0.0,
+            "encoded_bytes": 0,
+            "renders": 0,
+            "renders_dropped": 0,
+            "loop_time_saved": 0.0,
+        }
         self._mwr_id_to_idx = {}
 
         # pylint: disable=unused-variable
         for idx, ent in enumerate(coordinator.session.data["data"]):
             self._mwr_id_to_idx[coordinator.session.data["data"][idx]["id"]] = idx
 
-        self._additional_images = self.options.get(ADD_IMAGES, [])
+        self._additional_images = (
+            self.options.get(ADD_IMAGES, []) if draw_additional_mowers else []
+        )
+        self._additional_entities = None
 
         if self.options.get(ENABLE_IMAGE, False):
             self._top_left_coord = self.options.get(GPS_TOP_LEFT)
             self._bottom_right_coord = self.options.get(GPS_BOTTOM_RIGHT)
             self._map_rotation = self.options.get(MAP_IMG_ROTATION, 0)
-            self._load_map_image()
-            self._find_image_scale()
-            self._load_mower_image()
-            self._overlay_zones()
-
-            # pylint: disable=unnecessary-lambda
-            self.coordinator.session.register_data_callback(
-                lambda data: self._generate_image(data),
-                schedule_immediately=True,
-            )
         else:
             self._attr_entity_registry_enabled_default = True
             r_earth = 6378000  # meters
@@ -121,14 +241,262 @@ class AutomowerImage(ImageEntity, AutomowerEntity):
             self._bottom_right_coord = (bottom_right_lat, bottom_right_lon)
             self._map_rotation = 0
 
+    async def async_added_to_hass(self) -> None:
+        """Call when entity about to be added to Home Assistant."""
+        await super().async_added_to_hass()
+        # Reported in diagnostics while the entity exists
+        render_stats = self.coordinator.image_platform_stats["render_stats"]
+        render_stats[self.unique_id] = self.render_stats
+        self.async_on_remove(lambda: render_stats.pop(self.unique_id, None))
+        if self.options.get(ENABLE_IMAGE, False):
+            # Loading doesn't hold up startup, the placeholder is shown meanwhile
+            self._load_task = self.hass.async_create_background_task(
+                self._async_load_images(), f"{DOMAIN} load map of {self.mower_id}"
+            )
+
+    async def async_will_remove_from_hass(self) -> None:
+        """Call when entity is being removed from Home Assistant."""
+        await super().async_will_remove_from_hass()
+        if self._load_task is not None:
+            self._load_task.cancel()
+        self.coordinator.session.unregister_data_callback(self._async_request_render)
+        if self._render_task is not None:
+            self._render_task.cancel()
+        if self._render_unsub is not None:
+            self._render_unsub()
+            self._render_unsub = None
+
     async def async_image(self) -> bytes | None:
         """Return bytes of image."""
         return await self._image_to_bytes()
 
+    async def _async_load_images(self) -> None:
+        """Load the map and mower images in the executor, then start rendering."""
+        start = time.perf_counter()
+        try:
+            await self.hass.async_add_executor_job(self._load_images)
+        except OSError as error:
+            _LOGGER.error("Unable to load the map of %s: %s", self.mower_name, error)
+            return
+        finally:
+            self._load_task = None
+        self.coordinator.image_platform_stats["load_times"][self.unique_id] = (
+            time.perf_counter() - start
+        )
+
+        self.coordinator.session.register_data_callback(
+            self._async_request_render,
+            schedule_immediately=True,
+        )
+
+    async def async_export_timelapse(
+        self,
+        filename: str,
+        image_format: str = "gif",
+        positions_per_frame: int = 1,
+        frame_duration: int = 100,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        **kwargs,
+    ) -> None:
+        """Export the position history of the mower as an animated image.
+
+        start and end limit the export to the positions received in between,
+        like a single day or mowing session.
+        """
+        if not self.hass.config.is_allowed_path(filename):
+            raise HomeAssistantError(f"Writing to {filename} is not allowed")
+        if self._projection is None or self._overlay_image is None:
+            raise HomeAssistantError(f"The map of {self.mower_name} is not loaded")
+        store = self.coordinator.position_stores.get(self.mower_id)
+        if start is not None or end is not None:
+            # Only stored positions know when they were received
+            if store is None:
+                raise HomeAssistantError(
+                    f"{self.mower_name} has no stored positions to select from"
+                )
+            position_history = await self.hass.async_add_executor_job(
+                store.positions, _timestamp(start), _timestamp(end)
+            )
+        else:
+            position_history = list(
+                AutomowerEntity.get_mower_attributes(self)["positions"]
+            )
+            # The position store reaches further back than the API
+            if store is not None and len(store) > len(position_history):
+                position_history = await self.hass.async_add_executor_job(
+                    store.positions
+                )
+        if not position_history:
+            raise HomeAssistantError(f"{self.mower_name} has no positions to export")
+
+        await self.hass.async_add_executor_job(
+            self._export_timelapse,
+            filename,
+            image_format,
+            position_history,
+            positions_per_frame,
+            frame_duration,
+        )
+
+    def _export_timelapse(
+        self,
+        filename: str,
+        image_format: str,
+        position_history: list,
+        positions_per_frame: int,
+        frame_duration: int,
+    ) -> None:
+        """Render and write the timelapse frame by frame, runs in the executor."""
+        if self._tile_pyramid is None:
+            base_layer, projection = self._map_image, self._projection
+        else:
+            # The whole map, at the most detailed level that fits the viewport
+            level, box = self._tile_pyramid.viewport((0, 0) + self._tile_pyramid.size)
+            base_layer = self._tile_pyramid.read_region(level, box)
+            projection = self._projection.scaled(1 / 2**level, box[:2])
+            self._overlay_zones(base_layer, projection)
+
+        renderer = TimelapseRenderer(
+            base_layer,
+            projection,
+            position_history,
+            self._path_color,
+            self._overlay_image,
+            positions_per_frame,
+        )
+        part_filename = f"{filename}.part"
+        try:
+            with open(part_filename, "wb") as timelapse_file:
+                TIMELAPSE_WRITERS[image_format](
+                    timelapse_file, renderer, frame_duration
+                )
+            os.replace(part_filename, filename)
+        finally:
+            if os.path.exists(part_filename):
+                os.remove(part_filename)
+
+    def _load_images(self) -> None:
+        """Load the map and mower images, runs in the executor."""
+        if self.options.get(MAP_BACKEND, DEFAULT_MAP_BACKEND) == MAP_BACKEND_TILED:
+            self._load_tile_pyramid()
+        else:
+            self._load_map_image()
+        self._find_image_scale()
+        if self._draw_coverage and self.options.get(MAP_COVERAGE, False):
+            self._load_coverage_layer()
+        self._load_mower_image()
+
+    @callback
+    def _async_request_render(self, _data: dict) -> None:
+        """Request a render, keeping only the latest while one is waiting."""
+        if self._render_pending or self._render_unsub is not None:
+            self.render_stats["renders_dropped"] += 1
+            return
+        if self._render_task is not None and not self._render_task.done():
+            self._render_pending = True
+            return
+
+        if self._last_render is not None:
+            delay = self._last_render + self._render_interval - time.monotonic()
+            if delay > 0:
+                # Trailing edge, render once the frame rate allows it
+                self._render_unsub = async_call_later(
+                    self.hass, delay, self._async_flush_render
+                )
+                return
+
+        self._async_start_render()
+
+    @callback
+    def _async_flush_render(self, _now: datetime) -> None:
+        """Start the render held back by the frame rate cap."""
+        self._render_unsub = None
+        if self._render_task is not None and not self._render_task.done():
+            self._render_pending = True
+            return
+        self._async_start_render()
+
+    @callback
+    def _async_start_render(self) -> None:
+        """Start rendering a frame."""
+        self._last_render = time.monotonic()
+        self._render_task = self.hass.async_create_task(self._async_render())
+
+    async def _async_render(self) -> None:
+        """Render a frame in the executor."""
+        try:
+            render_time = await self.hass.async_add_executor_job(
+                self._timed_generate_image
+            )
+        except Exception:  # pylint: disable=broad-except
+            _LOGGER.exception("Error rendering the map of %s", self.mower_id)
+        else:
+            self.render_stats["renders"] += 1
+            self.render_stats["loop_time_saved"] += render_time
+            if self.platform is not None:
+                self.async_write_ha_state()
+        finally:
+            # A failed frame doesn't hold back the next one
+            self._render_task = None
+            if self._render_pending:
+                self._render_pending = False
+                self._async_request_render({})
+
+    def _timed_generate_image(self) -> float:
+        """Generate the image and return the time it took, runs in the executor."""
+        start = time.perf_counter()
+        self._generate_image({})
+        return time.perf_counter() - start
+
     def _load_map_image(self):
-        """Load the map image."""
+        """Load the map image, shared with entities drawing the same map."""
+        map_image_path = self.options.get(MAP_IMG_PATH)
+        cache_key = (
+            map_image_path,
+            os.path.getmtime(map_image_path),
+            json.dumps(self._displayed_zones()),
+            self._map_rotation,
+            tuple(self._top_left_coord),
+            tuple(self._bottom_right_coord),
+        )
+        self._map_image = BASE_LAYER_CACHE.get(cache_key, self._build_map_image)
+
+    def _build_map_image(self) -> Image.Image:
+        """Decode the map image and draw the zones on it."""
         map_image_path = self.options.get(MAP_IMG_PATH)
         self._map_image = Image.open(map_image_path, "r").convert("RGBA")
+        self._find_image_scale()
+        self._overlay_zones(self._map_image, self._projection)
+        return self._map_image
+
+    def _load_tile_pyramid(self):
+        """Load the tile pyramid of the map image, built on first use."""
+        map_image_path = self.options.get(MAP_IMG_PATH)
+        path_hash = hashlib.sha1(
+            os.path.abspath(map_image_path).encode(), usedforsecurity=False
+        ).hexdigest()
+        pyramid_dir = self.hass.config.path(
+            STORAGE_DIR,
+            f"{DOMAIN}_tiles",
+            path_hash,
+            str(os.stat(map_image_path).st_mtime_ns),
+        )
+        self._tile_pyramid = BASE_LAYER_CACHE.get(
+            pyramid_dir, lambda: build_tile_pyramid(map_image_path, pyramid_dir)
+        )
+
+    def _load_coverage_layer(self):
+        """Load the coverage counts of the mower, created on first use."""
+        if self._tile_pyramid is not None:
+            size = self._tile_pyramid.size
+        else:
+            size = self._map_image.size
+        self._coverage_layer = CoverageLayer(
+            size,
+            self._projection,
+            self.hass.config.path(STORAGE_DIR, f"{DOMAIN}_coverage", self.mower_id),
+        )
 
     def _load_mower_image(self):
         """Load the mower overlay image."""
@@ -141,82 +509,99 @@ class AutomowerImage(ImageEntity, AutomowerEntity):
             (mower_img_w, hsize), Image.Resampling.LANCZOS
         )
 
-    def _overlay_zones(self) -> None:
-        """Draw zone overlays."""
-        zones = json.loads(self.entry.options.get(CONF_ZONES, "{}"))
+    def _displayed_zones(self) -> list[dict]:
+        """Return the zones to draw on the map of this mower."""
+        zones = self.coordinator.zone_registry.zones_for(self.mower_id)
+        return [zone for zone in zones.values() if zone.get(ZONE_DISPLAY, False)]
 
-        if not isinstance(zones, dict):
+    def _overlay_zones(self, map_image: Image.Image, projection: MapProjection) -> None:
+        """Draw zone overlays."""
+        zones = self._displayed_zones()
+        if not zones:
             return
-
-        # pylint: disable=unused-variable
-        for zone_id, zone in zones.items():
-            if self.mower_id in zone.get(ZONE_MOWERS, []) and zone.get(
-                ZONE_DISPLAY, False
-            ):
-                zone_poly = [
-                    self._scale_to_img(
-                        point, (self._map_image.size[0], self._map_image.size[1])
-                    )
-                    for point in zone.get(ZONE_COORD)
-                ]
-
-                if len(zone_poly) < 3:
-                    return
-
-                poly_img = Image.new(
-                    "RGBA", (self._map_image.size[0], self._map_image.size[1])
-                )
-                pdraw = ImageDraw.Draw(poly_img)
-
-                zone_color = zone.get(ZONE_COLOR, [255, 255, 255])
-
-                pdraw.polygon(
-                    zone_poly,
-                    fill=tuple(zone_color + [25]),
-                    outline=tuple(zone_color + [255]),
+        zone_mask = ZoneMask(
+            {str(idx): zone for idx, zone in enumerate(zones)},
+            projection,
+            map_image.size,
+        )
+        zone_colors = [zone.get(ZONE_COLOR, [255, 255, 255]) for zone in zones]
+
+        # One translucent fill for all zones, looked up from the label mask
+        fill_colors = np.zeros((len(zones) + 1, 4), dtype=np.uint8)
+        fill_colors[1:] = [list(color) + [25] for color in zone_colors]
+        fill = Image.fromarray(fill_colors[zone_mask.mask], "RGBA")
+        map_image.paste(fill, mask=fill)
+
+        outline_draw = ImageDraw.Draw(map_image)
+        for polygon, zone_color in zip(zone_mask.polygons, zone_colors):
+            if len(polygon) >= 3:
+                outline_draw.polygon(
+                    [tuple(pixel) for pixel in polygon.tolist()],
+                    outline=tuple(list(zone_color) + [255]),
                 )
-                self._map_image.paste(poly_img, mask=poly_img)
 
     async def _image_to_bytes(
         self, width: Optional[int] = None, height: Optional[int] = None
     ) -> Optional[bytes]:
-        img_byte_arr = io.BytesIO()
-        map_image = self._image.copy()
+        """Return the encoded frame, scaled to fit width and height if given.
+
+        Home Assistant only asks for the native size, that encode is kept
+        until the next render. Scaled frames are encoded on every call.
+        """
+        resize = bool(width and height)
+        frame_version = self._frame_version
+        if not resize and self._image_bytes_version == frame_version:
+            self.render_stats["encode_cache_hits"] += 1
+            return self._image_bytes
+
+        self.render_stats["encode_cache_misses"] += 1
+        start = time.perf_counter()
+        image_bytes = await self.hass.async_add_executor_job(
+            self._encode_image, self._encoder, self._image, width, height
+        )
+        self.render_stats["encode_time"] += time.perf_counter() - start
+        self.render_stats["encoded_bytes"] += len(image_bytes)
+
+        # Unless a new frame was rendered meanwhile
+        if not resize and frame_version == self._frame_version:
+            self._image_bytes = image_bytes
+            self._image_bytes_version = frame_version
+        return image_bytes
+
+    @staticmethod
+    def _encode_image(
+        encoder: MapEncoder,
+        map_image: Image.Image,
+        width: Optional[int],
+        height: Optional[int],
+    ) -> bytes:
+        """Encode a frame, runs in the executor."""
         if width and height:
+            map_image = map_image.copy()
             map_image.thumbnail((width, height), Image.Resampling.LANCZOS)
-        map_image.save(img_byte_arr, format="PNG")
-        return img_byte_arr.getvalue()
+        return encoder.encode(map_image)
 
     def _find_image_scale(self):
         """Find the scale ration in m/px and center of image."""
-        h_w = (
-            self._map_image.size[0],
-            self._map_image.size[1],
-        )  # Height/Width of image
-        self._c_img_px = int((0 + h_w[0]) / 2), int(
-            (0 + h_w[1]) / 2
-        )  # Center of image in pixels
-
-        # Center of image in lat/long
-        self._c_img_wgs84 = (
-            (self._top_left_coord[0] + self._bottom_right_coord[0]) / 2,
-            (self._top_left_coord[1] + self._bottom_right_coord[1]) / 2,
-        )
-
-        # Length of hypotenuse in meters
-        len_wgs84_m = geodesic(self._top_left_coord, self._bottom_right_coord).meters
-
-        # Length of hypotenuse in pixels
-        len_px = int(math.dist((0, 0), h_w))
+        if self._tile_pyramid is not None:
+            h_w = self._tile_pyramid.size
+        else:
+            h_w = (
+                self._map_image.size[0],
+                self._map_image.size[1],
+            )  # Height/Width of image
 
-        self._px_meter = len_px / len_wgs84_m  # Scale in pixels/meter
+        self._projection = MapProjection.from_corners(
+            self._top_left_coord, self._bottom_right_coord, h_w, self._map_rotation
+        )
+        self._c_img_px = self._projection.center_px
+        self._c_img_wgs84 = self._projection.center_wgs84
+        self._px_meter = self._projection.px_meter  # Scale in pixels/meter
 
         _LOGGER.debug(
-            "Center px: %s, Center WGS84: %s, Len (m): %s, Len (px): %s, px/m: %s, Img HW (px): %s",
+            "Center px: %s, Center WGS84: %s, px/m: %s, Img HW (px): %s",
             self._c_img_px,
             self._c_img_wgs84,
-            len_wgs84_m,
-            len_px,
             self._px_meter,
             h_w,
         )
@@ -229,135 +614,189 @@ class AutomowerImage(ImageEntity, AutomowerEntity):
         mower_id: str,
         path_color: list,
         map_image: Image.Image,
-    ) -> None:
-        """Create image and mower overlay."""
-        if is_home and home_location:
-            location = home_location
-        else:
-            location = (
-                position_history[0]["latitude"],
-                position_history[0]["longitude"],
-            )
-
+    ) -> ImgPoint:
+        """Update the path layer, return the top left corner of the mower icon."""
         self._position_history[mower_id] = position_history
 
-        # pylint: disable=invalid-name
-        x1, y1 = self._scale_to_img(location, (map_image.size[0], map_image.size[1]))
-        img_draw = ImageDraw.Draw(map_image)
+        path_layer = self._path_layers.get(mower_id)
+        if path_layer is None:
+            path_layer = PathLayer(map_image.size, path_color)
+            self._path_layers[mower_id] = path_layer
+        path_layer.update(position_history, self._projection)
 
-        for i in range(len(position_history) - 1, 0, -1):
-            point_1 = (
-                position_history[i]["latitude"],
-                position_history[i]["longitude"],
-            )
-            scaled_loc_1 = self._scale_to_img(
-                point_1, (map_image.size[0], map_image.size[1])
-            )
-            point_2 = (
-                position_history[i - 1]["latitude"],
-                position_history[i - 1]["longitude"],
-            )
-            scaled_loc_2 = self._scale_to_img(
-                point_2, (map_image.size[0], map_image.size[1])
-            )
-            plot_points = self._find_points_on_line(scaled_loc_1, scaled_loc_2)
-            for point in range(0, len(plot_points) - 1, 2):
-                img_draw.line(
-                    (plot_points[point], plot_points[point + 1]),
-                    fill=tuple(path_color + [255]),
-                    width=2,
-                )
+        # pylint: disable=invalid-name
+        x1, y1 = self._scale_to_img(
+            self._icon_location(is_home, home_location, position_history),
+            (map_image.size[0], map_image.size[1]),
+        )
 
         img_w, img_h = self._overlay_image.size
+        return (x1 - img_w // 2, y1 - img_h)
 
-        map_image.paste(
-            self._overlay_image, (x1 - img_w // 2, y1 - img_h), self._overlay_image
+    @staticmethod
+    def _icon_location(
+        is_home: bool, home_location: GpsPoint, position_history: list
+    ) -> GpsPoint:
+        """Return where the mower icon is drawn."""
+        if is_home and home_location:
+            return tuple(home_location)
+        return (position_history[0]["latitude"], position_history[0]["longitude"])
+
+    def _generate_tiled_image(self, mowers: list[tuple]) -> Image.Image:
+        """Draw the viewport around the mowers from the tile pyramid."""
+        img_w, img_h = self._overlay_image.size
+        locations = [
+            self._icon_location(is_home, home_location, position_history)
+            for is_home, home_location, position_history, _, _ in mowers
+        ]
+        icon_pixels = self._projection.project(locations)
+        level, box = self._tile_pyramid.viewport(
+            tuple(icon_pixels.min(axis=0) - (img_w, img_h))
+            + tuple(icon_pixels.max(axis=0) + (img_w, img_h))
         )
-        return map_image
+
+        frame = self._tile_pyramid.read_region(level, box)
+        projection = self._projection.scaled(1 / 2**level, box[:2])
+        self._overlay_zones(frame, projection)
+        if self._coverage_layer is not None:
+            frame.alpha_composite(
+                self._coverage_layer.render_region(
+                    tuple(coord * 2**level for coord in box), frame.size
+                )
+            )
+        for _, _, position_history, _, path_color in mowers:
+            path_layer = PathLayer(frame.size, path_color)
+            path_layer.update(position_history, projection)
+            frame.alpha_composite(path_layer.image)
+        for x_px, y_px in projection.project(locations).tolist():
+            frame.paste(
+                self._overlay_image,
+                (x_px - img_w // 2, y_px - img_h),
+                self._overlay_image,
+            )
+        return frame
 
     def _generate_image(self, data: dict) -> None:  # pylint: disable=unused-argument
         """Generate the image."""
         # self._calculate_update_frequency()
 
-        map_image = self._map_image.copy()
+        if not self._positions_changed():
+            return
 
+        mowers = []
         if self._additional_images:
-            for add_img in self._additional_images:
-                extra_img = AutomowerEntity(
-                    self.coordinator, self._mwr_id_to_idx[add_img]
-                )
-                options = self.entry.options.get(add_img, {})
-                home_location = options.get(HOME_LOCATION, None)
-                path_color = options.get(MAP_PATH_COLOR, [255, 0, 0])
-                img_position_history = extra_img.get_mower_attributes()["positions"]
-                map_image = self._generate_image_img(
-                    extra_img.is_home,
-                    home_location,
-                    img_position_history,
-                    extra_img.mower_id,
-                    path_color,
-                    map_image,
+            for extra_img in self._additional_mowers():
+                options = self.entry.options.get(extra_img.mower_id, {})
+                mowers.append(
+                    (
+                        extra_img.is_home,
+                        options.get(HOME_LOCATION, None),
+                        extra_img.get_mower_attributes()["positions"],
+                        extra_img.mower_id,
+                        options.get(MAP_PATH_COLOR, [255, 0, 0]),
+                    )
                 )
-
-        position_history = AutomowerEntity.get_mower_attributes(self)["positions"]
-        if self.previous_position_history != position_history:
-            self.previous_position_history = position_history
-            map_image = self._generate_image_img(
+        mowers.append(
+            (
                 self.is_home,
                 self.home_location,
-                position_history,
+                self.previous_position_history,
                 self.mower_id,
                 self._path_color,
-                map_image,
             )
-            self._image = map_image
-            self._attr_image_last_updated = datetime.now()
-
-    def _find_points_on_line(
-        self, point_1: ImgPoint, point_2: ImgPoint
-    ) -> list[ImgPoint]:
-        dash_length = 10
-        line_length = math.sqrt(
-            (point_2[0] - point_1[0]) ** 2 + (point_2[1] - point_1[1]) ** 2
         )
-        dashes = int(line_length // dash_length)
-
-        points = []
-        points.append(point_1)
-        # pylint: disable=unused-variable
-        for i in range(dashes):
-            points.append(self._get_point_on_vector(points[-1], point_2, dash_length))
-
-        points.append(point_2)
 
-        return points
-
-    def _get_point_on_vector(
-        self, initial_pt: ImgPoint, terminal_pt: ImgPoint, dist: int
-    ) -> ImgPoint:
-        """Find a point on a vector."""
-        v = np.array(initial_pt, dtype=float)  # pylint: disable=invalid-name
-        u = np.array(terminal_pt, dtype=float)  # pylint: disable=invalid-name
-        n = v - u  # pylint: disable=invalid-name
-        n /= np.linalg.norm(n, 2)  # pylint: disable=invalid-name
-        point = v - dist * n
+        if self._coverage_layer is not None:
+            self._coverage_layer.update(
+                self.previous_position_history, self._projection
+            )
 
-        return tuple(point)
+        if self._tile_pyramid is not None:
+            self._image = self._generate_tiled_image(mowers)
+        else:
+            if self._compositor is None:
+                self._compositor = DirtyRectCompositor(self._map_image)
+            icon_positions = [
+                self._generate_image_img(*mower, self._map_image) for mower in mowers
+            ]
+            layers = list(self._path_layers.values())
+            if self._coverage_layer is not None:
+                # Under the paths
+                layers.insert(0, self._coverage_layer)
+            self._compositor.update(
+                layers,
+                [(self._overlay_image, position) for position in icon_positions],
+            )
+            # Published frames are read by encoders in the executor, keep them
+            # apart from the canvas the compositor keeps drawing on
+            self._image = self._compositor.image.copy()
+        self._frame_version += 1
+        self._attr_image_last_updated = datetime.now()
+
+    def _positions_changed(self) -> bool:
+        """Return True if the mower moved since the last frame."""
+        position_history = AutomowerEntity.get_mower_attributes(self)["positions"]
+        if self.previous_position_history == position_history:
+            return False
+        self.previous_position_history = position_history
+        return True
+
+    def _additional_mowers(self) -> list[AutomowerEntity]:
+        """Return the additional mowers drawn on the map, created once."""
+        if self._additional_entities is None:
+            self._additional_entities = [
+                AutomowerEntity(self.coordinator, self._mwr_id_to_idx[add_img])
+                for add_img in self._additional_images
+            ]
+        return self._additional_entities
 
     def _scale_to_img(
         self, lat_lon: GpsPoint, h_w: ImgDimensions  # pylint: disable=unused-argument
     ) -> ImgPoint:
         """Convert from latitude and longitude to the image pixels."""
-        bearing_res = distance(self._c_img_wgs84, lat_lon).geod.Inverse(
-            self._c_img_wgs84[0], self._c_img_wgs84[1], lat_lon[0], lat_lon[1]
-        )
-        c_bearing_deg = bearing_res.get("azi1")
-        c_plt_pnt_m = bearing_res.get("s12") * 1000
-        c_bearing = math.radians(c_bearing_deg - 90 + self._map_rotation)
+        return self._projection.project_point(lat_lon)
 
-        new_pnt_px = (
-            self._c_img_px[0] + (c_plt_pnt_m * self._px_meter * math.cos(c_bearing)),
-            self._c_img_px[1] + (c_plt_pnt_m * self._px_meter * math.sin(c_bearing)),
-        )
 
-        return int(new_pnt_px[0]), int(new_pnt_px[1])
+class AutomowerFleetImage(AutomowerImage):
+    """Map image drawing all mowers that share a map in a single pass.
+
+    The map settings of the first mower are used, every mower of the fleet
+    and the additional mowers configured for them are drawn.
+    """
+
+    _attr_translation_key = "fleet_img"
+    _draw_coverage = False
+
+    def __init__(
+        self, coordinator, idx, entry, hass: HomeAssistant, fleet_idx: list[int]
+    ) -> None:
+        """Initialize AutomowerFleetImage."""
+        super().__init__(coordinator, idx, entry, hass)
+        self._attr_unique_id = f"{self.mower_id}_fleet_image"
+        self._fleet_position_histories = None
+
+        fleet_ids = []
+        for fleet_mower_idx in fleet_idx:
+            mower_id = coordinator.session.data["data"][fleet_mower_idx]["id"]
+            fleet_ids.append(mower_id)
+            fleet_ids.extend(self.entry.options.get(mower_id, {}).get(ADD_IMAGES, []))
+        self._additional_images = [
+            mower_id
+            for mower_id in dict.fromkeys(fleet_ids)
+            if mower_id != self.mower_id
+        ]
+
+    def _positions_changed(self) -> bool:
+        """Return True if any mower of the fleet moved since the last frame."""
+        position_histories = [
+            extra_img.get_mower_attributes()["positions"]
+            for extra_img in self._additional_mowers()
+        ]
+        position_histories.append(
+            AutomowerEntity.get_mower_attributes(self)["positions"]
+        )
+        if self._fleet_position_histories == position_histories:
+            return False
+        self._fleet_position_histories = position_histories
+        self.previous_position_history = position_histories[-1]
+        return True
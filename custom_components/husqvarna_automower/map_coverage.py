@@ -0,0 +1,191 @@
+"""Coverage heatmap of the mowed area."""
+
+import hashlib
+import json
+import math
+import os
+import shutil
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+from .map_utils import MapProjection
+
+ImgDimensions = tuple[int, int]
+ImgBox = tuple[int, int, int, int]
+
+COVERAGE_CELL_SIZE = 0.5  # Meters
+COVERAGE_COUNTS = "counts.npy"
+COVERAGE_META = "meta.json"
+# Cells passed once, twice, 4 times, 8 times... up to 128 times or more
+COVERAGE_COLORS = np.array(
+    [
+        [0, 0, 0, 0],
+        [49, 54, 149, 96],
+        [69, 117, 180, 104],
+        [116, 173, 209, 112],
+        [171, 217, 233, 120],
+        [254, 224, 144, 128],
+        [253, 174, 97, 136],
+        [244, 109, 67, 144],
+        [215, 48, 39, 152],
+    ],
+    dtype=np.uint8,
+)
+
+
+def coverage_levels(counts: np.ndarray) -> np.ndarray:
+    """Return the color index of cells passed counts times."""
+    levels = np.floor(np.log2(np.maximum(counts, 1))).astype(np.intp) + 1
+    return np.where(counts > 0, np.minimum(levels, len(COVERAGE_COLORS) - 1), 0)
+
+
+class CoverageLayer:
+    """Translucent heatmap of how often the mower passed each part of the map.
+
+    Positions are counted in a grid of cells aligned to the map image. The
+    counts are memory mapped from disk so coverage builds up across restarts,
+    every update only counts and redraws the cells of the new positions.
+    """
+
+    def __init__(
+        self,
+        size: ImgDimensions,
+        projection: MapProjection,
+        coverage_dir: str,
+        cell_size: float = COVERAGE_CELL_SIZE,
+    ) -> None:
+        """Initialize the CoverageLayer Object."""
+        self.size = size
+        self.cell_px = max(round(projection.px_meter * cell_size), 1)
+        shape = (
+            math.ceil(size[1] / self.cell_px),
+            math.ceil(size[0] / self.cell_px),
+        )
+
+        # Counts of another map, scale or cell size don't line up with this one
+        grid_key = json.dumps(
+            [
+                list(size),
+                self.cell_px,
+                list(projection.center_wgs84),
+                list(projection.center_px),
+                projection.px_meter,
+                projection.rotation,
+            ]
+        )
+        grid_dir = os.path.join(
+            coverage_dir,
+            hashlib.sha1(grid_key.encode(), usedforsecurity=False).hexdigest(),
+        )
+        counts_path = os.path.join(grid_dir, COVERAGE_COUNTS)
+        self._meta_path = os.path.join(grid_dir, COVERAGE_META)
+        self._last_position = None
+
+        if os.path.isfile(self._meta_path):
+            with open(self._meta_path, "r", encoding="utf-8") as meta_file:
+                self._last_position = json.load(meta_file)["last_position"]
+            self.counts = np.load(counts_path, mmap_mode="r+")
+        else:
+            if os.path.isdir(coverage_dir):
+                shutil.rmtree(coverage_dir)
+            os.makedirs(grid_dir)
+            self.counts = np.lib.format.open_memmap(
+                counts_path, mode="w+", dtype=np.uint32, shape=shape
+            )
+            self._write_meta()
+
+        self._image = None
+        self._img_draw = None
+        self.dirty_box = (0, 0) + tuple(size)
+
+    @property
+    def image(self) -> Image.Image:
+        """Return the heatmap at the size of the map, drawn on first use."""
+        if self._image is None:
+            self._image = self.render_region((0, 0) + tuple(self.size), self.size)
+            self._img_draw = ImageDraw.Draw(self._image)
+        return self._image
+
+    def render_region(self, box: ImgBox, size: ImgDimensions) -> Image.Image:
+        """Return the heatmap of box, in map pixels, scaled to size."""
+        cell = self.cell_px
+        left, top = max(box[0] // cell, 0), max(box[1] // cell, 0)
+        right = min(math.ceil(box[2] / cell), self.counts.shape[1])
+        bottom = min(math.ceil(box[3] / cell), self.counts.shape[0])
+        cells = Image.fromarray(
+            COVERAGE_COLORS[coverage_levels(self.counts[top:bottom, left:right])],
+            "RGBA",
+        )
+        return cells.resize(
+            tuple(size),
+            Image.Resampling.NEAREST,
+            box=(
+                box[0] / cell - left,
+                box[1] / cell - top,
+                box[2] / cell - left,
+                box[3] / cell - top,
+            ),
+        )
+
+    def update(self, position_history: list, projection: MapProjection) -> bool:
+        """Count positions added since the last update, return True if any."""
+        if not position_history or position_history[0] == self._last_position:
+            return False
+
+        try:
+            new_idx = position_history.index(self._last_position)
+        except ValueError:
+            # The history doesn't continue the counted one, all of it is new
+            new_idx = len(position_history)
+        self._last_position = position_history[0]
+
+        cells = (
+            projection.project(
+                MapProjection.positions_to_array(position_history[:new_idx])
+            )
+            // self.cell_px
+        )
+        cells = cells[
+            (cells[:, 0] >= 0)
+            & (cells[:, 0] < self.counts.shape[1])
+            & (cells[:, 1] >= 0)
+            & (cells[:, 1] < self.counts.shape[0])
+        ]
+        if len(cells):
+            np.add.at(self.counts, (cells[:, 1], cells[:, 0]), 1)
+            self.counts.flush()
+            if self._image is not None:
+                self._redraw_cells(np.unique(cells, axis=0))
+        self._write_meta()
+        return len(cells) > 0
+
+    def _redraw_cells(self, cells: np.ndarray) -> None:
+        """Redraw cells of the heatmap image."""
+        colors = COVERAGE_COLORS[coverage_levels(self.counts[cells[:, 1], cells[:, 0]])]
+        cell = self.cell_px
+        for (col, row), color in zip(cells.tolist(), colors.tolist()):
+            self._img_draw.rectangle(
+                (col * cell, row * cell, (col + 1) * cell - 1, (row + 1) * cell - 1),
+                fill=tuple(color),
+            )
+
+        box = (
+            int(cells[:, 0].min()) * cell,
+            int(cells[:, 1].min()) * cell,
+            (int(cells[:, 0].max()) + 1) * cell,
+            (int(cells[:, 1].max()) + 1) * cell,
+        )
+        if self.dirty_box is not None:
+            box = (
+                min(box[0], self.dirty_box[0]),
+                min(box[1], self.dirty_box[1]),
+                max(box[2], self.dirty_box[2]),
+                max(box[3], self.dirty_box[3]),
+            )
+        self.dirty_box = box
+
+    def _write_meta(self) -> None:
+        """Store the newest counted position next to the counts."""
+        with open(self._meta_path, "w", encoding="utf-8") as meta_file:
+            json.dump({"last_position": self._last_position}, meta_file)
@@ -0,0 +1,77 @@
+"""Encoders for the published map image."""
+
+import io
+
+from PIL import Image
+
+
+class MapEncoder:
+    """Encode map frames to PNG.
+
+    quality is 1-100 for lossy formats, compression is 0-9 and trades
+    encode time for size, higher is smaller and slower.
+    """
+
+    image_format = "PNG"
+    content_type = "image/png"
+
+    def __init__(self, quality: int, compression: int) -> None:
+        """Initialize the MapEncoder Object."""
+        self.quality = quality
+        self.compression = compression
+
+    def _save_options(self) -> dict:
+        """Return the options passed to Image.save."""
+        return {"compress_level": self.compression, "optimize": self.compression == 9}
+
+    def _prepare(self, map_image: Image.Image) -> Image.Image:
+        """Convert the frame to a mode the format can store."""
+        return map_image
+
+    def encode(self, map_image: Image.Image) -> bytes:
+        """Encode a frame."""
+        img_byte_arr = io.BytesIO()
+        self._prepare(map_image).save(
+            img_byte_arr, format=self.image_format, **self._save_options()
+        )
+        return img_byte_arr.getvalue()
+
+
+class JpegEncoder(MapEncoder):
+    """Encode map frames to JPEG, the map has no transparency."""
+
+    image_format = "JPEG"
+    content_type = "image/jpeg"
+
+    def _save_options(self) -> dict:
+        """Return the options passed to Image.save."""
+        # Optimized Huffman tables shave a few percent off at some encode time
+        return {"quality": self.quality, "optimize": self.compression > 5}
+
+    def _prepare(self, map_image: Image.Image) -> Image.Image:
+        """Convert the frame to a mode the format can store."""
+        return map_image.convert("RGB")
+
+
+class WebpEncoder(MapEncoder):
+    """Encode map frames to lossy WebP."""
+
+    image_format = "WEBP"
+    content_type = "image/webp"
+
+    def _save_options(self) -> dict:
+        """Return the options passed to Image.save."""
+        # WebP methods run 0-6, the slowest ones take seconds on a large map
+        return {"quality": self.quality, "method": self.compression * 6 // 9}
+
+
+MAP_ENCODERS = {
+    "png": MapEncoder,
+    "jpeg": JpegEncoder,
+    "webp": WebpEncoder,
+}
+
+
+def get_encoder(image_format: str, quality: int, compression: int) -> MapEncoder:
+    """Return the encoder for image_format."""
+    return MAP_ENCODERS[image_format](quality, compression)
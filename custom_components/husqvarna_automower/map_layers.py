@@ -0,0 +1,317 @@
+"""Layers composited into the map image."""
+
+import threading
+import weakref
+from collections.abc import Callable, Hashable
+from typing import Optional
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+from .map_utils import MapProjection
+
+ImgDimensions = tuple[int, int]
+ImgPoint = tuple[int, int]
+ImgBox = tuple[int, int, int, int]
+
+DASH_LENGTH = 10  # Pixels
+PATH_WIDTH = 2  # Pixels
+PATH_TOLERANCE = 1.0  # Pixels
+
+
+def dash_segments(pixels: np.ndarray, dash_length: int = DASH_LENGTH) -> np.ndarray:
+    """Return the dashes along a polyline as an (n, 2, 2) array of end points.
+
+    Every segment of the polyline starts with a dash and alternates dashes
+    and gaps of dash_length, the last dash is cut short at the segment end.
+    """
+    pixels = np.asarray(pixels, dtype=float).reshape(-1, 2)
+    if len(pixels) < 2:
+        return np.empty((0, 2, 2))
+
+    start = pixels[:-1]
+    vector = pixels[1:] - start
+    length = np.hypot(vector[:, 0], vector[:, 1])
+    unit = np.divide(
+        vector, length[:, None], out=np.zeros_like(vector), where=length[:, None] > 0
+    )
+
+    # Points at every dash_length along each segment, plus the segment end
+    n_points = (length // dash_length).astype(int) + 2
+    segment = np.repeat(np.arange(len(start)), n_points)
+    offset = np.arange(n_points.sum()) - np.repeat(
+        np.cumsum(n_points) - n_points, n_points
+    )
+    dist = np.minimum(offset * dash_length, length[segment])
+    points = start[segment] + unit[segment] * dist[:, None]
+
+    # Dashes run from every even point to the next point of the same segment
+    dash_start = np.flatnonzero((offset % 2 == 0) & (offset + 1 < n_points[segment]))
+    return np.stack((points[dash_start], points[dash_start + 1]), axis=1)
+
+
+def _simplify_spans(
+    points: np.ndarray, first: np.ndarray, last: np.ndarray, tolerance: float
+) -> np.ndarray:
+    """Return the mask of points kept simplifying each span first to last.
+
+    Ramer-Douglas-Peucker, span ends are always kept. Points are measured
+    against the segment, not the line through it, so the mower turning back
+    along its own path keeps the point where it turned. All spans of a
+    recursion level are split in one pass.
+    """
+    x_px, y_px = np.asarray(points, dtype=float).T
+    keep = np.zeros(len(points), dtype=bool)
+    keep[first] = True
+    keep[last] = True
+    while len(first):
+        has_inner = last - first > 1
+        first, last = first[has_inner], last[has_inner]
+        if not len(first):
+            break
+
+        # Every inner point of every span, with the span it belongs to
+        n_inner = last - first - 1
+        span_start = np.cumsum(n_inner) - n_inner
+        span = np.repeat(np.arange(len(first)), n_inner)
+        inner_idx = np.arange(n_inner.sum()) - span_start[span] + first[span] + 1
+
+        start_x, start_y = x_px[first][span], y_px[first][span]
+        vector_x = x_px[last][span] - start_x
+        vector_y = y_px[last][span] - start_y
+        inner_x = x_px[inner_idx] - start_x
+        inner_y = y_px[inner_idx] - start_y
+        length_sq = vector_x * vector_x + vector_y * vector_y
+        along = np.divide(
+            inner_x * vector_x + inner_y * vector_y,
+            length_sq,
+            out=np.zeros(len(inner_idx)),
+            where=length_sq > 0,
+        )
+        np.clip(along, 0, 1, out=along)
+        dist = np.hypot(inner_x - along * vector_x, inner_y - along * vector_y)
+
+        # Split every span at its farthest point if that is out of tolerance
+        max_dist = np.maximum.reduceat(dist, span_start)
+        split = max_dist > tolerance
+        farthest = np.minimum.reduceat(
+            np.where(dist == max_dist[span], inner_idx, len(points)), span_start
+        )
+        split_idx = farthest[split]
+        keep[split_idx] = True
+        first = np.concatenate((first[split], split_idx))
+        last = np.concatenate((split_idx, last[split]))
+    return keep
+
+
+def dash_polylines(
+    dashes: np.ndarray, tolerance: float = PATH_TOLERANCE
+) -> list[np.ndarray]:
+    """Return dashes joined into simplified polylines where they meet.
+
+    Segments shorter than a dash are drawn whole, so dashes of dense paths
+    meet end to start and draw as one polyline. Each polyline is simplified
+    so GPS jitter and straight runs take few points.
+    """
+    if not len(dashes):
+        return []
+    gap = dashes[1:, 0] - dashes[:-1, 1]
+    new_line = np.ones(len(dashes), dtype=bool)
+    new_line[1:] = np.hypot(gap[:, 0], gap[:, 1]) > 1e-6
+    line_idx = np.cumsum(new_line) - 1
+    line_dash = np.flatnonzero(new_line)
+
+    # The start of the first dash of every polyline, then the end of every dash
+    points = np.empty((len(dashes) + len(line_dash), 2))
+    first = line_dash + np.arange(len(line_dash))
+    last = np.append(first[1:] - 1, len(points) - 1)
+    points[first] = dashes[line_dash, 0]
+    points[np.arange(len(dashes)) + line_idx + 1] = dashes[:, 1]
+
+    keep = _simplify_spans(points, first, last, tolerance)
+    return [
+        points[start : end + 1][keep[start : end + 1]]
+        for start, end in zip(first.tolist(), last.tolist())
+    ]
+
+
+class BaseLayerCache:
+    """Share decoded, zone overlaid map images between image entities.
+
+    Entities drawing the same map with the same zones get the same image,
+    which must be treated as read-only. Images are dropped once no entity
+    references them anymore. Tile pyramids of large maps are shared the
+    same way.
+    """
+
+    def __init__(self) -> None:
+        """Initialize the BaseLayerCache Object."""
+        self._layers = weakref.WeakValueDictionary()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        """Return the number of cached base layers."""
+        return len(self._layers)
+
+    def get(
+        self, cache_key: Hashable, build_layer: Callable[[], Image.Image]
+    ) -> Image.Image:
+        """Return the base layer for cache_key, building it if needed."""
+        with self._lock:
+            base_layer = self._layers.get(cache_key)
+            if base_layer is None:
+                base_layer = build_layer()
+                self._layers[cache_key] = base_layer
+            return base_layer
+
+
+BASE_LAYER_CACHE = BaseLayerCache()
+
+
+class PathLayer:
+    """Transparent layer holding the drawn path of a single mower.
+
+    The API prepends new positions to the history it already sent, so only
+    the segments in front of the newest position already drawn are added on
+    each update. Once the oldest drawn position drops out of the history the
+    path is drawn again, so it never shows more than the history holds.
+    """
+
+    def __init__(
+        self,
+        size: ImgDimensions,
+        path_color: list,
+        tolerance: float = PATH_TOLERANCE,
+    ) -> None:
+        """Initialize the PathLayer Object."""
+        self.size = size
+        self.path_color = tuple(list(path_color) + [255])
+        # Pixels the drawn path may stray from the positions to save segments
+        self.tolerance = tolerance
+        self.image = Image.new("RGBA", self.size)
+        self._img_draw = ImageDraw.Draw(self.image)
+        self._first_position = None
+        self._last_position = None
+        self.dirty_box = None
+
+    def clear(self) -> None:
+        """Remove everything drawn on the layer."""
+        self.image = Image.new("RGBA", self.size)
+        self._img_draw = ImageDraw.Draw(self.image)
+        self._first_position = None
+        self._last_position = None
+        self.dirty_box = (0, 0) + tuple(self.size)
+
+    def update(self, position_history: list, projection: MapProjection) -> bool:
+        """Draw positions added since the last update, return True if drawn."""
+        if not position_history:
+            return False
+        if position_history[-1] != self._first_position:
+            # The history rolled past the drawn path, or doesn't continue it
+            if self._first_position is not None:
+                self.clear()
+            self._first_position = position_history[-1]
+            new_idx = len(position_history) - 1
+        elif position_history[0] == self._last_position:
+            return False
+        else:
+            try:
+                new_idx = position_history.index(self._last_position)
+            except ValueError:
+                # The history doesn't continue the drawn path, start over
+                self.clear()
+                self._first_position = position_history[-1]
+                new_idx = len(position_history) - 1
+
+        # Oldest first, so dashes start where the mower came from
+        new_positions = position_history[new_idx::-1]
+        self.extend(projection.project(MapProjection.positions_to_array(new_positions)))
+        self._last_position = position_history[0]
+        return True
+
+    def extend(self, pixels: np.ndarray) -> None:
+        """Draw the path through pixels, oldest first."""
+        for line in dash_polylines(dash_segments(pixels), self.tolerance):
+            self._img_draw.line(line.tolist(), fill=self.path_color, width=PATH_WIDTH)
+
+        self._add_dirty_box(
+            tuple(pixels.min(axis=0) - PATH_WIDTH)
+            + tuple(pixels.max(axis=0) + PATH_WIDTH + 1)
+        )
+
+    def _add_dirty_box(self, box: ImgBox) -> None:
+        """Extend the region changed since the dirty box was last taken."""
+        if self.dirty_box is not None:
+            box = (
+                min(box[0], self.dirty_box[0]),
+                min(box[1], self.dirty_box[1]),
+                max(box[2], self.dirty_box[2]),
+                max(box[3], self.dirty_box[3]),
+            )
+        self.dirty_box = tuple(int(coord) for coord in box)
+
+
+class DirtyRectCompositor:
+    """Composite the base layer, path layers and mower icons into a frame.
+
+    Only the regions that changed since the previous frame are rebuilt from
+    the layers: where the icons were, where they are now and where new path
+    segments were drawn.
+    """
+
+    def __init__(self, base_layer: Image.Image) -> None:
+        """Initialize the DirtyRectCompositor Object."""
+        self.base_layer = base_layer
+        self.image = base_layer.copy()
+        self._icon_boxes = []
+
+    def _clip(self, box: ImgBox) -> Optional[ImgBox]:
+        """Clip box to the frame, None if nothing is left."""
+        width, height = self.image.size
+        box = (
+            max(box[0], 0),
+            max(box[1], 0),
+            min(box[2], width),
+            min(box[3], height),
+        )
+        if box[0] >= box[2] or box[1] >= box[3]:
+            return None
+        return box
+
+    def update(
+        self,
+        path_layers: list[PathLayer],
+        icons: list[tuple[Image.Image, ImgPoint]],
+    ) -> list[ImgBox]:
+        """Bring the frame up to date, return the regions rebuilt.
+
+        path_layers are drawn in order, any layer with an image and a dirty
+        box can be passed. Icons are (image, top left corner) pairs, drawn
+        above all layers.
+        """
+        icon_boxes = [
+            (x, y, x + icon.size[0], y + icon.size[1]) for icon, (x, y) in icons
+        ]
+        dirty_boxes = self._icon_boxes + icon_boxes
+        for path_layer in path_layers:
+            if path_layer.dirty_box is not None:
+                dirty_boxes.append(path_layer.dirty_box)
+                path_layer.dirty_box = None
+
+        rebuilt = []
+        for box in dirty_boxes:
+            box = self._clip(box)
+            if box is None:
+                continue
+            region = self.base_layer.crop(box)
+            for path_layer in path_layers:
+                region.alpha_composite(path_layer.image, source=box)
+            self.image.paste(region, box[:2])
+            rebuilt.append(box)
+
+        # Every icon box was rebuilt above, so no icon is blended twice
+        for icon, position in icons:
+            self.image.paste(icon, position, icon)
+
+        self._icon_boxes = icon_boxes
+        return rebuilt
@@ -0,0 +1,230 @@
+"""Tiled multi-resolution pyramid for large map images."""
+
+import json
+import math
+import os
+import shutil
+import tempfile
+
+import numpy as np
+from PIL import Image
+
+ImgDimensions = tuple[int, int]
+ImgBox = tuple[int, int, int, int]
+
+TILE_SIZE = 256  # Pixels
+VIEWPORT_SIZE = (1024, 1024)  # Pixels
+PYRAMID_META = "pyramid.json"
+
+
+def _level_file(level: int) -> str:
+    """Return the file name of a pyramid level."""
+    return f"level_{level}.npy"
+
+
+class TilePyramid:
+    """Multi-resolution pyramid of map tiles, memory mapped from disk.
+
+    Level 0 is the map image at full resolution, every next level halves
+    the previous one until the map fits in a single tile. A level is stored
+    as one array of tiles, so reading a region only pages in the tiles it
+    overlaps and memory use doesn't depend on the size of the map.
+    """
+
+    def __init__(self, pyramid_dir: str) -> None:
+        """Initialize the TilePyramid Object."""
+        with open(
+            os.path.join(pyramid_dir, PYRAMID_META), "r", encoding="utf-8"
+        ) as meta_file:
+            meta = json.load(meta_file)
+        self.pyramid_dir = pyramid_dir
+        self.size = tuple(meta["size"])
+        self.tile_size = meta["tile_size"]
+        self._levels = [
+            np.load(os.path.join(pyramid_dir, _level_file(level)), mmap_mode="r")
+            for level in range(meta["levels"])
+        ]
+
+    @property
+    def levels(self) -> int:
+        """Return the number of levels."""
+        return len(self._levels)
+
+    def level_size(self, level: int) -> ImgDimensions:
+        """Return the size of the map at a level."""
+        return level_size(self.size, level)
+
+    def read_region(self, level: int, box: ImgBox) -> Image.Image:
+        """Read a region of a level, parts outside the map are transparent."""
+        tiles = self._levels[level]
+        tile = self.tile_size
+        left, top, right, bottom = box
+        width, height = right - left, bottom - top
+        region = np.zeros((height, width, 4), dtype=np.uint8)
+
+        # Only the tiles overlapping the region are read from disk
+        col_0, row_0 = max(left, 0) // tile, max(top, 0) // tile
+        col_1 = min(math.ceil(right / tile), tiles.shape[1])
+        row_1 = min(math.ceil(bottom / tile), tiles.shape[0])
+        if col_0 < col_1 and row_0 < row_1:
+            block = (
+                tiles[row_0:row_1, col_0:col_1]
+                .transpose(0, 2, 1, 3, 4)
+                .reshape((row_1 - row_0) * tile, (col_1 - col_0) * tile, 4)
+            )
+            src_left, src_top = max(left, 0), max(top, 0)
+            src_right = min(right, col_1 * tile)
+            src_bottom = min(bottom, row_1 * tile)
+            region[
+                src_top - top : src_bottom - top, src_left - left : src_right - left
+            ] = block[
+                src_top - row_0 * tile : src_bottom - row_0 * tile,
+                src_left - col_0 * tile : src_right - col_0 * tile,
+            ]
+        return Image.fromarray(region, "RGBA")
+
+    def viewport(
+        self, focus_box: ImgBox, viewport_size: ImgDimensions = VIEWPORT_SIZE
+    ) -> tuple[int, ImgBox]:
+        """Return the level and viewport box showing focus_box.
+
+        focus_box is in level 0 pixels, the most detailed level where it
+        fits in the viewport is used. The viewport is centered on focus_box
+        and kept inside the map where the map is larger than the viewport.
+        """
+        focus_w = focus_box[2] - focus_box[0]
+        focus_h = focus_box[3] - focus_box[1]
+        level = 0
+        while level < self.levels - 1 and (
+            focus_w / 2**level > viewport_size[0]
+            or focus_h / 2**level > viewport_size[1]
+        ):
+            level += 1
+
+        scale = 2**level
+        view_size = []
+        view_start = []
+        for axis in range(2):
+            map_len = self.level_size(level)[axis]
+            view_len = min(viewport_size[axis], map_len)
+            center = (focus_box[axis] + focus_box[axis + 2]) / 2 / scale
+            start = int(round(center - view_len / 2))
+            view_size.append(view_len)
+            view_start.append(min(max(start, 0), map_len - view_len))
+        return level, (
+            view_start[0],
+            view_start[1],
+            view_start[0] + view_size[0],
+            view_start[1] + view_size[1],
+        )
+
+
+def level_size(size: ImgDimensions, level: int) -> ImgDimensions:
+    """Return the size of an image of size at a pyramid level."""
+    return (
+        max(math.ceil(size[0] / 2**level), 1),
+        max(math.ceil(size[1] / 2**level), 1),
+    )
+
+
+def build_tile_pyramid(
+    image_path: str, pyramid_dir: str, tile_size: int = TILE_SIZE
+) -> TilePyramid:
+    """Return the pyramid of image_path stored in pyramid_dir, build it if needed.
+
+    The source image is decoded once while building, the pyramid is written
+    to a temporary directory first so a partly built pyramid is never used.
+    Other pyramids next to pyramid_dir, built from older versions of the
+    image, are removed once the new one is in place.
+    """
+    if os.path.isfile(os.path.join(pyramid_dir, PYRAMID_META)):
+        return TilePyramid(pyramid_dir)
+
+    parent_dir = os.path.dirname(pyramid_dir)
+    os.makedirs(parent_dir, exist_ok=True)
+    build_dir = tempfile.mkdtemp(dir=parent_dir)
+    try:
+        with Image.open(image_path, "r") as source:
+            source = source.convert("RGBA")
+            size = source.size
+            _write_level(
+                build_dir,
+                0,
+                size,
+                tile_size,
+                lambda box: np.asarray(source.crop(box)),
+            )
+        del source
+
+        levels = 1
+        while max(level_size(size, levels - 1)) > tile_size:
+            previous = np.load(
+                os.path.join(build_dir, _level_file(levels - 1)), mmap_mode="r"
+            )
+            _write_level(
+                build_dir,
+                levels,
+                level_size(size, levels),
+                tile_size,
+                lambda box, previous=previous: _reduce_tiles(previous, box, tile_size),
+            )
+            del previous
+            levels += 1
+
+        with open(
+            os.path.join(build_dir, PYRAMID_META), "w", encoding="utf-8"
+        ) as meta_file:
+            json.dump(
+                {"size": list(size), "tile_size": tile_size, "levels": levels},
+                meta_file,
+            )
+        os.replace(build_dir, pyramid_dir)
+    except BaseException:
+        shutil.rmtree(build_dir, ignore_errors=True)
+        raise
+
+    for entry in os.scandir(parent_dir):
+        if entry.is_dir() and entry.path != pyramid_dir:
+            shutil.rmtree(entry.path, ignore_errors=True)
+    return TilePyramid(pyramid_dir)
+
+
+def _write_level(build_dir, level, size, tile_size, read_box) -> None:
+    """Write the tiles of a level, one tile at a time."""
+    rows = math.ceil(size[1] / tile_size)
+    cols = math.ceil(size[0] / tile_size)
+    tiles = np.lib.format.open_memmap(
+        os.path.join(build_dir, _level_file(level)),
+        mode="w+",
+        dtype=np.uint8,
+        shape=(rows, cols, tile_size, tile_size, 4),
+    )
+    for row in range(rows):
+        for col in range(cols):
+            left, top = col * tile_size, row * tile_size
+            pixels = read_box(
+                (
+                    left,
+                    top,
+                    min(left + tile_size, size[0]),
+                    min(top + tile_size, size[1]),
+                )
+            )
+            tiles[row, col, : pixels.shape[0], : pixels.shape[1]] = pixels
+    tiles.flush()
+    del tiles
+
+
+def _reduce_tiles(previous: np.ndarray, box: ImgBox, tile_size: int) -> np.ndarray:
+    """Return box of the next level, halving the 2x2 tiles of the previous one."""
+    row, col = box[1] // tile_size * 2, box[0] // tile_size * 2
+    block = np.zeros((2 * tile_size, 2 * tile_size, 4), dtype=np.uint8)
+    for d_row in range(2):
+        for d_col in range(2):
+            if row + d_row < previous.shape[0] and col + d_col < previous.shape[1]:
+                block[
+                    d_row * tile_size : (d_row + 1) * tile_size,
+                    d_col * tile_size : (d_col + 1) * tile_size,
+                ] = previous[row + d_row, col + d_col]
+    reduced = np.asarray(Image.fromarray(block, "RGBA").reduce(2))
+    return reduced[: box[3] - box[1], : box[2] - box[0]]
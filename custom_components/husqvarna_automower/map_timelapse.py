@@ -0,0 +1,237 @@
+"""Streaming timelapse export of the mower path."""
+
+import io
+import math
+import struct
+import zlib
+from collections.abc import Iterator
+from typing import BinaryIO
+
+from PIL import GifImagePlugin, Image
+
+from .map_layers import DirtyRectCompositor, PathLayer
+from .map_utils import MapProjection
+
+ImgBox = tuple[int, int, int, int]
+
+TIMELAPSE_FORMATS = ["gif", "apng", "webp"]
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+
+class TimelapseRenderer:
+    """Replay a position history onto the map one frame at a time.
+
+    All frames share one canvas, every frame only draws the path added and
+    the icon moved since the previous frame and reports the region that
+    changed, so writers can store just that delta.
+    """
+
+    def __init__(
+        self,
+        base_layer: Image.Image,
+        projection: MapProjection,
+        position_history: list,
+        path_color: list,
+        icon: Image.Image,
+        positions_per_frame: int = 1,
+    ) -> None:
+        """Initialize the TimelapseRenderer Object."""
+        # Oldest first, projected once
+        self._pixels = projection.project(
+            MapProjection.positions_to_array(position_history[::-1])
+        )
+        self._positions_per_frame = positions_per_frame
+        self.path_color = tuple(path_color[:3])
+        self._path_layer = PathLayer(base_layer.size, path_color)
+        self._compositor = DirtyRectCompositor(base_layer)
+        self.icon = icon
+        self._frames = self._render_frames()
+        self._frame = None
+        self.frame_index = -1
+        self.n_frames = max(math.ceil(len(self._pixels) / positions_per_frame), 1)
+
+    @property
+    def size(self) -> tuple[int, int]:
+        """Return the size of the frames."""
+        return self._compositor.image.size
+
+    def _render_frames(self) -> Iterator[tuple[Image.Image, ImgBox]]:
+        """Draw the frames in order, yield the canvas and the changed box."""
+        for index in range(self.n_frames):
+            start = index * self._positions_per_frame
+            end = min(start + self._positions_per_frame, len(self._pixels))
+            # Join up with the last position of the previous frame
+            self._path_layer.extend(self._pixels[max(start - 1, 0) : end])
+
+            icon_x, icon_y = self._pixels[end - 1].tolist()
+            icon_w, icon_h = self.icon.size
+            rebuilt = self._compositor.update(
+                [self._path_layer],
+                [(self.icon, (icon_x - icon_w // 2, icon_y - icon_h))],
+            )
+
+            if index == 0 or not rebuilt:
+                box = (0, 0) + self.size
+            else:
+                box = (
+                    min(rect[0] for rect in rebuilt),
+                    min(rect[1] for rect in rebuilt),
+                    max(rect[2] for rect in rebuilt),
+                    max(rect[3] for rect in rebuilt),
+                )
+            yield self._compositor.image, box
+
+    def frame(self, index: int) -> tuple[Image.Image, ImgBox]:
+        """Return frame index, frames are rendered in order only."""
+        while self.frame_index < index:
+            self._frame = next(self._frames)
+            self.frame_index += 1
+        if self.frame_index != index:
+            raise ValueError("Timelapse frames can only be rendered in order")
+        return self._frame
+
+    def frames(self) -> Iterator[tuple[Image.Image, ImgBox]]:
+        """Yield every frame with the box changed since the previous one."""
+        for index in range(self.n_frames):
+            yield self.frame(index)
+
+
+def gif_palette(image: Image.Image, renderer: TimelapseRenderer) -> Image.Image:
+    """Return the palette of a GIF timelapse starting with image.
+
+    The colors are taken from the map and the icon, the path color is kept
+    exact since the path only shows up in later frames.
+    """
+    icon = renderer.icon.convert("RGBA")
+    source = Image.new(
+        "RGB", (image.width + icon.width, max(image.height, icon.height))
+    )
+    source.paste(image.convert("RGB"), (0, 0))
+    source.paste(icon, (image.width, 0), icon)
+    palette = source.quantize(colors=255, dither=Image.Dither.NONE)
+    colors = palette.getpalette()[: 255 * 3]
+    colors += [0] * (255 * 3 - len(colors)) + list(renderer.path_color)
+    palette.putpalette(colors)
+    # Back to the map size, the palette image also makes the GIF header
+    return palette.crop((0, 0) + image.size)
+
+
+def write_gif(fp: BinaryIO, renderer: TimelapseRenderer, duration: int) -> None:
+    """Write an animated GIF, every frame holds only the changed box."""
+    palette = None
+    for image, box in renderer.frames():
+        delta = image.crop(box).convert("RGB")
+        if palette is None:
+            # The first frame is the whole map, its colors are used throughout
+            palette = gif_palette(delta, renderer)
+            header, _ = GifImagePlugin.getheader(palette.copy(), info={"loop": 0})
+            fp.write(b"".join(header))
+        delta = delta.quantize(palette=palette, dither=Image.Dither.NONE)
+        for data in GifImagePlugin.getdata(delta, box[:2], duration=duration):
+            fp.write(data)
+    fp.write(b";")
+
+
+def _png_chunk(chunk_type: bytes, data: bytes) -> bytes:
+    """Return a PNG chunk."""
+    return (
+        struct.pack(">I", len(data))
+        + chunk_type
+        + data
+        + struct.pack(">I", zlib.crc32(chunk_type + data))
+    )
+
+
+def _png_chunks(png: bytes) -> Iterator[tuple[bytes, bytes]]:
+    """Yield the type and data of the chunks of a PNG file."""
+    pos = len(PNG_SIGNATURE)
+    while pos < len(png):
+        (length,) = struct.unpack(">I", png[pos : pos + 4])
+        yield png[pos + 4 : pos + 8], png[pos + 8 : pos + 8 + length]
+        pos += length + 12
+
+
+def write_apng(fp: BinaryIO, renderer: TimelapseRenderer, duration: int) -> None:
+    """Write an animated PNG, every frame holds only the changed box."""
+    sequence = 0
+    for index, (image, box) in enumerate(renderer.frames()):
+        encoded = io.BytesIO()
+        image.crop(box).save(encoded, format="PNG")
+        chunks = list(_png_chunks(encoded.getvalue()))
+
+        if index == 0:
+            fp.write(PNG_SIGNATURE)
+            fp.write(_png_chunk(b"IHDR", chunks[0][1]))
+            # Number of frames, loop forever
+            fp.write(_png_chunk(b"acTL", struct.pack(">II", renderer.n_frames, 0)))
+
+        fp.write(
+            _png_chunk(
+                b"fcTL",
+                struct.pack(
+                    ">IIIIIHHBB",
+                    sequence,
+                    box[2] - box[0],
+                    box[3] - box[1],
+                    box[0],
+                    box[1],
+                    duration,
+                    1000,
+                    0,  # Dispose none, the next delta draws on top
+                    0,  # Replace the region
+                ),
+            )
+        )
+        sequence += 1
+
+        for chunk_type, data in chunks:
+            if chunk_type != b"IDAT":
+                continue
+            if index == 0:
+                fp.write(_png_chunk(b"IDAT", data))
+            else:
+                fp.write(_png_chunk(b"fdAT", struct.pack(">I", sequence) + data))
+                sequence += 1
+    fp.write(_png_chunk(b"IEND", b""))
+
+
+class _LazyFrame:
+    """Stand-in for a frame image, rendered when the encoder reads it."""
+
+    n_frames = 1
+
+    def __init__(self, renderer: TimelapseRenderer, index: int) -> None:
+        """Initialize the _LazyFrame Object."""
+        self._renderer = renderer
+        self._index = index
+
+    def __getattr__(self, name: str):
+        """Render the frame and read from it."""
+        image, _ = self._renderer.frame(self._index)
+        return getattr(image, name)
+
+
+def write_webp(fp: BinaryIO, renderer: TimelapseRenderer, duration: int) -> None:
+    """Write an animated WebP, frames are rendered as the encoder reads them."""
+    first_frame, _ = renderer.frame(0)
+    first_frame.save(
+        fp,
+        format="WEBP",
+        save_all=True,
+        append_images=[
+            _LazyFrame(renderer, index) for index in range(1, renderer.n_frames)
+        ],
+        duration=duration,
+        loop=0,
+        method=0,
+        # Only the first frame is a key frame, the rest are small deltas
+        kmin=0,
+        kmax=0,
+    )
+
+
+TIMELAPSE_WRITERS = {
+    "gif": write_gif,
+    "apng": write_apng,
+    "webp": write_webp,
+}
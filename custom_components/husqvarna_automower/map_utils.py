@@ -1,10 +1,18 @@
-"""Utilities for parsing and validating coordinates."""
+"""Utilities for parsing, validating and projecting coordinates."""
+import math
 
+import numpy as np
+from geopy.distance import geodesic
 from PIL import Image, UnidentifiedImageError
 from shapely.geometry import Point, Polygon
 
 LAT_LON_BOUNDS = Polygon.from_bounds(xmin=-90.0, ymin=-180.0, xmax=90.0, ymax=180.0)
 
+# WGS84 ellipsoid
+WGS84_A = 6378137.0  # Semi-major axis in meters
+WGS84_F = 1 / 298.257223563  # Flattening
+WGS84_E2 = WGS84_F * (2 - WGS84_F)  # First eccentricity squared
+
 
 def validate_rotation(rotation: float) -> float:
     """Ensure rotation is in degrees."""
@@ -17,6 +25,17 @@ def validate_rotation(rotation: float) -> float:
         return False
 
 
+def validate_frame_rate(frame_rate: float) -> bool:
+    """Ensure frame rate is a positive number of frames per second."""
+    try:
+        frame_rate = float(frame_rate)
+        if 0 < frame_rate <= 10:
+            return True
+        return False
+    except (TypeError, ValueError):
+        return False
+
+
 def validate_image(img_path: str) -> bool:
     """Ensure image is valid."""
     try:
@@ -107,3 +126,121 @@ class ValidatePointString:
     def point(self) -> Point:
         """Return parsed point."""
         return self.coord.point
+
+
+def segment_lengths(lat_lon) -> np.ndarray:
+    """Return the meters between consecutive pairs of an (n, 2) lat/lon array.
+
+    Each segment is measured on the tangent plane at its midpoint, which is
+    well within GPS accuracy over the distances between mower positions.
+    """
+    lat_lon = np.asarray(lat_lon, dtype=float).reshape(-1, 2)
+    lat_mid = np.radians((lat_lon[1:, 0] + lat_lon[:-1, 0]) / 2)
+    sin_lat_sq = np.sin(lat_mid) ** 2
+    radius_m = WGS84_A * (1 - WGS84_E2) / (1 - WGS84_E2 * sin_lat_sq) ** 1.5
+    radius_n = WGS84_A / np.sqrt(1 - WGS84_E2 * sin_lat_sq)
+    delta = np.radians(np.diff(lat_lon, axis=0))
+    return np.hypot(delta[:, 0] * radius_m, delta[:, 1] * radius_n * np.cos(lat_mid))
+
+
+class MapProjection:
+    """Project WGS84 coordinates onto the pixels of a map image.
+
+    The transform is a local tangent plane around the image center, so all
+    trigonometry is done once and positions are projected in a single NumPy
+    pass. Over the extent of a lawn the error against the geodesic solution
+    is well below a pixel.
+    """
+
+    def __init__(
+        self,
+        center_wgs84: tuple[float, float],
+        center_px: tuple[int, int],
+        px_meter: float,
+        rotation: float = 0,
+    ) -> None:
+        """Initialize the MapProjection Object."""
+        self.center_wgs84 = center_wgs84
+        self.center_px = center_px
+        self.px_meter = px_meter
+        self.rotation = rotation
+
+        lat_0 = math.radians(center_wgs84[0])
+        sin_lat_sq = math.sin(lat_0) ** 2
+        # Meridional and prime vertical radii of curvature at the center
+        radius_m = WGS84_A * (1 - WGS84_E2) / (1 - WGS84_E2 * sin_lat_sq) ** 1.5
+        radius_n = WGS84_A / math.sqrt(1 - WGS84_E2 * sin_lat_sq)
+        m_per_deg_lat = math.radians(radius_m)
+        m_per_deg_lon = math.radians(radius_n * math.cos(lat_0))
+
+        # Pixels per degree, with the map rotation folded in
+        cos_rot = math.cos(math.radians(rotation))
+        sin_rot = math.sin(math.radians(rotation))
+        self._transform = np.array(
+            [
+                [
+                    px_meter * m_per_deg_lat * sin_rot,
+                    -px_meter * m_per_deg_lat * cos_rot,
+                ],
+                [
+                    px_meter * m_per_deg_lon * cos_rot,
+                    px_meter * m_per_deg_lon * sin_rot,
+                ],
+            ]
+        )
+
+    @classmethod
+    def from_corners(
+        cls,
+        top_left: tuple[float, float],
+        bottom_right: tuple[float, float],
+        size: tuple[int, int],
+        rotation: float = 0,
+    ) -> "MapProjection":
+        """Return the projection onto a map image of size with the given corners."""
+        center_px = int(size[0] / 2), int(size[1] / 2)
+        center_wgs84 = (
+            (top_left[0] + bottom_right[0]) / 2,
+            (top_left[1] + bottom_right[1]) / 2,
+        )
+        # Scale from the length of the diagonal in pixels and in meters
+        len_px = int(math.dist((0, 0), size))
+        len_wgs84_m = geodesic(top_left, bottom_right).meters
+        return cls(center_wgs84, center_px, len_px / len_wgs84_m, rotation)
+
+    def project(self, lat_lon) -> np.ndarray:
+        """Return an (n, 2) integer array of pixels for (n, 2) lat/lon pairs."""
+        lat_lon = np.asarray(lat_lon, dtype=float).reshape(-1, 2)
+        offset = lat_lon - self.center_wgs84
+        pixels = offset @ self._transform + self.center_px
+        return np.trunc(pixels).astype(int)
+
+    def scaled(self, scale: float, origin: tuple[int, int] = (0, 0)) -> "MapProjection":
+        """Return the projection onto the image scaled by scale, cropped at origin."""
+        return MapProjection(
+            self.center_wgs84,
+            (
+                self.center_px[0] * scale - origin[0],
+                self.center_px[1] * scale - origin[1],
+            ),
+            self.px_meter * scale,
+            self.rotation,
+        )
+
+    def project_point(self, lat_lon: tuple[float, float]) -> tuple[int, int]:
+        """Return the pixel for a single lat/lon pair."""
+        pixel = self.project(lat_lon)[0]
+        return int(pixel[0]), int(pixel[1])
+
+    @staticmethod
+    def positions_to_array(positions: list[dict]) -> np.ndarray:
+        """Convert a list of API positions to an (n, 2) lat/lon array."""
+        return np.fromiter(
+            (
+                coord
+                for position in positions
+                for coord in (position["latitude"], position["longitude"])
+            ),
+            dtype=float,
+            count=len(positions) * 2,
+        ).reshape(-1, 2)
@@ -65,6 +65,7 @@ class AutomowerNumber(NumberEntity, AutomowerEntity):
     _attr_native_min_value = 1
     _attr_native_max_value = 9
     _attr_translation_key = "cutting_height"
+    dependencies = ("cuttingHeight", "metadata.connected")
 
     def __init__(self, session, idx):
         """Initialize AutomowerNumber."""
@@ -106,6 +107,7 @@ class AutomowerParkStartNumberEntity(NumberEntity, AutomowerEntity):
     _attr_native_min_value: float = 1
     _attr_native_max_value: float = 60480
     _attr_native_step: float = 1
+    dependencies = ("metadata.connected",)
 
     def __init__(self, session, idx, description: NumberEntityDescription):
         """Initialize AutomowerParkStartNumberEntity."""
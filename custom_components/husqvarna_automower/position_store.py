@@ -0,0 +1,200 @@
+"""Persistent ring buffer of mower positions."""
+
+import os
+import threading
+import time
+from typing import Optional
+
+import numpy as np
+
+STORE_MAGIC = b"AMPH"
+STORE_VERSION = 1
+
+HEADER_DTYPE = np.dtype(
+    [
+        ("magic", "S4"),
+        ("version", "<u4"),
+        ("capacity", "<u8"),
+        ("count", "<u8"),
+        ("head", "<u8"),
+    ]
+)
+POSITION_DTYPE = np.dtype(
+    [
+        ("latitude", "<f8"),
+        ("longitude", "<f8"),
+        # Unix time the position was received at
+        ("recorded", "<f8"),
+    ]
+)
+
+
+class PositionStore:
+    """Fixed size, memory mapped ring buffer of the positions of one mower.
+
+    The file is a small header followed by capacity fixed width records,
+    once full the oldest positions are overwritten. Every API message
+    repeats the positions sent before, only those in front of the newest
+    stored position are appended.
+
+    Positions are appended and read in the executor, the store may be
+    closed meanwhile. A lock keeps the file mapped while it is
+    used, a closed store reads as empty.
+    """
+
+    def __init__(self, path: str, capacity: int) -> None:
+        """Initialize the PositionStore Object."""
+        self.path = path
+        self._lock = threading.RLock()
+        self._header = None
+        self._records = None
+        records = None
+        if os.path.isfile(path):
+            header = self._read_header(path)
+            if header is not None and header["capacity"] == capacity:
+                self._open(path, capacity)
+                return
+            if header is not None:
+                # Retention changed, keep the newest positions that still fit
+                self._open(path, int(header["capacity"]))
+                records = self.to_array()[-capacity:]
+                self.close()
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        part_path = f"{path}.part"
+        header = np.memmap(part_path, dtype=HEADER_DTYPE, mode="w+", shape=(1,))
+        header[0] = (STORE_MAGIC, STORE_VERSION, capacity, 0, 0)
+        header.flush()
+        del header
+        with open(part_path, "r+b") as store_file:
+            store_file.truncate(
+                HEADER_DTYPE.itemsize + capacity * POSITION_DTYPE.itemsize
+            )
+        os.replace(part_path, path)
+
+        self._open(path, capacity)
+        if records is not None and len(records):
+            self._write(records)
+            self.flush()
+
+    @staticmethod
+    def _read_header(path: str) -> Optional[np.void]:
+        """Return the header of a store file, None if it isn't one."""
+        header = np.fromfile(path, dtype=HEADER_DTYPE, count=1)
+        if (
+            len(header) != 1
+            or header[0]["magic"] != STORE_MAGIC
+            or header[0]["version"] != STORE_VERSION
+            or os.path.getsize(path)
+            != HEADER_DTYPE.itemsize
+            + int(header[0]["capacity"]) * POSITION_DTYPE.itemsize
+        ):
+            return None
+        return header[0]
+
+    def _open(self, path: str, capacity: int) -> None:
+        """Memory map the header and records of the store file."""
+        self._header = np.memmap(path, dtype=HEADER_DTYPE, mode="r+", shape=(1,))
+        self._records = np.memmap(
+            path,
+            dtype=POSITION_DTYPE,
+            mode="r+",
+            offset=HEADER_DTYPE.itemsize,
+            shape=(capacity,),
+        )
+
+    @property
+    def capacity(self) -> int:
+        """Return the number of positions kept."""
+        with self._lock:
+            return 0 if self._records is None else len(self._records)
+
+    def __len__(self) -> int:
+        """Return the number of positions stored."""
+        with self._lock:
+            return 0 if self._header is None else int(self._header[0]["count"])
+
+    def _write(self, records: np.ndarray) -> None:
+        """Write records, oldest first, after the newest stored position."""
+        records = records[-self.capacity :]
+        head = int(self._header[0]["head"])
+        self._records[(head + np.arange(len(records))) % self.capacity] = records
+        self._header[0]["head"] = (head + len(records)) % self.capacity
+        self._header[0]["count"] = min(len(self) + len(records), self.capacity)
+
+    def append(self, positions: list, recorded: Optional[float] = None) -> int:
+        """Store the positions of an API message, return how many were new.
+
+        positions is newest first, as sent by the API.
+        """
+        with self._lock:
+            if self._records is None:
+                return 0
+            return self._append(positions, recorded)
+
+    def _append(self, positions: list, recorded: Optional[float]) -> int:
+        """Store the new positions of an API message, the lock is held."""
+        new_count = len(positions)
+        if len(self):
+            newest = self._records[(int(self._header[0]["head"]) - 1) % self.capacity]
+            newest = (float(newest["latitude"]), float(newest["longitude"]))
+            for idx, position in enumerate(positions):
+                if (position["latitude"], position["longitude"]) == newest:
+                    new_count = idx
+                    break
+        if not new_count:
+            return 0
+
+        records = np.empty(new_count, dtype=POSITION_DTYPE)
+        # Oldest first
+        for idx, position in enumerate(reversed(positions[:new_count])):
+            records[idx] = (position["latitude"], position["longitude"], 0)
+        records["recorded"] = time.time() if recorded is None else recorded
+        self._write(records)
+        return new_count
+
+    def to_array(self) -> np.ndarray:
+        """Return a copy of the stored positions, oldest first."""
+        with self._lock:
+            if self._records is None:
+                return np.empty(0, dtype=POSITION_DTYPE)
+            count = len(self)
+            if count < self.capacity:
+                return np.array(self._records[:count])
+            head = int(self._header[0]["head"])
+            return np.concatenate((self._records[head:], self._records[:head]))
+
+    def positions(
+        self, start: Optional[float] = None, end: Optional[float] = None
+    ) -> list[dict]:
+        """Return the stored positions newest first, like the API sends them.
+
+        start and end limit the positions to those received in between, as
+        Unix times.
+        """
+        records = self.to_array()[::-1]
+        if start is not None:
+            records = records[records["recorded"] >= start]
+        if end is not None:
+            records = records[records["recorded"] <= end]
+        return [
+            {"latitude": latitude, "longitude": longitude}
+            for latitude, longitude in zip(
+                records["latitude"].tolist(), records["longitude"].tolist()
+            )
+        ]
+
+    def flush(self) -> None:
+        """Write changes to disk."""
+        with self._lock:
+            if self._records is None:
+                return
+            self._records.flush()
+            self._header.flush()
+
+    def close(self) -> None:
+        """Write changes to disk and unmap the file, once no one reads it."""
+        with self._lock:
+            self.flush()
+            self._records = None
+            self._header = None
@@ -37,6 +37,7 @@ class AutomowerSelect(SelectEntity, AutomowerEntity):
     _attr_icon = "mdi:car-light-high"
     _attr_entity_category = EntityCategory.CONFIG
     _attr_translation_key = "headlight_mode"
+    dependencies = ("headlight.mode", "metadata.connected")
 
     def __init__(self, session, idx):
         """Initialize AutomowerSelect."""
@@ -1,8 +1,9 @@
 """Creates a sensor entity for the mower."""
-import json
 import logging
+import time
 from collections.abc import Callable
 from dataclasses import dataclass
+from typing import Optional
 
 from homeassistant.components.sensor import (
     SensorDeviceClass,
@@ -12,28 +13,43 @@ from homeassistant.components.sensor import (
 )
 from homeassistant.config_entries import ConfigEntry
 from homeassistant.const import PERCENTAGE, UnitOfLength, UnitOfTime
-from homeassistant.core import HomeAssistant
+from homeassistant.core import HomeAssistant, callback
 from homeassistant.helpers.entity import EntityCategory
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
-from shapely.geometry import Point, Polygon
+from homeassistant.helpers.storage import Store
+from PIL import Image
 
 from .const import (
     CONF_ZONES,
+    DEFAULT_ZONE_HYSTERESIS,
+    DEFAULT_ZONE_LOOKUP,
     DOMAIN,
     ERROR_ACTIVITIES,
     ERROR_STATES,
     ERRORCODES,
+    EVENT_ZONE_ENTERED,
+    EVENT_ZONE_LEFT,
+    GPS_BOTTOM_RIGHT,
+    GPS_TOP_LEFT,
     HOME_LOCATION,
+    MAP_IMG_PATH,
+    MAP_IMG_ROTATION,
     NO_SUPPORT_FOR_CHANGING_CUTTING_HEIGHT,
-    ZONE_COORD,
+    ZONE_HYSTERESIS,
     ZONE_ID,
-    ZONE_MOWERS,
+    ZONE_LOOKUP,
+    ZONE_LOOKUP_RASTER,
     ZONE_NAME,
 )
 from .entity import AutomowerEntity
+from .map_utils import MapProjection
+from .zones import ZONE_ENTERED, ZoneIndex, ZoneMask, ZoneTracker
 
 _LOGGER = logging.getLogger(__name__)
 
+DWELL_STORAGE_VERSION = 1
+DWELL_SAVE_DELAY = 60  # Seconds
+
 
 @dataclass
 class AutomowerSensorRequiredKeysMixin:
@@ -49,6 +65,8 @@ class AutomowerSensorEntityDescription(
 ):
     """Describes a sensor sensor entity."""
 
+    dependencies: Optional[tuple[str, ...]] = None
+
 
 def get_problem(mower_attributes) -> dict:
     """Get the mower attributes of the current mower."""
@@ -106,6 +124,7 @@ SENSOR_TYPES: tuple[SensorEntityDescription, ...] = (
         native_unit_of_measurement=UnitOfTime.SECONDS,
         value_fn=lambda data: data["statistics"]["cuttingBladeUsageTime"],
         available_fn=lambda data: True,
+        dependencies=("statistics.cuttingBladeUsageTime",),
     ),
     AutomowerSensorEntityDescription(
         key="totalChargingTime",
@@ -118,6 +137,7 @@ SENSOR_TYPES: tuple[SensorEntityDescription, ...] = (
         native_unit_of_measurement=UnitOfTime.SECONDS,
         value_fn=lambda data: data["statistics"]["totalChargingTime"],
         available_fn=lambda data: True,
+        dependencies=("statistics.totalChargingTime",),
     ),
     AutomowerSensorEntityDescription(
         key="totalCuttingTime",
@@ -130,6 +150,7 @@ SENSOR_TYPES: tuple[SensorEntityDescription, ...] = (
         native_unit_of_measurement=UnitOfTime.SECONDS,
         value_fn=lambda data: data["statistics"]["totalCuttingTime"],
         available_fn=lambda data: True,
+        dependencies=("statistics.totalCuttingTime",),
     ),
     AutomowerSensorEntityDescription(
         key="totalRunningTime",
@@ -142,6 +163,7 @@ SENSOR_TYPES: tuple[SensorEntityDescription, ...] = (
         native_unit_of_measurement=UnitOfTime.SECONDS,
         value_fn=lambda data: data["statistics"]["totalRunningTime"],
         available_fn=lambda data: True,
+        dependencies=("statistics.totalRunningTime",),
     ),
     AutomowerSensorEntityDescription(
         key="totalSearchingTime",
@@ -154,6 +176,7 @@ SENSOR_TYPES: tuple[SensorEntityDescription, ...] = (
         native_unit_of_measurement=UnitOfTime.SECONDS,
         value_fn=lambda data: data["statistics"]["totalSearchingTime"],
         available_fn=lambda data: True,
+        dependencies=("statistics.totalSearchingTime",),
     ),
     AutomowerSensorEntityDescription(
         key="numberOfChargingCycles",
@@ -164,6 +187,7 @@ SENSOR_TYPES: tuple[SensorEntityDescription, ...] = (
         state_class=SensorStateClass.TOTAL_INCREASING,
         value_fn=lambda data: data["statistics"]["numberOfChargingCycles"],
         available_fn=lambda data: True,
+        dependencies=("statistics.numberOfChargingCycles",),
     ),
     AutomowerSensorEntityDescription(
         key="numberOfCollisions",
@@ -174,6 +198,7 @@ SENSOR_TYPES: tuple[SensorEntityDescription, ...] = (
         state_class=SensorStateClass.TOTAL_INCREASING,
         value_fn=lambda data: data["statistics"]["numberOfCollisions"],
         available_fn=lambda data: True,
+        dependencies=("statistics.numberOfCollisions",),
     ),
     AutomowerSensorEntityDescription(
         key="totalSearchingTime_percentage",
@@ -188,6 +213,7 @@ SENSOR_TYPES: tuple[SensorEntityDescription, ...] = (
         / data["statistics"]["totalRunningTime"]
         * 100,
         available_fn=lambda data: True,
+        dependencies=("statistics.totalSearchingTime", "statistics.totalRunningTime"),
     ),
     AutomowerSensorEntityDescription(
         key="totalCuttingTime_percentage",
@@ -202,6 +228,7 @@ SENSOR_TYPES: tuple[SensorEntityDescription, ...] = (
         / data["statistics"]["totalRunningTime"]
         * 100,
         available_fn=lambda data: True,
+        dependencies=("statistics.totalCuttingTime", "statistics.totalRunningTime"),
     ),
     AutomowerSensorEntityDescription(
         key="battery_level",
@@ -215,6 +242,7 @@ SENSOR_TYPES: tuple[SensorEntityDescription, ...] = (
         if (data["battery"]["batteryPercent"] == 0)
         and (data["metadata"]["connected"] is False)
         else True,
+        dependencies=("battery.batteryPercent", "metadata.connected"),
     ),
     AutomowerSensorEntityDescription(
         key="next_start",
@@ -225,6 +253,7 @@ SENSOR_TYPES: tuple[SensorEntityDescription, ...] = (
             data, data["planner"]["nextStartTimestamp"]
         ),
         available_fn=lambda data: True,
+        dependencies=("planner.nextStartTimestamp",),
     ),
     AutomowerSensorEntityDescription(
         key="mode",
@@ -234,6 +263,7 @@ SENSOR_TYPES: tuple[SensorEntityDescription, ...] = (
         options=["main_area", "secondary_area", "home", "demo", "unknown"],
         value_fn=lambda data: data["mower"]["mode"].lower(),
         available_fn=lambda data: True,
+        dependencies=("mower.mode",),
     ),
     AutomowerSensorEntityDescription(
         key="problem_sensor",
@@ -245,6 +275,7 @@ SENSOR_TYPES: tuple[SensorEntityDescription, ...] = (
         if get_problem(data) is None
         else get_problem(data).lower(),
         available_fn=lambda data: True,
+        dependencies=("mower", "planner.restrictedReason"),
     ),
     AutomowerSensorEntityDescription(
         key="cuttingHeight",
@@ -254,6 +285,7 @@ SENSOR_TYPES: tuple[SensorEntityDescription, ...] = (
         state_class=SensorStateClass.MEASUREMENT,
         value_fn=lambda data: data["cuttingHeight"],
         available_fn=lambda data: True,
+        dependencies=("cuttingHeight",),
     ),
     AutomowerSensorEntityDescription(
         key="totalDriveDistance",
@@ -265,6 +297,7 @@ SENSOR_TYPES: tuple[SensorEntityDescription, ...] = (
         native_unit_of_measurement=UnitOfLength.METERS,
         value_fn=lambda data: data["statistics"]["totalDriveDistance"],
         available_fn=lambda data: True,
+        dependencies=("statistics.totalDriveDistance",),
     ),
 )
 
@@ -314,54 +347,268 @@ class AutomowerZoneSensor(SensorEntity, AutomowerEntity):
 
     _attr_entity_category = EntityCategory.DIAGNOSTIC
     _attr_translation_key = "zone"
+    dependencies = ("positions", "mower.activity")
 
     def __init__(self, coordinator, idx, entry):
         """Initialize the zone object."""
         super().__init__(coordinator, idx)
         self._attr_unique_id = f"{self.mower_id}_zone_sensor"
         self.entry = entry
+        self._zone_registry = coordinator.zone_registry
+        self._zone_index = None
+        self._zone_mask = None
+        self._mask_task = None
+        self._mask_options = None
+        self._evaluated_at = None
+        self._last_position = None
+        self._last_received = None
+        self.zone_stats = {"evaluations": 0, "evaluations_skipped": 0}
         self.zones = self._load_zones()
-        self.home_location = self.entry.options.get(self.mower_id, {}).get(
-            HOME_LOCATION, None
+        mower_options = self.entry.options.get(self.mower_id, {})
+        self.home_location = mower_options.get(HOME_LOCATION, None)
+        self._zone_tracker = ZoneTracker(
+            mower_options.get(ZONE_HYSTERESIS, DEFAULT_ZONE_HYSTERESIS)
         )
+        self._dwell_store = None
         self.zone = {ZONE_NAME: "Unknown"}
         self.zone_id = "unknown"
 
     def _load_zones(self):
-        """Load zones from a config entry."""
-        zones = json.loads(self.entry.options.get(CONF_ZONES, "{}"))
-        if not isinstance(zones, dict):
-            return {}
-        sel_zones = {}
-        for zone_id, zone in zones.items():
-            if self.mower_id in zone.get(ZONE_MOWERS):
-                sel_zones[zone_id] = zone
+        """Load the zones of this mower from the zone registry."""
+        self._zone_index = self._zone_registry.index_for(self.mower_id)
+        self._zone_mask = None
+        self._evaluated_at = None
+        return self._zone_index.zones
+
+    async def async_added_to_hass(self) -> None:
+        """Call when entity about to be added to Home Assistant."""
+        # Dwell times and the zone the mower was in carry over restarts
+        self._dwell_store = Store(
+            self.hass, DWELL_STORAGE_VERSION, f"{DOMAIN}_zone_dwell.{self.mower_id}"
+        )
+        stored_dwell = await self._dwell_store.async_load()
+        if stored_dwell is not None:
+            self._zone_tracker.restore(stored_dwell)
+        await super().async_added_to_hass()
+        self.async_on_remove(
+            self._zone_registry.add_listener(self._async_zones_changed)
+        )
+        # Options are applied here, the sensor platform isn't reloaded
+        self.async_on_remove(self.entry.add_update_listener(self._async_entry_updated))
+        # Reported in diagnostics while the entity exists
+        zone_stats = self.coordinator.sensor_platform_stats["zone_stats"]
+        zone_stats[self.unique_id] = self.zone_stats
+        self.async_on_remove(lambda: zone_stats.pop(self.unique_id, None))
+        self._async_load_zone_mask()
+        self._find_current_zone()
+
+    @callback
+    def _handle_mower_update(self) -> None:
+        """Follow the zones of the new positions and write the state."""
+        self._find_current_zone()
+        self.async_write_ha_state()
+
+    @callback
+    def _async_zones_changed(self) -> None:
+        """Find the zone again once the zones changed and write the state."""
+        self._find_current_zone()
+        if self.platform is not None:
+            self.async_write_ha_state()
+
+    async def _async_entry_updated(
+        self, hass: HomeAssistant, entry: ConfigEntry
+    ) -> None:
+        """Apply the changed options of the mower."""
+        mower_options = entry.options.get(self.mower_id, {})
+        self.home_location = mower_options.get(HOME_LOCATION, None)
+        self._zone_tracker.hysteresis = mower_options.get(
+            ZONE_HYSTERESIS, DEFAULT_ZONE_HYSTERESIS
+        )
+        # The zones are looked up again with the next update of the mower
+        if self._zone_mask_options() != self._mask_options:
+            self._async_load_zone_mask()
+            self._evaluated_at = None
+
+    async def async_will_remove_from_hass(self) -> None:
+        """Call when entity is being removed from Home Assistant."""
+        await super().async_will_remove_from_hass()
+        if self._mask_task is not None:
+            self._mask_task.cancel()
+
+    def _zone_mask_options(self) -> Optional[dict]:
+        """Return the map options a zone mask is built from.
+
+        None if the mower doesn't use raster lookups.
+        """
+        mower_options = self.entry.options.get(self.mower_id, {})
+        if mower_options.get(ZONE_LOOKUP, DEFAULT_ZONE_LOOKUP) != ZONE_LOOKUP_RASTER:
+            return None
+        return {
+            MAP_IMG_PATH: mower_options.get(MAP_IMG_PATH),
+            GPS_TOP_LEFT: mower_options.get(GPS_TOP_LEFT),
+            GPS_BOTTOM_RIGHT: mower_options.get(GPS_BOTTOM_RIGHT),
+            MAP_IMG_ROTATION: mower_options.get(MAP_IMG_ROTATION, 0),
+        }
+
+    @callback
+    def _async_load_zone_mask(self) -> None:
+        """Rasterize the zones in the background if raster lookups are enabled.
+
+        A mask built for other zones or another map is dropped first.
+        """
+        self._zone_mask = None
+        self._mask_options = self._zone_mask_options()
+        if self._mask_task is not None:
+            self._mask_task.cancel()
+            self._mask_task = None
+        if self._mask_options is None:
+            return
+        if not (
+            self._mask_options[GPS_TOP_LEFT]
+            and self._mask_options[GPS_BOTTOM_RIGHT]
+            and self._mask_options[MAP_IMG_PATH]
+        ):
+            _LOGGER.warning(
+                "Raster zone lookup of %s needs a map, using polygons", self.mower_id
+            )
+            return
 
-        return sel_zones
+        # Polygons answer lookups until the mask is ready
+        self._mask_task = self.hass.async_create_background_task(
+            self._async_build_zone_mask(self._zone_index, self._mask_options),
+            f"{DOMAIN} rasterize zones of {self.mower_id}",
+        )
+
+    async def _async_build_zone_mask(
+        self, zone_index: ZoneIndex, mask_options: dict
+    ) -> None:
+        """Build the zone mask in the executor."""
+        try:
+            zone_mask = await self.hass.async_add_executor_job(
+                self._build_zone_mask, zone_index.zones, mask_options
+            )
+        except OSError as error:
+            _LOGGER.warning(
+                "Unable to rasterize the zones of %s: %s", self.mower_id, error
+            )
+            return
+        finally:
+            if self._mask_options is mask_options:
+                self._mask_task = None
+        if zone_index is self._zone_index and mask_options is self._mask_options:
+            self._zone_mask = zone_mask
+            self._evaluated_at = None
+
+    def _build_zone_mask(self, zones: dict, mask_options: dict) -> ZoneMask:
+        """Rasterize zones at the size of the map image."""
+        with Image.open(mask_options[MAP_IMG_PATH]) as map_image:
+            size = map_image.size
+        projection = MapProjection.from_corners(
+            mask_options[GPS_TOP_LEFT],
+            mask_options[GPS_BOTTOM_RIGHT],
+            size,
+            mask_options[MAP_IMG_ROTATION],
+        )
+        return ZoneMask.for_map(zones, projection, size)
 
     def _find_current_zone(self):
-        """Find current zone."""
+        """Find current zone, unless the mower didn't move since the last time.
+
+        Runs when the data of the mower changed, the state only reads the
+        zone found.
+        """
+        if self._zone_registry.index_for(self.mower_id) is not self._zone_index:
+            self.zones = self._load_zones()
+            if self.hass is not None:
+                self._async_load_zone_mask()
+
+        # Most updates of the mower don't move it
+        positions = AutomowerEntity.get_mower_attributes(self)["positions"]
+        position = positions[0]
+        evaluated_at = (position["latitude"], position["longitude"], self.is_home)
+        if evaluated_at == self._evaluated_at:
+            self.zone_stats["evaluations_skipped"] += 1
+            return
+        self._evaluated_at = evaluated_at
+        self.zone_stats["evaluations"] += 1
+
+        # Every position received since the last evaluation, in one pass
+        new_positions = self._new_positions(positions)
+        zone_lookup = (
+            self._zone_mask if self._zone_mask is not None else self._zone_index
+        )
+        labels = zone_lookup.find_many(
+            MapProjection.positions_to_array(new_positions[::-1])
+        )
+        zone_ids = [
+            zone_lookup.zone_ids[label] if label >= 0 else None
+            for label in labels.tolist()
+        ]
+
         if self.is_home and self.home_location:
             self.zone = {ZONE_NAME: "Home"}
             self.zone_id = "home"
+            zone_ids[-1] = None
+        elif zone_ids[-1] is not None:
+            self.zone = self.zones[zone_ids[-1]]
+            self.zone_id = zone_ids[-1]
+        else:
+            self.zone = {ZONE_NAME: "Unknown"}
+            self.zone_id = "unknown"
+        self._track_zones(zone_ids)
+
+    def _new_positions(self, positions: list[dict]) -> list[dict]:
+        """Return the positions added since the last call, newest first.
+
+        At least the newest position is returned. The history before the
+        first call isn't replayed.
+        """
+        try:
+            new_count = positions.index(self._last_position)
+        except ValueError:
+            new_count = 1
+        self._last_position = dict(positions[0])
+        return positions[: max(new_count, 1)]
+
+    def _track_zones(self, zone_ids: list[Optional[str]]) -> None:
+        """Follow the zones of new positions, firing entered and left events.
+
+        zone_ids is oldest first. Positions come without the time they were
+        taken at, those received together are spread evenly over the time
+        since the previous update.
+        """
+        received = time.time()
+        previous = received if self._last_received is None else self._last_received
+        self._last_received = received
+        step = (received - previous) / len(zone_ids)
+        transitions = [
+            transition
+            for idx, zone_id in enumerate(zone_ids, 1)
+            for transition in self._zone_tracker.update(zone_id, previous + idx * step)
+        ]
+        if self.hass is None:
             return
-
-        lat = AutomowerEntity.get_mower_attributes(self)["positions"][0]["latitude"]
-        lon = AutomowerEntity.get_mower_attributes(self)["positions"][0]["longitude"]
-        location = Point(lat, lon)
-        for zone_id, zone in self.zones.items():
-            zone_poly = Polygon(zone.get(ZONE_COORD))
-            if zone_poly.contains(location):
-                self.zone = zone
-                self.zone_id = zone_id
-                return
-        self.zone = {ZONE_NAME: "Unknown"}
-        self.zone_id = "unknown"
+        for transition, transition_zone_id, visit_dwell in transitions:
+            self.hass.bus.async_fire(
+                EVENT_ZONE_ENTERED if transition == ZONE_ENTERED else EVENT_ZONE_LEFT,
+                {
+                    "mower_id": self.mower_id,
+                    ZONE_ID: transition_zone_id,
+                    ZONE_NAME: self.zones.get(transition_zone_id, {}).get(ZONE_NAME),
+                    "dwell_time": visit_dwell,
+                    "total_dwell_time": self._zone_tracker.dwell.get(
+                        transition_zone_id, 0.0
+                    ),
+                },
+            )
+        if self._dwell_store is not None:
+            self._dwell_store.async_delay_save(
+                self._zone_tracker.as_dict, DWELL_SAVE_DELAY
+            )
 
     @property
     def native_value(self) -> str:
         """Return a the current zone of the mower."""
-        self._find_current_zone()
         return self.zone.get(ZONE_NAME)
 
     @property
@@ -379,6 +626,7 @@ class AutomowerSensor(SensorEntity, AutomowerEntity):
         """Set up AutomowerSensors."""
         super().__init__(session, idx)
         self.entity_description = description
+        self.dependencies = description.dependencies
         self._attr_unique_id = f"{self.mower_id}_{description.key}"
 
     @property
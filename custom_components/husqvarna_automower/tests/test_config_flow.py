@@ -1,4 +1,5 @@
 """Tests for config flow module."""
+import json
 from unittest.mock import AsyncMock, MagicMock, patch
 
 from homeassistant.config_entries import ConfigEntryState
@@ -8,11 +9,13 @@ from pytest_homeassistant_custom_component.common import MockConfigEntry
 
 from ..const import (
     ADD_IMAGES,
+    CONF_ZONES,
     DOMAIN,
     ENABLE_IMAGE,
     GPS_BOTTOM_RIGHT,
     GPS_TOP_LEFT,
     HOME_LOCATION,
+    MAP_FRAME_RATE,
     MAP_IMG_PATH,
     MAP_IMG_ROTATION,
     MAP_PATH_COLOR,
@@ -336,6 +339,19 @@ async def test_options_image_config(hass: HomeAssistant) -> None:
 
         assert result["errors"] == {MAP_IMG_ROTATION: "rotation_error"}
 
+        # Enable Image, provide valid points, bad frame rate
+        result = await hass.config_entries.options.async_configure(
+            result["flow_id"],
+            {
+                ENABLE_IMAGE: True,
+                GPS_BOTTOM_RIGHT: "35.539442,-82.5504646",
+                GPS_TOP_LEFT: "35.5411008,-82.5527418",
+                MAP_FRAME_RATE: 0,
+            },
+        )
+
+        assert result["errors"] == {MAP_FRAME_RATE: "frame_rate_error"}
+
         # Enable Image, provide valid corner points, bad home point
         result = await hass.config_entries.options.async_configure(
             result["flow_id"],
@@ -552,3 +568,66 @@ async def test_options_zone_config(hass: HomeAssistant) -> None:
             {"label": ZONE_NEW, "value": ZONE_NEW},
             {"label": ZONE_FINISH, "value": ZONE_FINISH},
         ]
+
+
+async def test_options_zone_config_invalid_zone(hass: HomeAssistant) -> None:
+    """Test zones without enough points are kept by the zone editor."""
+    zones = {
+        "front_garden": {
+            ZONE_COORD: [
+                [35.5408367, -82.5524521],
+                [35.5403893, -82.552613],
+                [35.5399462, -82.5506738],
+            ],
+            ZONE_NAME: "Front Garden",
+            ZONE_MOWERS: [MWR_ONE_ID],
+        },
+        "unfinished": {
+            ZONE_COORD: [[35.5408367, -82.5524521]],
+            ZONE_NAME: "Unfinished",
+            ZONE_MOWERS: [MWR_ONE_ID],
+        },
+    }
+    config_entry = MockConfigEntry(
+        domain=DOMAIN,
+        data=AUTOMOWER_CONFIG_DATA,
+        options={CONF_ZONES: json.dumps(zones)},
+        entry_id="automower_test",
+        title="Automower Test",
+    )
+    with patch(
+        "aioautomower.AutomowerSession",
+        return_value=AsyncMock(
+            register_token_callback=MagicMock(),
+            connect=AsyncMock(),
+            data=AUTOMOWER_DM_SESSION_DATA,
+            register_data_callback=MagicMock(),
+            unregister_data_callback=MagicMock(),
+        ),
+    ):
+        config_entry.add_to_hass(hass)
+        assert await hass.config_entries.async_setup(config_entry.entry_id)
+        await hass.async_block_till_done()
+
+        result = await hass.config_entries.options.async_init(config_entry.entry_id)
+        result = await hass.config_entries.options.async_configure(
+            result["flow_id"], {"next_step_id": "geofence_init"}
+        )
+        assert result["data_schema"].schema[ZONE_SEL].config["options"] == [
+            {"label": ZONE_NEW, "value": ZONE_NEW},
+            {"label": "Front Garden", "value": "front_garden"},
+            {"label": "Unfinished", "value": "unfinished"},
+            {"label": ZONE_FINISH, "value": ZONE_FINISH},
+        ]
+
+        # Deleting another zone keeps it
+        result = await hass.config_entries.options.async_configure(
+            result["flow_id"], {ZONE_SEL: "front_garden"}
+        )
+        result = await hass.config_entries.options.async_configure(
+            result["flow_id"], {ZONE_DEL: True}
+        )
+        assert result["step_id"] == "geofence_init"
+        assert json.loads(config_entry.options[CONF_ZONES]) == {
+            "unfinished": zones["unfinished"]
+        }
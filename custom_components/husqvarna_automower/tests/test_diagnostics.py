@@ -7,11 +7,18 @@ from pytest_homeassistant_custom_component.common import MockConfigEntry
 
 from ..const import DOMAIN
 from ..diagnostics import TO_REDACT, async_get_config_entry_diagnostics
-from .const import AUTOMER_SM_CONFIG, AUTOMOWER_CONFIG_DATA
+from ..position_store import PositionStore
+from .const import (
+    AUTOMER_SM_CONFIG,
+    AUTOMOWER_CONFIG_DATA,
+    FRONT_GARDEN_PNT,
+    MWR_ONE_ID,
+    NO_ZONE_PNT,
+)
 
 
 @pytest.mark.asyncio
-async def test_redact(hass: HomeAssistant):
+async def test_redact(hass: HomeAssistant, tmp_path):
     """test automower initialization"""
 
     config_entry = MockConfigEntry(
@@ -31,6 +38,29 @@ async def test_redact(hass: HomeAssistant):
         await hass.async_block_till_done()
 
         diag_data = await async_get_config_entry_diagnostics(hass, config_entry)
+        assert diag_data["image_platform"]["setup_time"] > 0
+        assert "render_stats" in diag_data["image_platform"]
+        assert "zone_stats" in diag_data["sensor_platform"]
+        assert diag_data["zone_statistics"] == {}
+
+        # Statistics per zone of the stored position history
+        store = PositionStore(str(tmp_path / "positions.bin"), 1000)
+        for recorded, (lat, lon) in enumerate(
+            [
+                NO_ZONE_PNT,
+                FRONT_GARDEN_PNT,
+                (FRONT_GARDEN_PNT[0] + 1e-4, FRONT_GARDEN_PNT[1]),
+            ]
+        ):
+            store.append([{"latitude": lat, "longitude": lon}], recorded * 10.0)
+        coordinator = hass.data[DOMAIN][config_entry.entry_id]
+        coordinator.position_stores[MWR_ONE_ID] = store
+        diag_data = await async_get_config_entry_diagnostics(hass, config_entry)
+        front_garden = diag_data["zone_statistics"][MWR_ONE_ID]["front_garden"]
+        assert front_garden["positions"] == 2
+        assert front_garden["time"] == 20.0
+        assert front_garden["distance"] > 11
+        store.close()
 
         redacted = []
         for k, v in diag_data.get("config_entry").get("data").items():
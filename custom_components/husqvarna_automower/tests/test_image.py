@@ -1,7 +1,7 @@
 """Tests for image module."""
 import asyncio
 import io
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
 from unittest.mock import AsyncMock, MagicMock, patch
 
@@ -9,19 +9,37 @@ import PIL.Image as Image
 import pytest
 from aioautomower import AutomowerSession
 from homeassistant.core import HomeAssistant
-from pytest_homeassistant_custom_component.common import MockConfigEntry
+from homeassistant.exceptions import HomeAssistantError
+from homeassistant.util import dt as dt_util
+from PIL import ImageChops
+from pytest_homeassistant_custom_component.common import (
+    MockConfigEntry,
+    async_fire_time_changed,
+)
 
-from ..image import AutomowerImage
-from ..const import CONF_ZONES, DOMAIN, ENABLE_IMAGE
+from ..const import (
+    CONF_ZONES,
+    DOMAIN,
+    ENABLE_IMAGE,
+    MAP_BACKEND,
+    MAP_BACKEND_FULL,
+    MAP_BACKEND_TILED,
+    MAP_COVERAGE,
+    MAP_IMG_FORMAT,
+    MAP_IMG_QUALITY,
+)
+from ..image import AutomowerFleetImage, AutomowerImage, async_setup_entry
+from ..position_store import PositionStore
+from ..zones import ZoneRegistry
 from .const import (
     AUTOMER_DM_CONFIG,
     AUTOMOWER_CONFIG_DATA,
     AUTOMOWER_DM_SESSION_DATA,
+    ENABLE_IMAGE,
     MWR_ONE_ID,
     MWR_ONE_IDX,
     MWR_TWO_ID,
     MWR_TWO_IDX,
-    ENABLE_IMAGE,
 )
 
 
@@ -32,6 +50,9 @@ async def setup_image(
     mwr_idx: str,
     enable_image: bool = True,
     replacement_conf_zones: str = "",
+    map_backend: str = MAP_BACKEND_FULL,
+    load_images: bool = True,
+    mower_options: dict = None,
 ):
     """Set up image and config entry"""
 
@@ -41,6 +62,11 @@ async def setup_image(
         options[CONF_ZONES] = replacement_conf_zones
 
     options[mwr_id][ENABLE_IMAGE] = enable_image
+    options[mwr_id] = {
+        **options[mwr_id],
+        MAP_BACKEND: map_backend,
+        **(mower_options or {}),
+    }
 
     config_entry = MockConfigEntry(
         domain=DOMAIN,
@@ -63,12 +89,16 @@ async def setup_image(
         ),
     ) as automower_session_mock:
         automower_coordinator_mock = MagicMock(
-            name="MockCoordinator", session=automower_session_mock()
+            name="MockCoordinator",
+            session=automower_session_mock(),
+            zone_registry=ZoneRegistry(config_entry),
         )
 
         mwr_img = AutomowerImage(
             automower_coordinator_mock, mwr_idx, config_entry, hass
         )
+    if enable_image and load_images:
+        await mwr_img._async_load_images()
     return mwr_img, automower_coordinator_mock
 
 
@@ -117,6 +147,12 @@ async def test_load_image_enabled(hass: HomeAssistant):
     image = Image.open(io.BytesIO(image_bytes))
     image.save(output_path.joinpath("mower_one_out.png").as_posix())
 
+    # Unchanged image is served from the encode cache
+    assert image_one.render_stats["encode_cache_hits"] == 0
+    assert image_one.render_stats["encode_cache_misses"] == 1
+    assert await image_one.async_image() == image_bytes
+    assert image_one.render_stats["encode_cache_hits"] == 1
+
     # Image to bytes - Mower Two
     image_bytes = await image_two.async_image()
     image = Image.open(io.BytesIO(image_bytes))
@@ -127,6 +163,23 @@ async def test_load_image_enabled(hass: HomeAssistant):
     image = Image.open(io.BytesIO(image_bytes))
     assert image.width == 400
     assert image.height == 195  # Resize maintains aspect ratio
+    assert image_one.render_stats["encode_cache_misses"] == 2
+
+    # A new render invalidates the encode cache
+    image_one._frame_version += 1
+    await image_one.async_image()
+    assert image_one.render_stats["encode_cache_hits"] == 1
+    assert image_one.render_stats["encode_cache_misses"] == 3
+    assert image_one._image_bytes_version == image_one._frame_version
+
+    # Scaled frames are encoded on every call and keep the native encode
+    native_bytes = image_one._image_bytes
+    for _ in range(2):
+        await image_one._image_to_bytes(400, 600)
+    assert image_one.render_stats["encode_cache_misses"] == 5
+    assert image_one._image_bytes is native_bytes
+    assert await image_one.async_image() is native_bytes
+    assert image_one.render_stats["encode_cache_hits"] == 2
 
     # Mower at home
     automower_coordinator_mock.session.data["data"][MWR_ONE_IDX]["attributes"]["mower"][
@@ -148,6 +201,392 @@ async def test_load_image_enabled(hass: HomeAssistant):
     image_one._position_history = {}
 
 
+@pytest.mark.asyncio
+async def test_image_format(hass: HomeAssistant):
+    """test the configured encoder is used and its content type published"""
+    image, automower_coordinator_mock = await setup_image(hass, MWR_ONE_ID, MWR_ONE_IDX)
+    assert image.content_type == "image/png"
+
+    image, automower_coordinator_mock = await setup_image(
+        hass,
+        MWR_ONE_ID,
+        MWR_ONE_IDX,
+        mower_options={MAP_IMG_FORMAT: "webp", MAP_IMG_QUALITY: 60},
+    )
+    assert image.content_type == "image/webp"
+    image._generate_image({})
+    image_bytes = await image.async_image()
+    assert Image.open(io.BytesIO(image_bytes)).format == "WEBP"
+    assert image.render_stats["encode_time"] > 0
+    assert image.render_stats["encoded_bytes"] == len(image_bytes)
+
+
+@pytest.mark.asyncio
+async def test_deferred_loading(hass: HomeAssistant):
+    """test images load in the background and a placeholder is shown meanwhile"""
+    image, automower_coordinator_mock = await setup_image(
+        hass, MWR_ONE_ID, MWR_ONE_IDX, load_images=False
+    )
+    automower_coordinator_mock.image_platform_stats = {
+        "load_times": {},
+        "render_stats": {},
+    }
+    assert image._map_image is None
+    assert image._overlay_image is None
+    automower_coordinator_mock.session.register_data_callback.assert_not_called()
+    placeholder = Image.open(io.BytesIO(await image.async_image()))
+    assert placeholder.size == (200, 200)
+
+    await image.async_added_to_hass()
+    load_task = image._load_task
+    assert load_task is not None
+    await load_task
+    assert image._load_task is None
+    assert image._map_image is not None
+    assert image._overlay_image is not None
+    assert (
+        automower_coordinator_mock.image_platform_stats["load_times"][image.unique_id]
+        > 0
+    )
+    # Render counters are reported in diagnostics
+    assert (
+        automower_coordinator_mock.image_platform_stats["render_stats"][image.unique_id]
+        is image.render_stats
+    )
+    automower_coordinator_mock.session.register_data_callback.assert_called_with(
+        image._async_request_render, schedule_immediately=True
+    )
+
+    # A map that can't be read leaves the placeholder
+    image, automower_coordinator_mock = await setup_image(
+        hass, MWR_ONE_ID, MWR_ONE_IDX, load_images=False
+    )
+    with patch.object(image, "_load_map_image", side_effect=OSError("missing")):
+        await image._async_load_images()
+    assert image._overlay_image is None
+    automower_coordinator_mock.session.register_data_callback.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_shared_base_layer(hass: HomeAssistant):
+    """test image entities drawing the same map share the base layer"""
+    image_one, automower_coordinator_mock = await setup_image(
+        hass, MWR_ONE_ID, MWR_ONE_IDX
+    )
+    image_one_again, automower_coordinator_mock = await setup_image(
+        hass, MWR_ONE_ID, MWR_ONE_IDX
+    )
+    # Same map, but mower two only shows one of the zones
+    image_two, automower_coordinator_mock = await setup_image(
+        hass, MWR_TWO_ID, MWR_TWO_IDX
+    )
+
+    assert image_one_again._map_image is image_one._map_image
+    assert image_two._map_image is not image_one._map_image
+    assert image_one_again._projection.px_meter == image_one._projection.px_meter
+
+
+@pytest.mark.asyncio
+async def test_tiled_map_backend(hass: HomeAssistant, tmp_path):
+    """test the tiled backend draws a viewport around the mowers"""
+    hass.config.config_dir = str(tmp_path)
+    image, automower_coordinator_mock = await setup_image(
+        hass, MWR_ONE_ID, MWR_ONE_IDX, map_backend=MAP_BACKEND_TILED
+    )
+    full_image, automower_coordinator_mock = await setup_image(
+        hass, MWR_ONE_ID, MWR_ONE_IDX
+    )
+    assert image._map_image is None
+    assert image._tile_pyramid.size == full_image._map_image.size
+    assert image._projection.px_meter == full_image._projection.px_meter
+    assert image._tile_pyramid.pyramid_dir.startswith(
+        str(tmp_path / ".storage" / "husqvarna_automower_tiles")
+    )
+
+    # Shared with entities using the same map
+    image_again, automower_coordinator_mock = await setup_image(
+        hass, MWR_ONE_ID, MWR_ONE_IDX, map_backend=MAP_BACKEND_TILED
+    )
+    assert image_again._tile_pyramid is image._tile_pyramid
+
+    image._generate_image({})
+    full_image._generate_image({})
+    assert image._frame_version == 1
+    assert image._image.size == (1024, 1022)
+    assert image._image.getbbox() is not None
+    assert image._path_layers == {}
+    # Same pixels as the full map around the mower
+    assert (
+        ImageChops.difference(
+            image._image, full_image._image.crop((0, 0, 1024, 1022))
+        ).getbbox()
+        is None
+    )
+    assert await image.async_image() is not None
+
+
+@pytest.mark.asyncio
+async def test_coverage_layer(hass: HomeAssistant, tmp_path):
+    """test the coverage heatmap is drawn under the path on both backends"""
+    hass.config.config_dir = str(tmp_path / "full")
+    full_image, automower_coordinator_mock = await setup_image(
+        hass, MWR_ONE_ID, MWR_ONE_IDX, mower_options={MAP_COVERAGE: True}
+    )
+    hass.config.config_dir = str(tmp_path / "tiled")
+    image, automower_coordinator_mock = await setup_image(
+        hass,
+        MWR_ONE_ID,
+        MWR_ONE_IDX,
+        map_backend=MAP_BACKEND_TILED,
+        mower_options={MAP_COVERAGE: True},
+    )
+    assert full_image._coverage_layer.counts.filename.startswith(
+        str(tmp_path / "full" / ".storage" / "husqvarna_automower_coverage")
+    )
+
+    full_image._generate_image({})
+    image._generate_image({})
+    positions = AUTOMOWER_DM_SESSION_DATA["data"][MWR_ONE_IDX]["attributes"][
+        "positions"
+    ]
+    assert full_image._coverage_layer.counts.sum() == len(positions)
+    assert image._coverage_layer.counts.sum() == len(positions)
+    assert (
+        ImageChops.difference(
+            image._image, full_image._image.crop((0, 0, 1024, 1022))
+        ).getbbox()
+        is None
+    )
+
+    # Without coverage the frame differs where the mower went
+    plain_image, automower_coordinator_mock = await setup_image(
+        hass, MWR_ONE_ID, MWR_ONE_IDX
+    )
+    plain_image._generate_image({})
+    assert plain_image._coverage_layer is None
+    assert ImageChops.difference(plain_image._image, full_image._image).getbbox()
+
+
+@pytest.mark.asyncio
+async def test_fleet_image(hass: HomeAssistant):
+    """test one fleet image is added per map shared by several mowers"""
+    image_one, automower_coordinator_mock = await setup_image(
+        hass, MWR_ONE_ID, MWR_ONE_IDX
+    )
+    hass.data[DOMAIN] = {image_one.entry.entry_id: automower_coordinator_mock}
+    async_add_entities = MagicMock()
+    with patch(
+        "custom_components.husqvarna_automower.image.entity_platform.current_platform"
+    ) as current_platform_mock:
+        await async_setup_entry(hass, image_one.entry, async_add_entities)
+    register_mock = current_platform_mock.get().async_register_entity_service
+    assert register_mock.call_args[0][0] == "export_timelapse"
+
+    entities = async_add_entities.call_args[0][0]
+    fleet_images = [
+        entity for entity in entities if isinstance(entity, AutomowerFleetImage)
+    ]
+    assert len(entities) == 3
+    assert len(fleet_images) == 1
+
+    fleet_image = fleet_images[0]
+    await fleet_image._async_load_images()
+    assert fleet_image.unique_id == f"{MWR_ONE_ID}_fleet_image"
+    assert fleet_image._additional_images == [MWR_TWO_ID]
+
+    fleet_image._generate_image({})
+    assert fleet_image._frame_version == 1
+    additional_entities = fleet_image._additional_mowers()
+
+    # Nothing moved, nothing rendered
+    fleet_image._generate_image({})
+    assert fleet_image._frame_version == 1
+
+    # Moving the other mower renders the fleet image, reusing its entities
+    mower_two = automower_coordinator_mock.session.data["data"][MWR_TWO_IDX]
+    positions = mower_two["attributes"]["positions"]
+    mower_two["attributes"]["positions"] = positions[1:]
+    try:
+        fleet_image._generate_image({})
+    finally:
+        mower_two["attributes"]["positions"] = positions
+    assert fleet_image._frame_version == 2
+    assert fleet_image._additional_mowers() is additional_entities
+
+
+@pytest.mark.asyncio
+async def test_fleet_image_renders(hass: HomeAssistant):
+    """test every mower on a shared map is drawn twice per update, not n + 1 times"""
+    image_one, automower_coordinator_mock = await setup_image(
+        hass, MWR_ONE_ID, MWR_ONE_IDX
+    )
+    hass.data[DOMAIN] = {image_one.entry.entry_id: automower_coordinator_mock}
+    async_add_entities = MagicMock()
+    with patch(
+        "custom_components.husqvarna_automower.image.entity_platform.current_platform"
+    ):
+        await async_setup_entry(hass, image_one.entry, async_add_entities)
+    entities = async_add_entities.call_args[0][0]
+    for entity in entities:
+        await entity._async_load_images()
+        entity._render_interval = 0
+
+    # The own images leave the other mowers to the fleet image
+    mower_images = [
+        entity for entity in entities if not isinstance(entity, AutomowerFleetImage)
+    ]
+    assert [entity._additional_images for entity in mower_images] == [[], []]
+
+    with patch.object(
+        AutomowerImage,
+        "_generate_image_img",
+        autospec=True,
+        side_effect=AutomowerImage._generate_image_img,
+    ) as draw_mock:
+        for entity in entities:
+            entity._async_request_render({})
+        await hass.async_block_till_done()
+    # Own image of each mower and the fleet image
+    assert draw_mock.call_count == 4
+    assert [entity.render_stats["renders"] for entity in entities] == [1, 1, 1]
+
+
+@pytest.mark.asyncio
+async def test_export_timelapse(hass: HomeAssistant, tmp_path):
+    """test the timelapse is written to an allowed path only"""
+    hass.config.config_dir = str(tmp_path)
+    hass.config.allowlist_external_dirs = {str(tmp_path)}
+    image, automower_coordinator_mock = await setup_image(hass, MWR_ONE_ID, MWR_ONE_IDX)
+
+    filename = str(tmp_path / "timelapse.gif")
+    await image.async_export_timelapse(filename, "gif", 2, 50)
+    animation = Image.open(filename)
+    assert animation.format == "GIF"
+    assert animation.size == image._map_image.size
+    assert animation.n_frames > 1
+    assert not (tmp_path / "timelapse.gif.part").exists()
+
+    with pytest.raises(HomeAssistantError):
+        await image.async_export_timelapse("/etc/timelapse.gif")
+
+    # The stored history is used when it goes back further than the API
+    positions = AUTOMOWER_DM_SESSION_DATA["data"][MWR_ONE_IDX]["attributes"][
+        "positions"
+    ]
+    store = PositionStore(str(tmp_path / "positions.bin"), 1000)
+    store.append(positions * 2)
+    automower_coordinator_mock.position_stores = {MWR_ONE_ID: store}
+    await image.async_export_timelapse(filename, "gif", 1, 50)
+    assert Image.open(filename).n_frames == 2 * len(positions)
+    store.close()
+
+    # A single session, selected by the time positions were received
+    store = PositionStore(str(tmp_path / "session.bin"), 1000)
+    store.append(positions[3:], recorded=1000)
+    store.append(positions, recorded=2000)
+    automower_coordinator_mock.position_stores = {MWR_ONE_ID: store}
+    await image.async_export_timelapse(
+        filename, "gif", 1, 50, start=datetime.fromtimestamp(1500, timezone.utc)
+    )
+    assert Image.open(filename).n_frames == 3
+    await image.async_export_timelapse(
+        filename, "gif", 1, 50, end=datetime.fromtimestamp(1500, timezone.utc)
+    )
+    assert Image.open(filename).n_frames == len(positions) - 3
+    with pytest.raises(HomeAssistantError):
+        await image.async_export_timelapse(
+            filename, "gif", 1, 50, start=datetime.fromtimestamp(3000, timezone.utc)
+        )
+    store.close()
+    automower_coordinator_mock.position_stores = {}
+    with pytest.raises(HomeAssistantError):
+        await image.async_export_timelapse(
+            filename, "gif", 1, 50, end=datetime.fromtimestamp(3000, timezone.utc)
+        )
+
+    # Tiled maps are exported zoomed out to fit the viewport
+    image, automower_coordinator_mock = await setup_image(
+        hass, MWR_ONE_ID, MWR_ONE_IDX, map_backend=MAP_BACKEND_TILED
+    )
+    filename = str(tmp_path / "timelapse.png")
+    await image.async_export_timelapse(filename, "apng")
+    assert Image.open(filename).size == image._tile_pyramid.level_size(2)
+
+
+@pytest.mark.asyncio
+async def test_render_coalescing(hass: HomeAssistant):
+    """test renders run in the executor and only the latest request is kept"""
+    image, automower_coordinator_mock = await setup_image(hass, MWR_ONE_ID, MWR_ONE_IDX)
+    automower_coordinator_mock.session.register_data_callback.assert_called_once_with(
+        image._async_request_render, schedule_immediately=True
+    )
+
+    # No frame rate cap
+    image._render_interval = 0
+    with patch.object(
+        image, "_generate_image", wraps=image._generate_image
+    ) as generate_mock:
+        for _ in range(4):
+            image._async_request_render({})
+        await hass.async_block_till_done()
+
+    # One render for the first request, one for the latest of the others
+    assert generate_mock.call_count == 2
+    assert image.render_stats["renders"] == 2
+    assert image.render_stats["renders_dropped"] == 2
+    assert image.render_stats["loop_time_saved"] > 0
+    assert image._render_task is None
+
+    # Frame rate capped, requests are held back and flushed on the trailing edge
+    image._render_interval = 60
+    image._async_request_render({})
+    image._async_request_render({})
+    await hass.async_block_till_done()
+    assert image._render_unsub is not None
+    assert image.render_stats["renders"] == 2
+    assert image.render_stats["renders_dropped"] == 3
+
+    async_fire_time_changed(hass, dt_util.utcnow() + timedelta(seconds=61))
+    await hass.async_block_till_done()
+    assert image._render_unsub is None
+    assert image.render_stats["renders"] == 3
+
+    image._async_request_render({})
+    assert image._render_unsub is not None
+
+    await image.async_will_remove_from_hass()
+    automower_coordinator_mock.session.unregister_data_callback.assert_called_with(
+        image._async_request_render
+    )
+    assert image._render_unsub is None
+
+
+@pytest.mark.asyncio
+async def test_render_failure(hass: HomeAssistant):
+    """test a failed render doesn't stop later renders"""
+    image, automower_coordinator_mock = await setup_image(hass, MWR_ONE_ID, MWR_ONE_IDX)
+    image._render_interval = 0
+    generate_image = image._generate_image
+    with patch.object(
+        image, "_generate_image", side_effect=[ValueError("broken"), None]
+    ) as generate_mock:
+        image._async_request_render({})
+        image._async_request_render({})
+        await hass.async_block_till_done()
+    # The pending request ran after the failure
+    assert generate_mock.call_count == 2
+    assert image.render_stats["renders"] == 1
+    assert image._render_task is None
+    assert not image._render_pending
+
+    with patch.object(image, "_generate_image", wraps=generate_image) as generate_mock:
+        for _ in range(3):
+            image._async_request_render({})
+        await hass.async_block_till_done()
+    assert generate_mock.call_count == 2
+    assert image.render_stats["renders"] == 3
+
+
 @pytest.mark.asyncio
 async def test_load_image_enabled_bad_zone(hass: HomeAssistant):
     """test automower initialization bad zone, not a dict"""
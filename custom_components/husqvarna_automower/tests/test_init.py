@@ -1,10 +1,11 @@
 """Tests for init module."""
+import os
 from asyncio.exceptions import TimeoutError
+from copy import deepcopy
 from unittest.mock import AsyncMock, MagicMock, patch
 
 import pytest
 from aioautomower import AutomowerSession
-
 from homeassistant.components.application_credentials import (
     ClientCredential,
     async_import_client_credential,
@@ -15,13 +16,20 @@ from homeassistant.helpers.issue_registry import async_get
 from pytest_homeassistant_custom_component.common import MockConfigEntry
 
 from .. import async_reload_entry, update_listener
-from ..const import DOMAIN, MAP_IMG_ROTATION, MAP_PATH_COLOR, HOME_LOCATION
+from ..const import (
+    DEFAULT_POSITION_RETENTION,
+    DOMAIN,
+    HOME_LOCATION,
+    MAP_IMG_ROTATION,
+    MAP_PATH_COLOR,
+    POSITION_RETENTION,
+)
 from .const import (
     AUTOMER_SM_CONFIG,
     AUTOMOWER_CONFIG_DATA,
     AUTOMOWER_CONFIG_DATA_BAD_SCOPE,
-    AUTOMOWER_SM_SESSION_DATA,
     AUTOMOWER_DM_SESSION_DATA,
+    AUTOMOWER_SM_SESSION_DATA,
     MWR_ONE_ID,
     MWR_TWO_ID,
 )
@@ -167,6 +175,82 @@ async def test_load_unload_wrong_scope(hass: HomeAssistant):
         assert config_entry.state == ConfigEntryState.NOT_LOADED
 
 
+@pytest.mark.asyncio
+async def test_position_stores(hass: HomeAssistant, tmp_path):
+    """test positions are stored on disk per mower"""
+    hass.config.config_dir = str(tmp_path)
+    await configure_application_credentials(hass)
+
+    config_entry = MockConfigEntry(
+        domain=DOMAIN,
+        data=AUTOMOWER_CONFIG_DATA,
+        options={MWR_ONE_ID: {POSITION_RETENTION: 1000}},
+        entry_id="automower_test",
+        title="Automower Test",
+    )
+    config_entry.add_to_hass(hass)
+
+    session_mock = AsyncMock(
+        register_token_callback=MagicMock(),
+        connect=AsyncMock(),
+        close=AsyncMock(),
+        data=AUTOMOWER_DM_SESSION_DATA,
+        register_data_callback=MagicMock(),
+        unregister_data_callback=MagicMock(),
+    )
+    with patch("aioautomower.AutomowerSession", return_value=session_mock):
+        await hass.config_entries.async_setup(config_entry.entry_id)
+        await hass.async_block_till_done()
+        coordinator = hass.data[DOMAIN][config_entry.entry_id]
+        session_mock.register_data_callback.assert_any_call(
+            coordinator.async_store_positions, schedule_immediately=True
+        )
+
+        # Stores are opened in the background on the first update
+        coordinator.async_store_positions(AUTOMOWER_DM_SESSION_DATA)
+        coordinator.async_store_positions(AUTOMOWER_DM_SESSION_DATA)
+        await hass.async_block_till_done()
+        store_one = coordinator.position_stores[MWR_ONE_ID]
+        positions = AUTOMOWER_DM_SESSION_DATA["data"][0]["attributes"]["positions"]
+        assert store_one.capacity == 1000
+        assert len(store_one) == len(positions)
+        assert coordinator.position_stores[MWR_TWO_ID].capacity == (
+            DEFAULT_POSITION_RETENTION
+        )
+
+        # Appended in the executor, only the latest of the waiting messages
+        with patch.object(
+            store_one, "append", return_value=0
+        ) as append_mock, patch.object(
+            hass, "async_add_executor_job", wraps=hass.async_add_executor_job
+        ) as executor_mock:
+            for _ in range(3):
+                coordinator.async_store_positions(AUTOMOWER_DM_SESSION_DATA)
+            append_mock.assert_not_called()
+            await hass.async_block_till_done()
+        assert append_mock.call_count == 2
+        executor_jobs = [job[0][0] for job in executor_mock.call_args_list]
+        assert executor_jobs.count(append_mock) == 2
+
+        # Closed on options updates, reopened on the next update
+        await update_listener(hass, config_entry)
+        assert coordinator.position_stores == {}
+        coordinator.async_store_positions(AUTOMOWER_DM_SESSION_DATA)
+        await hass.async_block_till_done()
+        assert len(coordinator.position_stores[MWR_ONE_ID]) == len(positions)
+
+        assert await config_entry.async_unload(hass)
+        await hass.async_block_till_done()
+        session_mock.unregister_data_callback.assert_any_call(
+            coordinator.async_store_positions
+        )
+        assert os.path.isfile(
+            os.path.join(
+                tmp_path, ".storage", f"{DOMAIN}_positions", f"{MWR_ONE_ID}.bin"
+            )
+        )
+
+
 @pytest.mark.asyncio
 async def test_async_migrate_entry_2_to_4(hass: HomeAssistant):
     """test automower migration from version 2 to 3"""
@@ -312,3 +396,102 @@ async def test_async_migrate_entry_3_to_4(hass: HomeAssistant):
         assert await config_entry.async_unload(hass)
         await hass.async_block_till_done()
         assert config_entry.state == ConfigEntryState.NOT_LOADED
+
+
+@pytest.mark.asyncio
+async def test_mower_listeners(hass: HomeAssistant):
+    """test updates are only sent to the listeners of changed mowers"""
+    await configure_application_credentials(hass)
+
+    config_entry = MockConfigEntry(
+        domain=DOMAIN,
+        data=AUTOMOWER_CONFIG_DATA,
+        options={},
+        entry_id="automower_test",
+        title="Automower Test",
+    )
+    config_entry.add_to_hass(hass)
+
+    session_data = deepcopy(AUTOMOWER_DM_SESSION_DATA)
+    session_mock = AsyncMock(
+        register_token_callback=MagicMock(),
+        connect=AsyncMock(),
+        close=AsyncMock(),
+        data=session_data,
+        register_data_callback=MagicMock(),
+        unregister_data_callback=MagicMock(),
+    )
+    with patch("aioautomower.AutomowerSession", return_value=session_mock):
+        await hass.config_entries.async_setup(config_entry.entry_id)
+        await hass.async_block_till_done()
+    coordinator = hass.data[DOMAIN][config_entry.entry_id]
+    session_mock.register_data_callback.assert_any_call(
+        coordinator.async_dispatch_mower_data, schedule_immediately=True
+    )
+
+    updates = {MWR_ONE_ID: 0, MWR_TWO_ID: 0}
+
+    def count_update(mower_id):
+        updates[mower_id] += 1
+
+    remove_one = coordinator.async_add_mower_listener(
+        MWR_ONE_ID, lambda: count_update(MWR_ONE_ID)
+    )
+    coordinator.async_add_mower_listener(MWR_TWO_ID, lambda: count_update(MWR_TWO_ID))
+
+    # Everything is new on the first message
+    coordinator.async_dispatch_mower_data(session_data)
+    assert updates == {MWR_ONE_ID: 1, MWR_TWO_ID: 1}
+    coordinator.async_dispatch_mower_data(session_data)
+    assert updates == {MWR_ONE_ID: 1, MWR_TWO_ID: 1}
+
+    # A message replaces the attributes it carries
+    mower_two = session_data["data"][1]["attributes"]
+    mower_two["battery"] = {**mower_two["battery"], "batteryPercent": 1}
+    coordinator.async_dispatch_mower_data(session_data)
+    assert updates == {MWR_ONE_ID: 1, MWR_TWO_ID: 2}
+
+    # A poll brings equal data in new objects
+    coordinator.async_dispatch_mower_data(deepcopy(session_data))
+    assert updates == {MWR_ONE_ID: 1, MWR_TWO_ID: 2}
+
+    remove_one()
+    session_data["data"][0]["attributes"]["mower"] = {}
+    coordinator.async_dispatch_mower_data(session_data)
+    assert updates == {MWR_ONE_ID: 1, MWR_TWO_ID: 2}
+
+    # Listeners with dependencies only hear about the paths they read
+    battery_updates = []
+    activity_updates = []
+    coordinator.async_add_mower_listener(
+        MWR_TWO_ID,
+        lambda: battery_updates.append(True),
+        ("battery.batteryPercent", "metadata.connected"),
+    )
+    coordinator.async_add_mower_listener(
+        MWR_TWO_ID, lambda: activity_updates.append(True), ("mower.activity",)
+    )
+    mower_two["battery"] = {**mower_two["battery"], "batteryPercent": 2}
+    mower_two["mower"] = {**mower_two["mower"], "errorCodeTimestamp": 1}
+    coordinator.async_dispatch_mower_data(session_data)
+    assert updates[MWR_TWO_ID] == 3
+    assert battery_updates == [True]
+    assert activity_updates == []
+
+    mower_two["mower"] = {**mower_two["mower"], "activity": "MOWING"}
+    coordinator.async_dispatch_mower_data(session_data)
+    assert updates[MWR_TWO_ID] == 4
+    assert battery_updates == [True]
+    assert activity_updates == [True]
+
+    # A raising listener doesn't stop the other listeners or mowers
+    def raise_error():
+        raise ValueError("broken")
+
+    coordinator.async_add_mower_listener(MWR_ONE_ID, raise_error)
+    coordinator.async_add_mower_listener(MWR_ONE_ID, lambda: count_update(MWR_ONE_ID))
+    mower_two["battery"] = {**mower_two["battery"], "batteryPercent": 3}
+    session_data["data"][0]["attributes"]["mower"] = {"activity": "MOWING"}
+    coordinator.async_dispatch_mower_data(session_data)
+    assert updates == {MWR_ONE_ID: 2, MWR_TWO_ID: 5}
+    assert battery_updates == [True, True]
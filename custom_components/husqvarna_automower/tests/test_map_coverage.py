@@ -0,0 +1,97 @@
+"""Tests for map coverage module."""
+
+import os
+
+import numpy as np
+import pytest
+from PIL import Image, ImageChops
+
+from ..map_coverage import COVERAGE_COLORS, CoverageLayer, coverage_levels
+from ..map_layers import DirtyRectCompositor
+from ..map_utils import MapProjection
+from .const import AUTOMOWER_DM_SESSION_DATA, MWR_ONE_IDX
+
+MAP_SIZE = (2048, 996)
+PROJECTION = MapProjection((35.5402714, -82.5516032), (1024, 498), 3.58, -16.1)
+POSITIONS = AUTOMOWER_DM_SESSION_DATA["data"][MWR_ONE_IDX]["attributes"]["positions"]
+NEW_POSITION = {
+    "latitude": POSITIONS[0]["latitude"] + 1e-7,
+    "longitude": POSITIONS[0]["longitude"],
+}
+
+
+@pytest.mark.asyncio
+async def test_coverage_levels():
+    """test counts map to doubling color bands"""
+    assert coverage_levels(np.array([0, 1, 2, 3, 4, 7, 8, 1000])).tolist() == [
+        0,
+        1,
+        2,
+        2,
+        3,
+        3,
+        4,
+        len(COVERAGE_COLORS) - 1,
+    ]
+
+
+@pytest.mark.asyncio
+async def test_coverage_layer_incremental(tmp_path):
+    """test only new positions are counted and drawn"""
+    coverage_dir = os.path.join(tmp_path, "coverage")
+    layer = CoverageLayer(MAP_SIZE, PROJECTION, coverage_dir)
+    assert layer.cell_px == 2
+    assert layer.counts.shape == (498, 1024)
+
+    # Positions are prepended by the API, feed the history in message order
+    for start in range(len(POSITIONS) - 2, -1, -1):
+        layer.update(POSITIONS[start:], PROJECTION)
+    assert layer.update(POSITIONS, PROJECTION) is False
+    assert layer.counts.sum() == len(POSITIONS)
+
+    # Drawn incrementally, the same as drawn from the counts at once
+    image = layer.image.copy()
+    # Taken by a compositor
+    layer.dirty_box = None
+    layer.update([NEW_POSITION] + POSITIONS, PROJECTION)
+    assert layer.counts.sum() == len(POSITIONS) + 1
+    assert layer.dirty_box[2] - layer.dirty_box[0] == layer.cell_px
+    assert ImageChops.difference(image, layer.image).getbbox() == layer.dirty_box
+    del layer
+
+    # Counts and the last position are kept across restarts
+    layer = CoverageLayer(MAP_SIZE, PROJECTION, coverage_dir)
+    assert layer.counts.sum() == len(POSITIONS) + 1
+    assert layer.update([NEW_POSITION] + POSITIONS, PROJECTION) is False
+    image = layer.image.copy()
+    assert image.getbbox() is not None
+
+    # Another map starts over
+    layer = CoverageLayer(MAP_SIZE, PROJECTION.scaled(2), coverage_dir)
+    assert layer.counts.sum() == 0
+    assert os.listdir(coverage_dir) == [
+        os.path.basename(os.path.dirname(layer._meta_path))
+    ]
+
+
+@pytest.mark.asyncio
+async def test_coverage_layer_render(tmp_path):
+    """test regions and the composited frame match the full heatmap"""
+    layer = CoverageLayer(MAP_SIZE, PROJECTION, str(tmp_path))
+    layer.update(POSITIONS, PROJECTION)
+
+    base_layer = Image.new("RGBA", MAP_SIZE, (0, 128, 0, 255))
+    compositor = DirtyRectCompositor(base_layer)
+    compositor.update([layer], [])
+    assert layer.dirty_box is None
+    frame = base_layer.copy()
+    frame.alpha_composite(layer.image)
+    assert ImageChops.difference(compositor.image, frame).getbbox() is None
+
+    # Half size, as read from a pyramid level
+    region = layer.render_region((512, 256, 1536, 768), (512, 256))
+    assert region.size == (512, 256)
+    expected = layer.image.crop((512, 256, 1536, 768)).resize(
+        (512, 256), Image.Resampling.NEAREST
+    )
+    assert ImageChops.difference(region, expected).getbbox() is None
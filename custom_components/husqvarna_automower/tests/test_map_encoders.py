@@ -0,0 +1,42 @@
+"""Tests for map encoders module."""
+
+import io
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from ..map_encoders import MAP_ENCODERS, get_encoder
+
+MAP_PATH = "custom_components/husqvarna_automower/tests/resources/biltmore-min.png"
+
+
+@pytest.mark.asyncio
+async def test_encoders():
+    """test every encoder writes its format"""
+    map_image = Image.open(MAP_PATH).convert("RGBA")
+
+    for image_format, content_type in (
+        ("png", "image/png"),
+        ("jpeg", "image/jpeg"),
+        ("webp", "image/webp"),
+    ):
+        encoder = get_encoder(image_format, 80, 6)
+        assert encoder.content_type == content_type
+        decoded = Image.open(io.BytesIO(encoder.encode(map_image)))
+        assert decoded.format == image_format.upper()
+        assert decoded.size == map_image.size
+
+    # PNG is lossless at every compression level
+    for compression in (0, 9):
+        png = get_encoder("png", 80, compression).encode(map_image)
+        decoded = Image.open(io.BytesIO(png)).convert("RGBA")
+        assert np.array_equal(np.asarray(decoded), np.asarray(map_image))
+
+    # Lossy formats shrink with the quality
+    assert len(get_encoder("jpeg", 30, 0).encode(map_image)) < len(
+        get_encoder("jpeg", 90, 0).encode(map_image)
+    )
+    assert get_encoder("webp", 80, 9)._save_options()["method"] == 6
+    assert get_encoder("webp", 80, 6)._save_options()["method"] == 4
+    assert set(MAP_ENCODERS) == {"png", "jpeg", "webp"}
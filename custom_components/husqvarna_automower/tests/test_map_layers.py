@@ -0,0 +1,184 @@
+"""Tests for map layers module."""
+
+import gc
+from unittest.mock import MagicMock
+
+import numpy as np
+import pytest
+from PIL import Image, ImageChops, ImageDraw
+
+from ..map_layers import (
+    PATH_WIDTH,
+    BaseLayerCache,
+    DirtyRectCompositor,
+    PathLayer,
+    dash_polylines,
+    dash_segments,
+)
+from ..map_utils import MapProjection
+from .const import AUTOMOWER_DM_SESSION_DATA, MWR_ONE_IDX
+
+MAP_SIZE = (2048, 996)
+PROJECTION = MapProjection((35.5402714, -82.5516032), (1024, 498), 3.58, -16.1)
+POSITIONS = AUTOMOWER_DM_SESSION_DATA["data"][MWR_ONE_IDX]["attributes"]["positions"]
+
+
+@pytest.mark.asyncio
+async def test_dash_segments():
+    """test dash generation along a polyline"""
+    assert dash_segments([[0, 0], [25, 0], [25, 30], [25, 30]]).tolist() == [
+        # Dash, gap, then a dash cut short at the end of the segment
+        [[0, 0], [10, 0]],
+        [[20, 0], [25, 0]],
+        # Dash, gap, dash, the segment end is left without a dash
+        [[25, 0], [25, 10]],
+        [[25, 20], [25, 30]],
+        # A segment without length
+        [[25, 30], [25, 30]],
+    ]
+
+    assert dash_segments([[0, 0]]).shape == (0, 2, 2)
+    assert dash_segments([[0, 0], [5, 0]], dash_length=2).tolist() == [
+        [[0, 0], [2, 0]],
+        [[4, 0], [5, 0]],
+    ]
+
+
+@pytest.mark.asyncio
+async def test_dash_polylines():
+    """test dashes meeting end to start are joined and simplified"""
+    pixels = [[0, 0], [4, 0], [8, 1], [12, 0], [16, 0], [16, 3], [16, 40], [14, 40]]
+    lines = dash_polylines(dash_segments(pixels))
+    assert [line.tolist() for line in lines] == [
+        # Jitter and collinear points dropped, the corner kept
+        [[0, 0], [16, 0], [16, 13]],
+        [[16, 23], [16, 33]],
+        # The mower turned back, the dash is cut short at the segment end
+        [[16, 40], [14, 40]],
+    ]
+    # Without tolerance only points exactly on the line are dropped
+    assert len(dash_polylines(dash_segments(pixels), 0)[0]) == 6
+    assert dash_polylines(dash_segments([[0, 0]])) == []
+
+    # Turning back along the path keeps the turn
+    assert dash_polylines(dash_segments([[0, 0], [8, 0], [4, 0]]))[0].tolist() == [
+        [0, 0],
+        [8, 0],
+        [4, 0],
+    ]
+
+    # Drawn as polylines without tolerance, the same as dash by dash
+    pixels = PROJECTION.project(MapProjection.positions_to_array(POSITIONS))
+    pixels = np.repeat(pixels, 3, axis=0) + np.tile([[0, 0], [1, 0], [1, 1]], (14, 1))
+    dash_image = Image.new("RGBA", MAP_SIZE)
+    for dash in dash_segments(pixels).tolist():
+        ImageDraw.Draw(dash_image).line(dash, fill=(255, 0, 0, 255), width=PATH_WIDTH)
+    path_layer = PathLayer(MAP_SIZE, [255, 0, 0], tolerance=0)
+    path_layer.extend(pixels)
+    assert ImageChops.difference(dash_image, path_layer.image).getbbox() is None
+
+
+@pytest.mark.asyncio
+async def test_path_layer_incremental():
+    """test PathLayer only draws new positions"""
+    full_layer = PathLayer(MAP_SIZE, [255, 0, 0])
+    assert full_layer.update(POSITIONS, PROJECTION) is True
+
+    # Positions are prepended by the API, feed the history in message order
+    inc_layer = PathLayer(MAP_SIZE, [255, 0, 0])
+    for start in range(len(POSITIONS) - 2, -1, -1):
+        assert inc_layer.update(POSITIONS[start:], PROJECTION) is True
+
+    assert ImageChops.difference(full_layer.image, inc_layer.image).getbbox() is None
+
+    # Nothing new, nothing drawn
+    assert inc_layer.update(POSITIONS, PROJECTION) is False
+    assert inc_layer.update([], PROJECTION) is False
+
+    # A history that doesn't continue the path starts over
+    restart_layer = PathLayer(MAP_SIZE, [255, 0, 0])
+    restart_layer.update(POSITIONS[-3:], PROJECTION)
+    assert inc_layer.update(POSITIONS[-3:], PROJECTION) is True
+    assert ImageChops.difference(restart_layer.image, inc_layer.image).getbbox() is None
+
+    inc_layer.clear()
+    assert inc_layer.image.getbbox() is None
+
+    # Positions rolling out of the history are removed from the path
+    window = len(POSITIONS) // 2
+    window_layer = PathLayer(MAP_SIZE, [255, 0, 0])
+    rolled_layer = PathLayer(MAP_SIZE, [255, 0, 0])
+    rolled_layer.update(POSITIONS[2 : window + 2], PROJECTION)
+    rolled_layer.dirty_box = None
+    assert rolled_layer.update(POSITIONS[:window], PROJECTION) is True
+    window_layer.update(POSITIONS[:window], PROJECTION)
+    assert (
+        ImageChops.difference(window_layer.image, rolled_layer.image).getbbox() is None
+    )
+    assert rolled_layer.dirty_box == (0, 0) + MAP_SIZE
+
+
+@pytest.mark.asyncio
+async def test_base_layer_cache():
+    """test BaseLayerCache shares layers while they are referenced"""
+    cache = BaseLayerCache()
+    build_layer = MagicMock(side_effect=lambda: Image.new("RGBA", MAP_SIZE))
+
+    layer_one = cache.get(("map.png", 1.0), build_layer)
+    assert cache.get(("map.png", 1.0), build_layer) is layer_one
+    assert build_layer.call_count == 1
+
+    layer_two = cache.get(("map.png", 2.0), build_layer)
+    assert layer_two is not layer_one
+    assert build_layer.call_count == 2
+    assert len(cache) == 2
+
+    # Unreferenced layers are released
+    del layer_one, layer_two
+    gc.collect()
+    assert len(cache) == 0
+
+
+@pytest.mark.asyncio
+async def test_dirty_rect_compositor():
+    """test only changed regions are rebuilt and the frame stays exact"""
+    base_layer = Image.new("RGBA", MAP_SIZE, (0, 128, 0, 255))
+    icon = Image.new("RGBA", (64, 48), (0, 0, 0, 0))
+    icon.paste((255, 255, 0, 128), (8, 8, 56, 40))
+    path_layer = PathLayer(MAP_SIZE, [255, 0, 0])
+    compositor = DirtyRectCompositor(base_layer)
+
+    def full_frame(position):
+        frame = base_layer.copy()
+        frame.alpha_composite(path_layer.image)
+        frame.paste(icon, position, icon)
+        return frame
+
+    path_layer.update(POSITIONS[3:], PROJECTION)
+    compositor.update([path_layer], [(icon, (100, 100))])
+    assert path_layer.dirty_box is None
+    assert (
+        ImageChops.difference(compositor.image, full_frame((100, 100))).getbbox()
+        is None
+    )
+
+    # Moving the icon touches its old and new box only
+    assert compositor.update([path_layer], [(icon, (110, 105))]) == [
+        (100, 100, 164, 148),
+        (110, 105, 174, 153),
+    ]
+    assert (
+        ImageChops.difference(compositor.image, full_frame((110, 105))).getbbox()
+        is None
+    )
+
+    # New path segments add their bounding box, icons partly off the frame are clipped
+    path_layer.update(POSITIONS, PROJECTION)
+    rebuilt = compositor.update([path_layer], [(icon, (-10, -10))])
+    assert len(rebuilt) == 3
+    assert rebuilt[1] == (0, 0, 54, 38)
+    assert (
+        ImageChops.difference(compositor.image, full_frame((-10, -10))).getbbox()
+        is None
+    )
+    assert base_layer.getpixel((0, 0)) == (0, 128, 0, 255)
@@ -0,0 +1,76 @@
+"""Tests for map tiles module."""
+
+import os
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from ..map_tiles import TilePyramid, build_tile_pyramid, level_size
+
+MAP_PATH = "custom_components/husqvarna_automower/tests/resources/biltmore-min.png"
+
+
+@pytest.mark.asyncio
+async def test_build_tile_pyramid(tmp_path):
+    """test the pyramid is built once and old versions are removed"""
+    old_dir = tmp_path / "map" / "1"
+    old_dir.mkdir(parents=True)
+    pyramid_dir = str(tmp_path / "map" / "2")
+
+    pyramid = build_tile_pyramid(MAP_PATH, pyramid_dir)
+    assert os.listdir(tmp_path / "map") == ["2"]
+    assert pyramid.size == (2093, 1022)
+    assert pyramid.tile_size == 256
+    # 2093 -> 1047 -> 524 -> 262 -> 131
+    assert pyramid.levels == 5
+    assert pyramid.level_size(4) == (131, 64)
+    assert level_size((5, 3), 2) == (2, 1)
+
+    # Already built, not built again
+    mtime = os.path.getmtime(os.path.join(pyramid_dir, "level_0.npy"))
+    assert build_tile_pyramid(MAP_PATH, pyramid_dir).levels == 5
+    assert os.path.getmtime(os.path.join(pyramid_dir, "level_0.npy")) == mtime
+
+
+@pytest.mark.asyncio
+async def test_read_region(tmp_path):
+    """test regions read from the tiles match the map image"""
+    pyramid = build_tile_pyramid(MAP_PATH, str(tmp_path / "map"))
+    source = np.asarray(Image.open(MAP_PATH).convert("RGBA"))
+
+    # Spanning several tiles
+    region = pyramid.read_region(0, (200, 100, 900, 700))
+    assert region.size == (700, 600)
+    assert np.array_equal(np.asarray(region), source[100:700, 200:900])
+
+    # Partly outside the map is transparent
+    region = np.asarray(pyramid.read_region(0, (2000, -10, 2200, 90)))
+    assert np.array_equal(region[10:, :93], source[:90, 2000:])
+    assert not region[:10].any()
+    assert not region[:, 93:].any()
+
+    # Lower levels are the map halved
+    region = np.asarray(pyramid.read_region(1, (0, 0, 1047, 511)))
+    expected = np.asarray(Image.fromarray(source[:1022, :2092]).reduce(2))
+    assert np.abs(region[:, :1046].astype(int) - expected).max() <= 1
+
+    assert TilePyramid(str(tmp_path / "map")).levels == pyramid.levels
+
+
+@pytest.mark.asyncio
+async def test_viewport(tmp_path):
+    """test the viewport picks the most detailed level the focus fits in"""
+    pyramid = build_tile_pyramid(MAP_PATH, str(tmp_path / "map"))
+
+    assert pyramid.viewport((1000, 500, 1100, 600)) == (0, (538, 0, 1562, 1022))
+    # Kept inside the map
+    assert pyramid.viewport((0, 0, 64, 64)) == (0, (0, 0, 1024, 1022))
+    assert pyramid.viewport((2000, 900, 2093, 1022)) == (0, (1069, 0, 2093, 1022))
+    # Too wide for level 0
+    assert pyramid.viewport((0, 0, 1500, 100), (1024, 1024)) == (
+        1,
+        (0, 0, 1024, 511),
+    )
+    # Nothing fits, the top level is used
+    assert pyramid.viewport((0, 0, 100000, 100000))[0] == 4
@@ -0,0 +1,86 @@
+"""Tests for map timelapse module."""
+
+import io
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from ..map_timelapse import TIMELAPSE_WRITERS, TimelapseRenderer
+from ..map_utils import MapProjection
+from .const import AUTOMOWER_DM_SESSION_DATA, MWR_ONE_IDX
+
+MAP_PATH = "custom_components/husqvarna_automower/tests/resources/biltmore-min.png"
+PROJECTION = MapProjection((35.5402714, -82.5516032), (1046, 511), 3.58, -16.1)
+POSITIONS = AUTOMOWER_DM_SESSION_DATA["data"][MWR_ONE_IDX]["attributes"]["positions"]
+
+
+def make_renderer(positions_per_frame=1):
+    """Return a renderer of the test mower on the test map"""
+    icon = Image.new("RGBA", (16, 12), (255, 255, 0, 255))
+    base_layer = Image.open(MAP_PATH).convert("RGBA")
+    return TimelapseRenderer(
+        base_layer, PROJECTION, POSITIONS, [255, 0, 0], icon, positions_per_frame
+    )
+
+
+@pytest.mark.asyncio
+async def test_timelapse_renderer():
+    """test frames are drawn in order and report the changed box"""
+    renderer = make_renderer()
+    assert renderer.n_frames == len(POSITIONS)
+
+    frames = list(renderer.frames())
+    assert frames[0][1] == (0, 0) + renderer.size
+    for image, box in frames[1:]:
+        # The canvas is shared, only the changed box is new
+        assert image is frames[0][0]
+        assert box[2] - box[0] < renderer.size[0] / 2
+        assert box[3] - box[1] < renderer.size[1] / 2
+
+    with pytest.raises(ValueError):
+        renderer.frame(0)
+
+    renderer = make_renderer(positions_per_frame=4)
+    assert renderer.n_frames == -(-len(POSITIONS) // 4)
+
+
+@pytest.mark.asyncio
+async def test_timelapse_writers():
+    """test every format is written as an animation of all frames"""
+    for image_format, writer in TIMELAPSE_WRITERS.items():
+        renderer = make_renderer()
+        timelapse = io.BytesIO()
+        writer(timelapse, renderer, 100)
+
+        animation = Image.open(io.BytesIO(timelapse.getvalue()))
+        assert animation.size == renderer.size
+        assert animation.n_frames > 1
+        if image_format != "webp":
+            # WebP drops frames without changes
+            assert animation.n_frames == renderer.n_frames
+
+        animation.seek(animation.n_frames - 1)
+        last_frame = np.asarray(animation.convert("RGB")).astype(int)
+        expected = np.asarray(renderer.frame(renderer.n_frames - 1)[0].convert("RGB"))
+        if image_format == "apng":
+            assert np.array_equal(last_frame, expected)
+        else:
+            assert np.abs(last_frame - expected).mean() < 5
+
+
+@pytest.mark.asyncio
+async def test_gif_path_color():
+    """test the path and icon keep their colors in a GIF"""
+    renderer = make_renderer()
+    timelapse = io.BytesIO()
+    TIMELAPSE_WRITERS["gif"](timelapse, renderer, 100)
+
+    animation = Image.open(io.BytesIO(timelapse.getvalue()))
+    animation.seek(animation.n_frames - 1)
+    last_frame = np.asarray(animation.convert("RGB"))
+    expected = np.asarray(renderer.frame(renderer.n_frames - 1)[0].convert("RGB"))
+    for color in ([255, 0, 0], [255, 255, 0]):
+        drawn = np.all(expected == color, axis=-1)
+        assert drawn.any()
+        assert np.all(last_frame[drawn] == color)
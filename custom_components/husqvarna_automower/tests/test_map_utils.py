@@ -1,15 +1,23 @@
 """Test for map utils."""
+import json
+import math
 
+import numpy as np
 import pytest
+from geopy.distance import distance
 from shapely.geometry import Point
 
 from ..map_utils import (
     LatLon,
+    MapProjection,
     ValidatePointString,
     ValidateRGB,
+    segment_lengths,
+    validate_frame_rate,
     validate_image,
     validate_rotation,
 )
+from .const import AUTOMER_DM_CONFIG, AUTOMOWER_DM_SESSION_DATA, MWR_ONE_ID
 
 
 @pytest.mark.asyncio
@@ -30,6 +38,24 @@ async def test_validate_rotation():
     assert validate_rotation("180") is True
 
 
+@pytest.mark.asyncio
+async def test_validate_frame_rate():
+    """test validate frame rate"""
+
+    # Not numeric
+    assert validate_frame_rate("fast") is False
+    assert validate_frame_rate(None) is False
+
+    # Outside of bounds
+    assert validate_frame_rate(0) is False
+    assert validate_frame_rate(-1) is False
+    assert validate_frame_rate(11) is False
+
+    # Valid
+    assert validate_frame_rate(0.5) is True
+    assert validate_frame_rate("2") is True
+
+
 @pytest.mark.asyncio
 async def test_validate_image():
     """test validate image"""
@@ -137,3 +163,89 @@ async def test_validate_point_string():
     assert ValidatePointString("35.54028774, -82.5526962").point == Point(
         35.54028774, -82.5526962
     )
+
+
+def geodesic_to_img(projection: MapProjection, lat_lon: tuple) -> tuple:
+    """Reference geodesic projection the map image used to do per point."""
+    center = projection.center_wgs84
+    bearing_res = distance(center, lat_lon).geod.Inverse(
+        center[0], center[1], lat_lon[0], lat_lon[1]
+    )
+    c_plt_pnt_m = bearing_res.get("s12") * 1000
+    c_bearing = math.radians(bearing_res.get("azi1") - 90 + projection.rotation)
+    return (
+        projection.center_px[0]
+        + (c_plt_pnt_m * projection.px_meter * math.cos(c_bearing)),
+        projection.center_px[1]
+        + (c_plt_pnt_m * projection.px_meter * math.sin(c_bearing)),
+    )
+
+
+@pytest.mark.asyncio
+async def test_map_projection():
+    """test MapProjection against the geodesic solution"""
+    options = AUTOMER_DM_CONFIG[MWR_ONE_ID]
+    top_left = options["gps_top_left"]
+    bottom_right = options["gps_bottom_right"]
+    center = (
+        (top_left[0] + bottom_right[0]) / 2,
+        (top_left[1] + bottom_right[1]) / 2,
+    )
+
+    positions = []
+    for mower in AUTOMOWER_DM_SESSION_DATA["data"]:
+        positions.extend(mower["attributes"]["positions"])
+    lat_lon = MapProjection.positions_to_array(positions)
+    assert lat_lon.shape == (len(positions), 2)
+
+    zones = json.loads(AUTOMER_DM_CONFIG["configured_zones"])
+    zone_points = [pnt for zone in zones.values() for pnt in zone["zone_coordinates"]]
+    lat_lon = np.vstack([lat_lon, zone_points, [top_left, bottom_right]])
+
+    for rotation in (0, options["map_img_rotation"], 90, -270):
+        projection = MapProjection(center, (1024, 498), 3.58, rotation)
+        pixels = projection.project(lat_lon)
+        assert pixels.shape == lat_lon.shape
+        assert pixels.dtype.kind == "i"
+
+        expected = np.array([geodesic_to_img(projection, pnt) for pnt in lat_lon])
+        # At most one pixel off the truncated geodesic result
+        assert np.abs(pixels - np.trunc(expected)).max() <= 1
+
+        assert projection.project_point(tuple(lat_lon[0])) == tuple(pixels[0].tolist())
+
+    # Center of the map lands on the center pixel
+    assert MapProjection(center, (1024, 498), 3.58).project_point(center) == (
+        1024,
+        498,
+    )
+
+    # Scaled and cropped projections land on the same spot of the smaller image
+    scaled = MapProjection(center, (1024, 498), 3.58).scaled(0.5, (100, 50))
+    assert scaled.px_meter == 3.58 / 2
+    assert scaled.project_point(center) == (412, 199)
+
+    # Projection of a map image from its corners
+    projection = MapProjection.from_corners(top_left, bottom_right, (2048, 996))
+    assert projection.center_px == (1024, 498)
+    assert projection.project_point(center) == (1024, 498)
+    # The corners are as far apart as the diagonal of the image
+    corners_px = projection.project([top_left, bottom_right])
+    assert abs(math.dist(*corners_px) - math.dist((0, 0), (2048, 996))) <= 2
+
+
+@pytest.mark.asyncio
+async def test_segment_lengths():
+    """test segment lengths against the geodesic distance"""
+    positions = []
+    for mower in AUTOMOWER_DM_SESSION_DATA["data"]:
+        positions.extend(mower["attributes"]["positions"])
+    lat_lon = MapProjection.positions_to_array(positions)
+    lengths = segment_lengths(lat_lon)
+    assert lengths.shape == (len(lat_lon) - 1,)
+    expected = [
+        distance(tuple(start), tuple(end)).meters
+        for start, end in zip(lat_lon[:-1], lat_lon[1:])
+    ]
+    assert np.allclose(lengths, expected, rtol=1e-3, atol=1e-3)
+    assert segment_lengths(lat_lon[:1]).shape == (0,)
@@ -0,0 +1,111 @@
+"""Tests for position store module."""
+
+import os
+import threading
+
+import numpy as np
+import pytest
+
+from ..position_store import HEADER_DTYPE, POSITION_DTYPE, PositionStore
+from .const import AUTOMOWER_DM_SESSION_DATA, MWR_ONE_IDX
+
+POSITIONS = AUTOMOWER_DM_SESSION_DATA["data"][MWR_ONE_IDX]["attributes"]["positions"]
+
+
+@pytest.mark.asyncio
+async def test_position_store_append(tmp_path):
+    """test only new positions are stored and the file size is fixed"""
+    path = os.path.join(tmp_path, "positions", "mower.bin")
+    store = PositionStore(path, 1000)
+    assert len(store) == 0
+    assert (
+        os.path.getsize(path) == HEADER_DTYPE.itemsize + 1000 * POSITION_DTYPE.itemsize
+    )
+
+    # Positions are prepended by the API, every message repeats the older ones
+    assert store.append(POSITIONS[3:], recorded=10.0) == len(POSITIONS) - 3
+    assert store.append(POSITIONS[1:], recorded=20.0) == 2
+    assert store.append(POSITIONS[1:], recorded=30.0) == 0
+    assert store.append(POSITIONS, recorded=40.0) == 1
+    assert store.append([], recorded=50.0) == 0
+
+    assert len(store) == len(POSITIONS)
+    assert store.positions() == [
+        {"latitude": pos["latitude"], "longitude": pos["longitude"]}
+        for pos in POSITIONS
+    ]
+    assert store.to_array()["recorded"][-4:].tolist() == [10.0, 20.0, 20.0, 40.0]
+    # Selected by the time they were received
+    assert store.positions(start=20.0, end=30.0) == store.positions()[1:3]
+    assert store.positions(start=40.0) == store.positions()[:1]
+    assert len(store.positions(end=10.0)) == len(POSITIONS) - 3
+
+    # Reopened from disk
+    store.close()
+    store = PositionStore(path, 1000)
+    assert len(store) == len(POSITIONS)
+    assert store.append(POSITIONS) == 0
+    store.close()
+
+
+@pytest.mark.asyncio
+async def test_position_store_ring(tmp_path):
+    """test the oldest positions are overwritten once the store is full"""
+    path = os.path.join(tmp_path, "mower.bin")
+    positions = [
+        {"latitude": float(idx), "longitude": -float(idx)} for idx in range(32)
+    ]
+
+    # Newest first
+    store = PositionStore(path, 10)
+    assert store.append(positions[26:3:-1]) == 23
+    assert len(store) == 10
+    assert store.to_array()["latitude"].tolist() == list(range(17, 27))
+
+    # Wraps around the end of the file
+    assert store.append(positions[31:3:-1]) == 5
+    assert store.to_array()["latitude"].tolist() == list(range(22, 32))
+    assert store.positions()[0] == {"latitude": 31.0, "longitude": -31.0}
+    store.close()
+
+    # A new retention keeps the newest positions
+    store = PositionStore(path, 4)
+    assert store.capacity == 4
+    assert store.to_array()["latitude"].tolist() == [28.0, 29.0, 30.0, 31.0]
+    store.close()
+    store = PositionStore(path, 6)
+    assert store.to_array()["latitude"].tolist() == [28.0, 29.0, 30.0, 31.0]
+    assert os.path.getsize(path) == HEADER_DTYPE.itemsize + 6 * POSITION_DTYPE.itemsize
+    store.close()
+
+    # Files that aren't a store are replaced
+    with open(path, "wb") as store_file:
+        store_file.write(b"not a store")
+    store = PositionStore(path, 6)
+    assert len(store) == 0
+    assert np.array_equal(store.to_array(), np.empty(0, dtype=POSITION_DTYPE))
+    store.close()
+
+
+@pytest.mark.asyncio
+async def test_position_store_close_while_reading(tmp_path):
+    """test closing waits for readers and a closed store reads as empty"""
+    store = PositionStore(os.path.join(tmp_path, "mower.bin"), 1000)
+    store.append(POSITIONS)
+
+    # A reader in the executor holds the store
+    store._lock.acquire()
+    closer = threading.Thread(target=store.close)
+    closer.start()
+    closer.join(0.1)
+    assert closer.is_alive()
+    assert len(store.to_array()) == len(POSITIONS)
+    store._lock.release()
+    closer.join()
+
+    assert len(store) == 0
+    assert len(store.to_array()) == 0
+    assert store.positions() == []
+    assert store.append(POSITIONS) == 0
+    store.flush()
+    store.close()
@@ -1,14 +1,33 @@
 """Tests for sensor module."""
+import json
 from copy import deepcopy
+from datetime import timedelta
 from unittest.mock import AsyncMock, MagicMock, patch
 
 import pytest
 from aioautomower import AutomowerSession
 from homeassistant.config_entries import ConfigEntryState
 from homeassistant.core import HomeAssistant
-from pytest_homeassistant_custom_component.common import MockConfigEntry
+from homeassistant.util import dt as dt_util
+from pytest_homeassistant_custom_component.common import (
+    MockConfigEntry,
+    async_capture_events,
+    async_fire_time_changed,
+)
 
-from ..const import DOMAIN, NO_SUPPORT_FOR_CHANGING_CUTTING_HEIGHT, ZONE_ID
+from ..const import (
+    CONF_ZONES,
+    DOMAIN,
+    EVENT_ZONE_ENTERED,
+    EVENT_ZONE_LEFT,
+    GPS_TOP_LEFT,
+    NO_SUPPORT_FOR_CHANGING_CUTTING_HEIGHT,
+    ZONE_HYSTERESIS,
+    ZONE_ID,
+    ZONE_LOOKUP,
+    ZONE_LOOKUP_POLYGON,
+    ZONE_LOOKUP_RASTER,
+)
 from ..sensor import SENSOR_TYPES, AutomowerZoneSensor, get_problem
 from .const import (
     AUTOMER_DM_CONFIG,
@@ -22,6 +41,19 @@ from .const import (
 )
 
 
+def current_zone(zone_sensor: AutomowerZoneSensor) -> str:
+    """Find the zone like an update of the mower does, return the state"""
+    zone_sensor._find_current_zone()
+    return zone_sensor.native_value
+
+
+async def built_zone_mask(zone_sensor: AutomowerZoneSensor):
+    """Wait for the zone mask being built, return it"""
+    if zone_sensor._mask_task is not None:
+        await zone_sensor._mask_task
+    return zone_sensor._zone_mask
+
+
 @pytest.mark.asyncio
 async def setup_zone_sensor(
     hass: HomeAssistant, zone_overide: str = None, enable_cut: bool = True
@@ -89,7 +121,7 @@ async def test_zone_sensor(hass: HomeAssistant):
     coordinator.session.data["data"][MWR_ONE_IDX]["attributes"]["mower"][
         "activity"
     ] = "PARKED_IN_CS"
-    assert zone_sensor.native_value == "Home"
+    assert current_zone(zone_sensor) == "Home"
     assert zone_sensor.extra_state_attributes == {ZONE_ID: "home"}
 
     # Mower is in front garden
@@ -100,14 +132,14 @@ async def test_zone_sensor(hass: HomeAssistant):
     coordinator.session.data["data"][MWR_ONE_IDX]["attributes"]["positions"][0][
         "longitude"
     ] = FRONT_GARDEN_PNT[1]
-    assert zone_sensor.native_value == "Home"
+    assert current_zone(zone_sensor) == "Home"
     assert zone_sensor.extra_state_attributes == {ZONE_ID: "home"}
 
     # Mower state is mowing
     coordinator.session.data["data"][MWR_ONE_IDX]["attributes"]["mower"][
         "activity"
     ] = "MOWING"
-    assert zone_sensor.native_value == "Front Garden"
+    assert current_zone(zone_sensor) == "Front Garden"
     assert zone_sensor.extra_state_attributes == {ZONE_ID: "front_garden"}
 
     # Mower is mowing but not in a zone
@@ -117,9 +149,240 @@ async def test_zone_sensor(hass: HomeAssistant):
     coordinator.session.data["data"][MWR_ONE_IDX]["attributes"]["positions"][0][
         "longitude"
     ] = NO_ZONE_PNT[1]
-    assert zone_sensor.native_value == "Unknown"
+    assert current_zone(zone_sensor) == "Unknown"
     assert zone_sensor.extra_state_attributes == {ZONE_ID: "unknown"}
 
+    # Zones are compiled again only when they change
+    coordinator.session.data["data"][MWR_ONE_IDX]["attributes"]["positions"][0][
+        "latitude"
+    ] = FRONT_GARDEN_PNT[0]
+    coordinator.session.data["data"][MWR_ONE_IDX]["attributes"]["positions"][0][
+        "longitude"
+    ] = FRONT_GARDEN_PNT[1]
+    zone_index = zone_sensor._zone_index
+    assert current_zone(zone_sensor) == "Front Garden"
+    assert zone_sensor._zone_index is zone_index
+
+    zones = deepcopy(DEFAULT_ZONES)
+    zones.pop("front_garden")
+    hass.config_entries.async_update_entry(
+        config_entry, options={**config_entry.options, CONF_ZONES: json.dumps(zones)}
+    )
+    await hass.async_block_till_done()
+    assert current_zone(zone_sensor) == "Unknown"
+    assert zone_sensor._zone_index is not zone_index
+    assert "front_garden" not in zone_sensor.zones
+
+    # Zones are only evaluated again once the mower moved
+    evaluations = zone_sensor.zone_stats["evaluations"]
+    assert current_zone(zone_sensor) == "Unknown"
+    assert zone_sensor.zone_stats["evaluations"] == evaluations
+    assert zone_sensor.zone_stats["evaluations_skipped"] == 1
+    coordinator.session.data["data"][MWR_ONE_IDX]["attributes"]["positions"][0][
+        "latitude"
+    ] = NO_ZONE_PNT[0]
+    assert current_zone(zone_sensor) == "Unknown"
+    assert zone_sensor.zone_stats["evaluations"] == evaluations + 1
+    coordinator.session.data["data"][MWR_ONE_IDX]["attributes"]["mower"][
+        "activity"
+    ] = "PARKED_IN_CS"
+    assert current_zone(zone_sensor) == "Home"
+    assert zone_sensor.zone_stats["evaluations"] == evaluations + 2
+    assert zone_sensor.zone_stats["evaluations_skipped"] == 1
+
+
+@pytest.mark.asyncio
+async def test_zone_sensor_raster(hass: HomeAssistant):
+    """test zone lookups through the raster mask"""
+    config_entry = await setup_zone_sensor(hass)
+    options = deepcopy(dict(config_entry.options))
+    options[MWR_ONE_ID][ZONE_LOOKUP] = ZONE_LOOKUP_RASTER
+    hass.config_entries.async_update_entry(config_entry, options=options)
+    await hass.async_block_till_done()
+    coordinator = hass.data[DOMAIN]["automower_test"]
+    zone_sensor = AutomowerZoneSensor(coordinator, MWR_ONE_IDX, config_entry)
+    zone_sensor.hass = hass
+
+    mower_attributes = coordinator.session.data["data"][MWR_ONE_IDX]["attributes"]
+    mower_attributes["mower"]["activity"] = "MOWING"
+    mower_attributes["positions"][0]["latitude"] = FRONT_GARDEN_PNT[0]
+    mower_attributes["positions"][0]["longitude"] = FRONT_GARDEN_PNT[1]
+
+    # Polygons answer until the mask is built
+    zone_sensor._async_load_zone_mask()
+    mask_task = zone_sensor._mask_task
+    assert current_zone(zone_sensor) == "Front Garden"
+    await mask_task
+    assert zone_sensor._zone_mask is not None
+    assert current_zone(zone_sensor) == "Front Garden"
+    assert zone_sensor.extra_state_attributes == {ZONE_ID: "front_garden"}
+
+    # Changed zones are rasterized again
+    zones = deepcopy(DEFAULT_ZONES)
+    zones.pop("front_garden")
+    hass.config_entries.async_update_entry(
+        config_entry, options={**config_entry.options, CONF_ZONES: json.dumps(zones)}
+    )
+    await hass.async_block_till_done()
+    assert current_zone(zone_sensor) == "Unknown"
+    assert zone_sensor._zone_mask is None
+    await zone_sensor._mask_task
+    assert "front_garden" not in zone_sensor._zone_mask.zone_ids
+    assert current_zone(zone_sensor) == "Unknown"
+
+    # A moved map drops the mask and rasterizes for the new corners
+    await zone_sensor.async_added_to_hass()
+    zone_mask = await built_zone_mask(zone_sensor)
+    assert zone_mask is not None
+    options = deepcopy(dict(config_entry.options))
+    options[MWR_ONE_ID][GPS_TOP_LEFT] = [35.5412, -82.5528]
+    hass.config_entries.async_update_entry(config_entry, options=options)
+    await hass.async_block_till_done()
+    assert zone_sensor._mask_options[GPS_TOP_LEFT] == [35.5412, -82.5528]
+    assert await built_zone_mask(zone_sensor) not in (None, zone_mask)
+
+    # Other options keep the mask
+    zone_mask = zone_sensor._zone_mask
+    options = deepcopy(dict(config_entry.options))
+    options[MWR_ONE_ID][ZONE_HYSTERESIS] = 3
+    hass.config_entries.async_update_entry(config_entry, options=options)
+    await hass.async_block_till_done()
+    assert zone_sensor._zone_mask is zone_mask
+
+    # Polygon lookups drop the mask, raster lookups build it again
+    options = deepcopy(dict(config_entry.options))
+    options[MWR_ONE_ID][ZONE_LOOKUP] = ZONE_LOOKUP_POLYGON
+    hass.config_entries.async_update_entry(config_entry, options=options)
+    await hass.async_block_till_done()
+    assert zone_sensor._zone_mask is None
+    assert zone_sensor._mask_task is None
+    options = deepcopy(dict(config_entry.options))
+    options[MWR_ONE_ID][ZONE_LOOKUP] = ZONE_LOOKUP_RASTER
+    hass.config_entries.async_update_entry(config_entry, options=options)
+    await hass.async_block_till_done()
+    assert await built_zone_mask(zone_sensor) is not None
+
+
+@pytest.mark.asyncio
+async def test_zone_sensor_events(hass: HomeAssistant, hass_storage):
+    """test zone entered and left events and stored dwell times"""
+    config_entry = await setup_zone_sensor(hass)
+    coordinator = hass.data[DOMAIN]["automower_test"]
+    entered = async_capture_events(hass, EVENT_ZONE_ENTERED)
+    left = async_capture_events(hass, EVENT_ZONE_LEFT)
+    zone_sensor = AutomowerZoneSensor(coordinator, MWR_ONE_IDX, config_entry)
+    zone_sensor.hass = hass
+    await zone_sensor.async_added_to_hass()
+    # Lookup counters are reported in diagnostics
+    assert (
+        coordinator.sensor_platform_stats["zone_stats"][zone_sensor.unique_id]
+        is zone_sensor.zone_stats
+    )
+
+    mower_attributes = coordinator.session.data["data"][MWR_ONE_IDX]["attributes"]
+    mower_attributes["mower"]["activity"] = "MOWING"
+
+    async def move_to(point, offset=0.0):
+        mower_attributes["positions"][0]["latitude"] = point[0] + offset
+        mower_attributes["positions"][0]["longitude"] = point[1]
+        zone = current_zone(zone_sensor)
+        await hass.async_block_till_done()
+        return zone
+
+    # The zone is only entered after two positions in it
+    assert await move_to(FRONT_GARDEN_PNT) == "Front Garden"
+    assert entered == []
+    await move_to(FRONT_GARDEN_PNT, 1e-6)
+    assert len(entered) == 1
+    assert entered[0].data["zone_id"] == "front_garden"
+    assert entered[0].data["name"] == "Front Garden"
+    assert entered[0].data["mower_id"] == MWR_ONE_ID
+
+    # A single position outside doesn't leave it
+    await move_to(NO_ZONE_PNT)
+    await move_to(FRONT_GARDEN_PNT)
+    assert left == []
+    await move_to(NO_ZONE_PNT)
+    await move_to(NO_ZONE_PNT, 1e-6)
+    assert len(left) == 1
+    assert left[0].data["zone_id"] == "front_garden"
+    assert left[0].data["dwell_time"] > 0
+    assert left[0].data["total_dwell_time"] == left[0].data["dwell_time"]
+
+    # Dwell times are stored and restored
+    async_fire_time_changed(hass, dt_util.utcnow() + timedelta(seconds=61))
+    await hass.async_block_till_done()
+    stored = hass_storage[f"{DOMAIN}_zone_dwell.{MWR_ONE_ID}"]["data"]
+    assert stored["dwell"] == zone_sensor._zone_tracker.dwell
+    restored_sensor = AutomowerZoneSensor(coordinator, MWR_ONE_IDX, config_entry)
+    restored_sensor.hass = hass
+    await restored_sensor.async_added_to_hass()
+    assert restored_sensor._zone_tracker.dwell == zone_sensor._zone_tracker.dwell
+
+    # All positions of a message are classified, two in the zone enter it
+    mower_attributes["positions"][0:0] = [
+        {"latitude": FRONT_GARDEN_PNT[0] + 2e-6, "longitude": FRONT_GARDEN_PNT[1]},
+        {"latitude": FRONT_GARDEN_PNT[0] + 3e-6, "longitude": FRONT_GARDEN_PNT[1]},
+    ]
+    with patch(
+        "custom_components.husqvarna_automower.sensor.time.time",
+        return_value=zone_sensor._last_received + 30,
+    ):
+        assert current_zone(zone_sensor) == "Front Garden"
+    await hass.async_block_till_done()
+    assert len(entered) == 2
+
+    # Received together, the positions share the time since the last update
+    mower_attributes["positions"][0:0] = [
+        {"latitude": FRONT_GARDEN_PNT[0] + 4e-6, "longitude": FRONT_GARDEN_PNT[1]},
+        {"latitude": FRONT_GARDEN_PNT[0] + 5e-6, "longitude": FRONT_GARDEN_PNT[1]},
+    ]
+    with patch(
+        "custom_components.husqvarna_automower.sensor.time.time",
+        return_value=zone_sensor._last_received + 60,
+    ):
+        current_zone(zone_sensor)
+    assert zone_sensor._zone_tracker.visit_dwell == pytest.approx(60)
+
+    # Reading the state doesn't follow the mower
+    mower_attributes["positions"][0:0] = [
+        {"latitude": NO_ZONE_PNT[0], "longitude": NO_ZONE_PNT[1]},
+        {"latitude": NO_ZONE_PNT[0] + 1e-6, "longitude": NO_ZONE_PNT[1]},
+    ]
+    evaluations = zone_sensor.zone_stats["evaluations"]
+    for _ in range(3):
+        assert zone_sensor.native_value == "Front Garden"
+    await hass.async_block_till_done()
+    assert len(left) == 1
+    assert zone_sensor.zone_stats["evaluations"] == evaluations
+
+
+@pytest.mark.asyncio
+async def test_zone_sensor_options(hass: HomeAssistant):
+    """test changed options are applied without a reload"""
+    config_entry = await setup_zone_sensor(hass)
+    coordinator = hass.data[DOMAIN]["automower_test"]
+    entered = async_capture_events(hass, EVENT_ZONE_ENTERED)
+    zone_sensor = AutomowerZoneSensor(coordinator, MWR_ONE_IDX, config_entry)
+    zone_sensor.hass = hass
+    await zone_sensor.async_added_to_hass()
+    assert zone_sensor._zone_tracker.hysteresis == 2
+
+    options = deepcopy(dict(config_entry.options))
+    options[MWR_ONE_ID][ZONE_HYSTERESIS] = 1
+    hass.config_entries.async_update_entry(config_entry, options=options)
+    await hass.async_block_till_done()
+    assert zone_sensor._zone_tracker.hysteresis == 1
+
+    # A single position in the zone enters it now
+    mower_attributes = coordinator.session.data["data"][MWR_ONE_IDX]["attributes"]
+    mower_attributes["mower"]["activity"] = "MOWING"
+    mower_attributes["positions"][0]["latitude"] = FRONT_GARDEN_PNT[0]
+    mower_attributes["positions"][0]["longitude"] = FRONT_GARDEN_PNT[1]
+    assert current_zone(zone_sensor) == "Front Garden"
+    await hass.async_block_till_done()
+    assert len(entered) == 1
+
 
 @pytest.mark.asyncio
 async def test_zone_sensor_bad_json(hass: HomeAssistant):
@@ -0,0 +1,214 @@
+"""Tests for zones module."""
+
+import json
+from copy import deepcopy
+
+import numpy as np
+import pytest
+from homeassistant.core import HomeAssistant
+from pytest_homeassistant_custom_component.common import MockConfigEntry
+
+from ..const import CONF_ZONES, DOMAIN, ZONE_COORD
+from ..map_utils import MapProjection
+from ..zones import (
+    ZONE_ENTERED,
+    ZONE_LEFT,
+    ZoneIndex,
+    ZoneMask,
+    ZoneRegistry,
+    ZoneTracker,
+    zone_statistics,
+)
+from .const import (
+    AUTOMER_DM_CONFIG,
+    DEFAULT_ZONES,
+    FRONT_GARDEN_PNT,
+    MWR_ONE_ID,
+    MWR_TWO_ID,
+    NO_ZONE_PNT,
+)
+
+
+@pytest.mark.asyncio
+async def test_zone_index():
+    """test points are matched to the first configured zone containing them"""
+    zone_index = ZoneIndex(DEFAULT_ZONES)
+    assert zone_index.find(*FRONT_GARDEN_PNT) == "front_garden"
+    assert zone_index.find(*NO_ZONE_PNT) is None
+
+    # Overlapping zones, the first one wins
+    zones = {
+        "outer": {ZONE_COORD: [[0, 0], [0, 10], [10, 10], [10, 0]]},
+        "inner": {ZONE_COORD: [[2, 2], [2, 4], [4, 4], [4, 2]]},
+    }
+    assert ZoneIndex(zones).find(3, 3) == "outer"
+    assert ZoneIndex(dict(reversed(zones.items()))).find(3, 3) == "inner"
+    assert ZoneIndex(zones).find(5, 5) == "outer"
+    # The boundary isn't inside
+    assert ZoneIndex(zones).find(0, 5) is None
+
+    assert ZoneIndex({}).find(*FRONT_GARDEN_PNT) is None
+
+
+@pytest.mark.asyncio
+async def test_zone_mask():
+    """test the raster mask agrees with the polygons"""
+    options = AUTOMER_DM_CONFIG[MWR_ONE_ID]
+    projection = MapProjection.from_corners(
+        options["gps_top_left"],
+        options["gps_bottom_right"],
+        (2048, 996),
+        options["map_img_rotation"],
+    )
+    zone_mask = ZoneMask(DEFAULT_ZONES, projection, (2048, 996))
+    assert zone_mask.mask.shape == (996, 2048)
+    assert zone_mask.find(*FRONT_GARDEN_PNT) == "front_garden"
+    assert zone_mask.find(*NO_ZONE_PNT) is None
+    # Off the map
+    assert zone_mask.find(0, 0) is None
+
+    # Large maps are scaled down
+    small_mask = ZoneMask.for_map(DEFAULT_ZONES, projection, (2048, 996), 1024)
+    assert small_mask.mask.shape == (498, 1024)
+    assert small_mask.find(*FRONT_GARDEN_PNT) == "front_garden"
+    assert small_mask.find(*NO_ZONE_PNT) is None
+
+    # Overlapping zones, the first one wins
+    zones = {
+        "outer": {ZONE_COORD: [[0, 0], [0, 10], [10, 10], [10, 0]]},
+        "inner": {ZONE_COORD: [[2, 2], [2, 4], [4, 4], [4, 2]]},
+    }
+    projection = MapProjection((5, 5), (50, 50), 1 / 11132)
+    assert ZoneMask(zones, projection, (100, 100)).find(3, 3) == "outer"
+    assert (
+        ZoneMask(dict(reversed(zones.items())), projection, (100, 100)).find(3, 3)
+        == "inner"
+    )
+    assert ZoneMask({}, projection, (100, 100)).find(3, 3) is None
+
+
+@pytest.mark.asyncio
+async def test_zone_registry(hass: HomeAssistant):
+    """test zones are compiled once per change and listeners notified"""
+    config_entry = MockConfigEntry(
+        domain=DOMAIN, options=deepcopy(AUTOMER_DM_CONFIG), entry_id="automower_test"
+    )
+    config_entry.add_to_hass(hass)
+    zone_registry = ZoneRegistry(config_entry)
+    assert zone_registry.zones == DEFAULT_ZONES
+    assert list(zone_registry.zones_for(MWR_TWO_ID)) == ["front_garden"]
+
+    zone_index = zone_registry.index_for(MWR_ONE_ID)
+    assert zone_index.find(*FRONT_GARDEN_PNT) == "front_garden"
+    assert zone_registry.index_for(MWR_ONE_ID) is zone_index
+    # Mowers share the compiled polygons
+    assert zone_registry.index_for(MWR_TWO_ID).polygons[0] is zone_index.polygons[0]
+
+    changes = []
+    remove_listener = zone_registry.add_listener(lambda: changes.append(True))
+    assert zone_registry.refresh() is False
+    assert changes == []
+
+    # Invalid zones are left out
+    zones = deepcopy(DEFAULT_ZONES)
+    zones["front_garden"][ZONE_COORD] = zones["front_garden"][ZONE_COORD][:2]
+    hass.config_entries.async_update_entry(
+        config_entry, options={**config_entry.options, CONF_ZONES: json.dumps(zones)}
+    )
+    # Reads don't compile or notify, refreshing does
+    assert zone_registry.index_for(MWR_ONE_ID) is zone_index
+    assert changes == []
+    assert zone_registry.refresh() is True
+    assert zone_registry.index_for(MWR_ONE_ID) is not zone_index
+    assert "front_garden" not in zone_registry.zones
+    assert changes == [True]
+
+    remove_listener()
+    hass.config_entries.async_update_entry(
+        config_entry, options={**config_entry.options, CONF_ZONES: "[]"}
+    )
+    zone_registry.refresh()
+    assert zone_registry.zones == {}
+    assert changes == [True]
+    assert ZoneRegistry.parse("not json") == {}
+
+
+@pytest.mark.asyncio
+async def test_zone_tracker():
+    """test zone transitions with hysteresis and dwell times"""
+    zone_tracker = ZoneTracker(2)
+    assert zone_tracker.update("front", 0) == []
+    assert zone_tracker.update("front", 10) == [(ZONE_ENTERED, "front", 0.0)]
+
+    # Jitter across the boundary doesn't leave the zone
+    assert zone_tracker.update(None, 20) == []
+    assert zone_tracker.update("front", 30) == []
+    assert zone_tracker.update(None, 40) == []
+    assert zone_tracker.update("back", 50) == []
+    assert zone_tracker.update("back", 60) == [
+        (ZONE_LEFT, "front", 50.0),
+        (ZONE_ENTERED, "back", 0.0),
+    ]
+    assert zone_tracker.update(None, 65) == []
+    assert zone_tracker.update(None, 70) == [(ZONE_LEFT, "back", 10.0)]
+    assert zone_tracker.dwell == {"front": 50.0, "back": 10.0}
+
+    # Time passed while not running isn't counted
+    restored = ZoneTracker(1)
+    restored.restore({**zone_tracker.as_dict(), "zone_id": "back"})
+    assert restored.update("back", 1000) == []
+    assert restored.update("back", 1005) == []
+    assert restored.update("front", 1010) == [
+        (ZONE_LEFT, "back", 10.0),
+        (ZONE_ENTERED, "front", 0.0),
+    ]
+    assert restored.dwell == {"front": 50.0, "back": 20.0}
+
+
+@pytest.mark.asyncio
+async def test_find_many():
+    """test batch lookups agree with single lookups"""
+    zones = {
+        "outer": {ZONE_COORD: [[0, 0], [0, 10], [10, 10], [10, 0]]},
+        "inner": {ZONE_COORD: [[2, 2], [2, 4], [4, 4], [4, 2]]},
+        "apart": {ZONE_COORD: [[20, 20], [20, 25], [25, 25], [25, 20]]},
+    }
+    lat_lon = np.array([[3, 3], [5, 5], [22, 22], [15, 15], [0, 5], [-30, 40]])
+    zone_index = ZoneIndex(zones)
+    labels = zone_index.find_many(lat_lon)
+    assert labels.tolist() == [0, 0, 2, -1, -1, -1]
+    assert [zone_index.zone_ids[label] if label >= 0 else None for label in labels] == [
+        zone_index.find(*pnt) for pnt in lat_lon
+    ]
+    assert ZoneIndex(dict(reversed(zones.items()))).find_many(lat_lon)[0] == 1
+    assert ZoneIndex({}).find_many(lat_lon).tolist() == [-1] * 6
+    assert zone_index.find_many(np.empty((0, 2))).tolist() == []
+
+    projection = MapProjection((10, 10), (150, 150), 1 / 11132)
+    zone_mask = ZoneMask(zones, projection, (300, 300))
+    assert zone_mask.find_many(lat_lon[:4]).tolist() == [0, 0, 2, -1]
+    # Off the mask
+    assert zone_mask.find_many(lat_lon[5:]).tolist() == [-1]
+
+
+@pytest.mark.asyncio
+async def test_zone_statistics():
+    """test positions, distance and time per zone of a history"""
+    # One meter steps north along a meridian
+    lat_lon = np.column_stack((np.arange(6) / 111_000, np.zeros(6)))
+    labels = np.array([-1, 0, 0, 1, 1, 1])
+    recorded = np.array([0, 10, 20, 30, 1000, 1010])
+    stats = zone_statistics(["a", "b"], labels, lat_lon, recorded)
+    assert stats["a"]["positions"] == 2
+    assert stats["b"]["positions"] == 3
+    assert stats["a"]["distance"] == pytest.approx(2.0, rel=0.01)
+    assert stats["b"]["distance"] == pytest.approx(3.0, rel=0.01)
+    assert stats["a"]["time"] == 20
+    # The long pause isn't counted
+    assert stats["b"]["time"] == 20
+
+    stats = zone_statistics(["a", "b"], labels, lat_lon)
+    assert stats["a"]["time"] is None
+    assert zone_statistics(["a"], np.empty(0, dtype=int), np.empty((0, 2))) == {
+        "a": {"positions": 0, "distance": 0.0, "time": None}
+    }
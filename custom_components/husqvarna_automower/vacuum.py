@@ -90,6 +90,12 @@ class HusqvarnaAutomowerEntity(StateVacuumEntity, AutomowerEntity):
     _attr_name: str | None = None
     _attr_supported_features = SUPPORT_STATE_SERVICES
     _attr_translation_key = "mower"
+    dependencies = (
+        "mower.state",
+        "mower.activity",
+        "planner.override",
+        "metadata.connected",
+    )
 
     def __init__(self, session, idx):
         """Set up HusqvarnaAutomowerEntity."""
@@ -0,0 +1,356 @@
+"""Spatial lookup of the zones a mower is in."""
+
+import json
+import logging
+from collections.abc import Callable
+from typing import Optional
+
+import numpy as np
+import shapely
+from homeassistant.config_entries import ConfigEntry
+from PIL import Image, ImageDraw
+from shapely.geometry import Polygon
+
+from .const import CONF_ZONES, ZONE_COORD, ZONE_MOWERS
+from .map_utils import MapProjection, segment_lengths
+
+_LOGGER = logging.getLogger(__name__)
+
+ImgDimensions = tuple[int, int]
+
+# Longest side of zone masks used for lookups, larger maps are scaled down
+ZONE_MASK_MAX_SIZE = 4096  # Pixels
+# Longer pauses between positions aren't counted as time spent in a zone
+ZONE_STATS_MAX_GAP = 300  # Seconds
+ZONE_ENTERED = "entered"
+ZONE_LEFT = "left"
+
+
+class ZoneIndex:
+    """Zones compiled once into prepared polygons behind an STRtree.
+
+    Coordinates are (latitude, longitude) as configured. Where zones overlap
+    the first configured zone wins.
+    """
+
+    def __init__(
+        self, zones: dict[str, dict], polygons: Optional[list[Polygon]] = None
+    ) -> None:
+        """Initialize the ZoneIndex Object."""
+        self.zones = zones
+        self.zone_ids = list(zones)
+        if polygons is None:
+            polygons = [Polygon(zone.get(ZONE_COORD)) for zone in zones.values()]
+        self.polygons = np.array(polygons, dtype=object)
+        shapely.prepare(self.polygons)
+        self._tree = shapely.STRtree(self.polygons)
+
+    def find(self, lat: float, lon: float) -> Optional[str]:
+        """Return the id of the zone containing the point, None if outside all."""
+        # Bounding box candidates from the tree, exact test on the prepared polygons
+        candidates = self._tree.query(shapely.points(lat, lon))
+        if not len(candidates):
+            return None
+        candidates = np.sort(candidates)
+        inside = shapely.contains_xy(self.polygons[candidates], lat, lon)
+        if not inside.any():
+            return None
+        return self.zone_ids[candidates[np.argmax(inside)]]
+
+    def find_many(self, lat_lon) -> np.ndarray:
+        """Return the zone index of every (lat, lon) pair, -1 if outside all.
+
+        One tree query finds the candidate zones of all points and one
+        vectorized test checks every candidate pair.
+        """
+        lat_lon = np.asarray(lat_lon, dtype=float).reshape(-1, 2)
+        outside = len(self.zone_ids)
+        labels = np.full(len(lat_lon), outside, dtype=np.intp)
+        if outside and len(lat_lon):
+            point_idx, zone_idx = self._tree.query(
+                shapely.points(lat_lon[:, 0], lat_lon[:, 1])
+            )
+            inside = shapely.contains_xy(
+                self.polygons[zone_idx], lat_lon[point_idx, 0], lat_lon[point_idx, 1]
+            )
+            # The first zone wins where zones overlap
+            np.minimum.at(labels, point_idx[inside], zone_idx[inside])
+        labels[labels == outside] = -1
+        return labels
+
+
+class ZoneMask:
+    """Zones rasterized into a label mask aligned to the map image.
+
+    A pixel holds 0 outside all zones and i + 1 inside the i-th zone, where
+    zones overlap the first configured zone wins. Looking a position up is a
+    projection and a read, whatever the number of zones. Zones with fewer
+    than three coordinates are left out.
+    """
+
+    def __init__(
+        self, zones: dict[str, dict], projection: MapProjection, size: ImgDimensions
+    ) -> None:
+        """Initialize the ZoneMask Object."""
+        self.zones = zones
+        self.zone_ids = list(zones)
+        self.projection = projection
+        self.polygons = [
+            projection.project(zone.get(ZONE_COORD)) for zone in zones.values()
+        ]
+
+        label_mask = Image.new("L" if len(zones) < 256 else "I", tuple(size))
+        label_draw = ImageDraw.Draw(label_mask)
+        # Drawn last to first, so the first zone ends up on top
+        for label in range(len(zones), 0, -1):
+            polygon = self.polygons[label - 1]
+            if len(polygon) >= 3:
+                label_draw.polygon([tuple(pixel) for pixel in polygon.tolist()], label)
+        self.mask = np.asarray(label_mask)
+
+    @classmethod
+    def for_map(
+        cls,
+        zones: dict[str, dict],
+        projection: MapProjection,
+        size: ImgDimensions,
+        max_size: int = ZONE_MASK_MAX_SIZE,
+    ) -> "ZoneMask":
+        """Return the mask of a map, scaled down to max_size if larger."""
+        scale = min(max_size / max(size), 1)
+        if scale < 1:
+            projection = projection.scaled(scale)
+            size = (max(int(size[0] * scale), 1), max(int(size[1] * scale), 1))
+        return cls(zones, projection, size)
+
+    def find(self, lat: float, lon: float) -> Optional[str]:
+        """Return the id of the zone containing the point, None if outside all."""
+        x_px, y_px = self.projection.project_point((lat, lon))
+        if not (0 <= y_px < self.mask.shape[0] and 0 <= x_px < self.mask.shape[1]):
+            return None
+        label = int(self.mask[y_px, x_px])
+        return self.zone_ids[label - 1] if label else None
+
+    def find_many(self, lat_lon) -> np.ndarray:
+        """Return the zone index of every (lat, lon) pair, -1 if outside all."""
+        pixels = self.projection.project(lat_lon)
+        on_mask = (
+            (pixels[:, 0] >= 0)
+            & (pixels[:, 0] < self.mask.shape[1])
+            & (pixels[:, 1] >= 0)
+            & (pixels[:, 1] < self.mask.shape[0])
+        )
+        labels = np.full(len(pixels), -1, dtype=np.intp)
+        labels[on_mask] = (
+            self.mask[pixels[on_mask, 1], pixels[on_mask, 0]].astype(np.intp) - 1
+        )
+        return labels
+
+
+def zone_statistics(
+    zone_ids: list[str],
+    labels: np.ndarray,
+    lat_lon: np.ndarray,
+    recorded: Optional[np.ndarray] = None,
+    max_gap: float = ZONE_STATS_MAX_GAP,
+) -> dict[str, dict]:
+    """Return positions, distance and time per zone of a history, oldest first.
+
+    labels are the zone indexes of the positions as returned by find_many.
+    Every segment counts towards the zone of the position it ends at. Time
+    needs recorded timestamps, pauses longer than max_gap aren't counted.
+    """
+    bins = np.asarray(labels) + 1
+    n_bins = len(zone_ids) + 1
+    positions = np.bincount(bins, minlength=n_bins)
+    distance = np.bincount(bins[1:], segment_lengths(lat_lon), minlength=n_bins)
+    time_spent = None
+    if recorded is not None:
+        gaps = np.diff(np.asarray(recorded, dtype=float))
+        gaps[(gaps < 0) | (gaps > max_gap)] = 0
+        time_spent = np.bincount(bins[1:], gaps, minlength=n_bins)
+
+    return {
+        zone_id: {
+            "positions": int(positions[idx + 1]),
+            "distance": float(distance[idx + 1]),
+            "time": None if time_spent is None else float(time_spent[idx + 1]),
+        }
+        for idx, zone_id in enumerate(zone_ids)
+    }
+
+
+class ZoneRegistry:
+    """Zones of a config entry, parsed and compiled once per change.
+
+    Sensors, images and the options flow of an entry share its registry
+    instead of each parsing the configured zones. The zones are compiled
+    again when refresh is called on an options update, reads have no side
+    effects and may run in the executor.
+    """
+
+    def __init__(self, entry: ConfigEntry) -> None:
+        """Initialize the ZoneRegistry Object."""
+        self.entry = entry
+        self._zones: dict[str, dict] = {}
+        self._polygons: dict[str, Polygon] = {}
+        self._zones_config = None
+        self._indexes: dict[str, ZoneIndex] = {}
+        self._listeners: list[Callable[[], None]] = []
+        self.refresh()
+
+    @staticmethod
+    def parse(zones_config: str) -> dict[str, dict]:
+        """Return the valid zones of the configured zones JSON."""
+        try:
+            zones = json.loads(zones_config)
+        except (TypeError, ValueError) as error:
+            _LOGGER.warning("Unable to parse the configured zones: %s", error)
+            return {}
+        if not isinstance(zones, dict):
+            return {}
+
+        valid_zones = {}
+        for zone_id, zone in zones.items():
+            if isinstance(zone, dict) and len(zone.get(ZONE_COORD) or []) >= 3:
+                valid_zones[zone_id] = zone
+            else:
+                _LOGGER.warning("Zone %s needs at least three coordinates", zone_id)
+        return valid_zones
+
+    def refresh(self) -> bool:
+        """Compile the zones if the entry options changed, return True if so.
+
+        Listeners are called once the changed zones are compiled, so this
+        must run in the event loop.
+        """
+        zones_config = self.entry.options.get(CONF_ZONES, "{}")
+        if zones_config == self._zones_config:
+            return False
+        self._zones_config = zones_config
+        self._zones = self.parse(zones_config)
+        polygons = [Polygon(zone[ZONE_COORD]) for zone in self._zones.values()]
+        shapely.prepare(polygons)
+        self._polygons = dict(zip(self._zones, polygons))
+        self._indexes = {}
+
+        for listener in list(self._listeners):
+            listener()
+        return True
+
+    @property
+    def zones(self) -> dict[str, dict]:
+        """Return all valid zones, which must be treated as read-only."""
+        return self._zones
+
+    def zones_for(self, mower_id: str) -> dict[str, dict]:
+        """Return the zones selected for a mower."""
+        return {
+            zone_id: zone
+            for zone_id, zone in self.zones.items()
+            if mower_id in zone.get(ZONE_MOWERS, [])
+        }
+
+    def index_for(self, mower_id: str) -> ZoneIndex:
+        """Return the index of the zones of a mower, built once per change."""
+        zone_index = self._indexes.get(mower_id)
+        if zone_index is None:
+            zones = self.zones_for(mower_id)
+            zone_index = ZoneIndex(
+                zones, [self._polygons[zone_id] for zone_id in zones]
+            )
+            self._indexes[mower_id] = zone_index
+        return zone_index
+
+    def add_listener(self, listener: Callable[[], None]) -> Callable[[], None]:
+        """Call listener when the zones change, return a function removing it."""
+        self._listeners.append(listener)
+
+        def remove_listener() -> None:
+            self._listeners.remove(listener)
+
+        return remove_listener
+
+
+class ZoneTracker:
+    """Zone a mower is in, following its positions with hysteresis.
+
+    A different zone, or leaving all zones, is only taken over once
+    hysteresis consecutive positions agree on it, so jitter on a boundary
+    doesn't flap between zones. Time spent in each zone is accumulated
+    between the positions received while in it.
+    """
+
+    def __init__(self, hysteresis: int = 1) -> None:
+        """Initialize the ZoneTracker Object."""
+        self.hysteresis = hysteresis
+        self.zone_id: Optional[str] = None
+        self.visit_dwell = 0.0
+        self.dwell: dict[str, float] = {}
+        self._candidate = None
+        self._candidate_count = 0
+        self._last_timestamp = None
+
+    @property
+    def hysteresis(self) -> int:
+        """Return the positions needed to take over a different zone."""
+        return self._hysteresis
+
+    @hysteresis.setter
+    def hysteresis(self, hysteresis: int) -> None:
+        """Set the positions needed to take over a different zone."""
+        self._hysteresis = max(hysteresis, 1)
+
+    def update(
+        self, zone_id: Optional[str], timestamp: float
+    ) -> list[tuple[str, str, float]]:
+        """Take the zone of a new position, return the transitions it caused.
+
+        Transitions are (ZONE_LEFT or ZONE_ENTERED, zone id, seconds spent
+        in the zone during the visit).
+        """
+        if self.zone_id is not None and self._last_timestamp is not None:
+            elapsed = max(timestamp - self._last_timestamp, 0)
+            self.visit_dwell += elapsed
+            self.dwell[self.zone_id] = self.dwell.get(self.zone_id, 0.0) + elapsed
+        self._last_timestamp = timestamp
+
+        if zone_id == self.zone_id:
+            self._candidate_count = 0
+            return []
+        if self._candidate_count and zone_id == self._candidate:
+            self._candidate_count += 1
+        else:
+            self._candidate = zone_id
+            self._candidate_count = 1
+        if self._candidate_count < self.hysteresis:
+            return []
+
+        transitions = []
+        if self.zone_id is not None:
+            transitions.append((ZONE_LEFT, self.zone_id, self.visit_dwell))
+        self.zone_id = zone_id
+        self.visit_dwell = 0.0
+        self._candidate_count = 0
+        if zone_id is not None:
+            transitions.append((ZONE_ENTERED, zone_id, 0.0))
+        return transitions
+
+    def as_dict(self) -> dict:
+        """Return the state kept across restarts."""
+        return {
+            "zone_id": self.zone_id,
+            "visit_dwell": self.visit_dwell,
+            "dwell": self.dwell,
+        }
+
+    def restore(self, data: dict) -> None:
+        """Continue from a state returned by as_dict.
+
+        Time passed while not running isn't counted.
+        """
+        self.zone_id = data.get("zone_id")
+        self.visit_dwell = data.get("visit_dwell", 0.0)
+        self.dwell = dict(data.get("dwell", {}))
+        self._candidate_count = 0
+        self._last_timestamp = None